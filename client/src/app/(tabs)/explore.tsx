@@ -28,6 +28,13 @@ const { width, height } = Dimensions.get('window');
 // Set API URL to your local server
 const API_URL = 'http://10.0.2.2:5000';
 
+// Recommendations are computed in a background job, its status is polled until the feed is ready
+const RECOMMENDATION_JOB_POLL_INTERVAL_MS = 1000;
+const RECOMMENDATION_JOB_POLL_TIMEOUT_MS = 60000; // allows for model loading time
+// Detailed profiles are loaded a page at a time, the next page once this many cards are left
+const RECOMMENDATION_PAGE_SIZE = 10;
+const RECOMMENDATION_PREFETCH_REMAINING = 3;
+
 // Configure axios retry functionality for all axios instances
 axiosRetry(axios, {
   retries: 3,
@@ -117,6 +124,76 @@ interface SwipeResponse {
   total_limit: number;
 }
 
+// Map one row of /api/recommended_users/me to the card shown in the swiper
+const transformRecommendation = (
+  rec: RecommendationResponse,
+  profileMap: Map<number, number>
+): TransformedProfile | null => {
+  // Get profile ID from either field name (handle API inconsistency)
+  const profileId = rec.recommended_user_profile_id || rec.recommended_user_profile_user_id;
+
+  console.log('Processing profile with ID:', profileId);
+
+  if (!profileId) {
+    console.error('Missing profile ID in recommendation:', rec);
+    // Instead of throwing error, log and skip this profile
+    console.warn('Skipping profile due to missing ID');
+    return null;
+  }
+
+  // Parse location data
+  let locationText = 'Location not specified';
+  if (rec.recommended_user_location) {
+    try {
+      const locationData: LocationData = JSON.parse(rec.recommended_user_location);
+      // Only show city and state as requested
+      if (locationData.city && locationData.state) {
+        locationText = `${locationData.city}, ${locationData.state}`;
+      } else if (locationData.city) {
+        locationText = locationData.city;
+      } else if (locationData.state) {
+        locationText = locationData.state;
+      } else {
+        locationText = 'Location not specified';
+      }
+    } catch (e) {
+      console.error('Error parsing location:', e);
+    }
+  }
+
+  // Parse interests
+  const interestsStr = rec.recommended_user_interest || '';
+  let interests: string[] = [];
+
+  if (interestsStr) {
+    interests = interestsStr
+      .replace(/[{}"]/g, '') // Remove all braces and quotes
+      .split(',')
+      .map(i => i.trim())
+      .filter(i => i);
+  }
+
+  // Get similarity score from the map
+  const similarity_score = profileMap.get(profileId) || rec.similarity_score || 0;
+
+
+  return {
+    username: rec.recommended_user_username,
+    age: rec.recommended_user_age,
+    bio: rec.recommended_user_bio,
+    gender: rec.recommended_user_gender || 'Not specified',
+    interests: interests,
+    location: locationText,
+    occupation: rec.recommended_user_occupation,
+    profile_photo: rec.recommended_user_photo,
+    prompts: rec.recommended_user_prompts || { prompts: [] },
+    similarity_score: similarity_score,
+    recommended_user_profile_id: profileId,
+    isVerified: rec.recommended_user_isverified || false,
+    level: rec.level || 0
+  };
+};
+
 export default function ExploreScreen() {
   const router = useRouter();
   const [currentIndex, setCurrentIndex] = useState(0);
@@ -127,6 +204,10 @@ export default function ExploreScreen() {
   const [loading, setLoading] = useState(true);
   const [refreshing, setRefreshing] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  // Keyset cursor of the next page of detailed profiles, null once the feed is fully loaded
+  const [nextAfterRank, setNextAfterRank] = useState<number | null>(null);
+  const loadingMoreRef = useRef(false);
+  const profileMapRef = useRef(new Map<number, number>());
   
   // Animation values
   const cardOpacity = useSharedValue(1);
@@ -217,6 +298,50 @@ export default function ExploreScreen() {
     initializeScreen();
   }, []);
 
+  // Fetch one page of detailed profiles, ordered by rank
+  const fetchRecommendationPage = async (token: string, afterRank: number | null) => {
+    const response = await axios.get(
+      `${API_URL}/api/recommended_users/me`,
+      {
+        params: {
+          limit: RECOMMENDATION_PAGE_SIZE,
+          ...(afterRank !== null ? { after_rank: afterRank } : {})
+        },
+        headers: {
+          Authorization: `Bearer ${token}`,
+          'Content-Type': 'application/json'
+        }
+      }
+    );
+
+    console.log('Detailed profiles raw data:', response.data);
+
+    const profiles: TransformedProfile[] = (response.data?.recommended_users || [])
+      .map((rec: RecommendationResponse) => transformRecommendation(rec, profileMapRef.current))
+      .filter((profile: TransformedProfile | null): profile is TransformedProfile => profile !== null);
+    return { profiles, nextAfterRank: response.data?.next_after_rank ?? null };
+  };
+
+  // Append the next page once the user gets close to the last loaded card
+  const loadMoreRecommendations = async (swipedIndex: number) => {
+    if (nextAfterRank === null || loadingMoreRef.current) return;
+    if (swipedIndex < recommendations.length - RECOMMENDATION_PREFETCH_REMAINING) return;
+
+    loadingMoreRef.current = true;
+    try {
+      const token = await AsyncStorage.getItem('accessToken');
+      if (!token) throw new Error('No access token found');
+
+      const page = await fetchRecommendationPage(token, nextAfterRank);
+      setRecommendations(current => [...current, ...page.profiles]);
+      setNextAfterRank(page.nextAfterRank);
+    } catch (error: any) {
+      console.error('Error loading more recommendations:', error);
+    } finally {
+      loadingMoreRef.current = false;
+    }
+  };
+
   const fetchRecommendations = async () => {
     try {
       setLoading(true);
@@ -238,126 +363,53 @@ export default function ExploreScreen() {
               Authorization: `Bearer ${token}`,
               'Content-Type': 'application/json'
             },
-            timeout: 60000 // 60 seconds to allow for model loading time
+            timeout: 10000
           }
         );
 
-        console.log('Initial recommendation IDs:', recommendationResponse.data);
+        // The server queues the computation (202), poll the job until the feed is stored
+        let jobResponse = recommendationResponse;
+        const pollStartedAt = Date.now();
+        while (jobResponse.status === 202 || jobResponse.data.status === 'pending') {
+          if (Date.now() - pollStartedAt > RECOMMENDATION_JOB_POLL_TIMEOUT_MS) {
+            throw new Error('Recommendations are taking too long, please try again');
+          }
+          await new Promise(resolve => setTimeout(resolve, RECOMMENDATION_JOB_POLL_INTERVAL_MS));
+          jobResponse = await axios.get(
+            `${API_URL}/user/recommendation/jobs/${recommendationResponse.data.job_id}`,
+            {
+              headers: {
+                Authorization: `Bearer ${token}`,
+                'Content-Type': 'application/json'
+              }
+            }
+          );
+        }
+
+        console.log('Initial recommendation IDs:', jobResponse.data);
         
-        if (recommendationResponse.data.status !== 'success') {
-          throw new Error(recommendationResponse.data.message || 'Failed to get initial recommendations');
+        if (jobResponse.data.status !== 'success') {
+          throw new Error(jobResponse.data.error || jobResponse.data.message || 'Failed to get initial recommendations');
         }
 
         // Create a map of profile IDs to similarity scores
         const profileMap = new Map<number, number>();
-        recommendationResponse.data.recommended_users.forEach((id: number, index: number) => {
-          profileMap.set(id, recommendationResponse.data.similarity_scores[index]);
+        jobResponse.data.recommended_users.forEach((id: number, index: number) => {
+          profileMap.set(id, jobResponse.data.similarity_scores[index]);
         });
+        profileMapRef.current = profileMap;
 
-        // Step 2: Get detailed user profiles
+        // Step 2: Get the first page of detailed user profiles, later pages load while swiping
         console.log('Fetching detailed profiles...');
-        const detailedResponse = await axios.get(
-          `${API_URL}/api/recommended_users/me`,
-          {
-            headers: {
-              Authorization: `Bearer ${token}`,
-              'Content-Type': 'application/json'
-            }
-          }
-        );
-
-        console.log('Detailed profiles raw data:', detailedResponse.data);
-
-        if (!detailedResponse.data?.recommended_users?.length) {
-          throw new Error('No recommendations available');
-        }
-
-        // Transform the data
-        const mappedProfiles: (TransformedProfile | null)[] = detailedResponse.data.recommended_users.map(
-          (rec: RecommendationResponse) => {
-            // Get profile ID from either field name (handle API inconsistency)
-            const profileId = rec.recommended_user_profile_id || rec.recommended_user_profile_user_id;
-            
-            console.log('Processing profile with ID:', profileId);
-            
-            if (!profileId) {
-              console.error('Missing profile ID in recommendation:', rec);
-              // Instead of throwing error, log and skip this profile
-              console.warn('Skipping profile due to missing ID');
-              return null;
-            }
+        const page = await fetchRecommendationPage(token, null);
 
-            // Parse location data
-            let locationText = 'Location not specified';
-            if (rec.recommended_user_location) {
-              try {
-                const locationData: LocationData = JSON.parse(rec.recommended_user_location);
-                // Only show city and state as requested
-                if (locationData.city && locationData.state) {
-                  locationText = `${locationData.city}, ${locationData.state}`;
-                } else if (locationData.city) {
-                  locationText = locationData.city;
-                } else if (locationData.state) {
-                  locationText = locationData.state;
-                } else {
-                  locationText = 'Location not specified';
-                }
-              } catch (e) {
-                console.error('Error parsing location:', e);
-              }
-            }
-
-            // Parse interests
-            const interestsStr = rec.recommended_user_interest || '';
-            let interests: string[] = [];
-            
-            if (interestsStr) {
-              interests = interestsStr
-                .replace(/[{}"]/g, '') // Remove all braces and quotes
-                .split(',')
-                .map(i => i.trim())
-                .filter(i => i);
-            }
-
-            // Get similarity score from the map
-            const similarity_score = profileMap.get(profileId) || rec.similarity_score || 0;
-
-          
-            return {
-              username: rec.recommended_user_username,
-              age: rec.recommended_user_age,
-              bio: rec.recommended_user_bio,
-              gender: rec.recommended_user_gender || 'Not specified',
-              interests: interests,
-              location: locationText,
-              occupation: rec.recommended_user_occupation,
-              profile_photo: rec.recommended_user_photo,
-              prompts: rec.recommended_user_prompts || { prompts: [] },
-              similarity_score: similarity_score,
-              recommended_user_profile_id: profileId,
-              isVerified: rec.recommended_user_isverified || false,
-              level: rec.level || 0
-            };
-          }
-        );
-
-        // Filter out any null entries (skipped profiles)
-        const transformedProfiles: TransformedProfile[] = mappedProfiles.filter(
-          (profile): profile is TransformedProfile => profile !== null
-        );
-
-        if (transformedProfiles.length === 0) {
+        if (!page.profiles.length) {
           throw new Error('No valid profiles found');
         }
 
-        // Sort by similarity score
-        const sortedProfiles = transformedProfiles.sort(
-          (a: TransformedProfile, b: TransformedProfile) => 
-            b.similarity_score - a.similarity_score
-        );
-
-        console.log('Transformed profiles:', sortedProfiles);
-        setRecommendations(sortedProfiles);
+        console.log('Transformed profiles:', page.profiles);
+        setRecommendations(page.profiles);
+        setNextAfterRank(page.nextAfterRank);
       } catch (recommendationError: any) {
         // Handle errors specifically from recommendation model
         if (recommendationError.response?.status === 503) {
@@ -717,7 +769,8 @@ export default function ExploreScreen() {
                 );
               }}
               onSwiped={(cardIndex) => {
-                // Card was swiped but direction is handled in onSwipedLeft/Right
+                // Direction is handled in onSwipedLeft/Right, here the next page is prefetched
+                loadMoreRecommendations(cardIndex);
               }}
               onSwipedLeft={(cardIndex) => handleSwipe('left', cardIndex)}
               onSwipedRight={(cardIndex) => handleSwipe('right', cardIndex)}
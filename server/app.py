@@ -66,6 +66,11 @@ with app.app_context():
     from database.recommendations_db_get_controller import * 
     from controllers.onboarding_crud_controller import *
     from database.matches_db_get_controller import *
+    from controllers.health_controller import *
+
+# Load the embedding model in the background so the first recommendation request does not wait for it
+from model.recommendation_model import start_embedding_model_loader
+start_embedding_model_loader()
 
 # Add chat API routes
 app.add_url_rule('/api/chats', view_func=get_chats, methods=['GET'])
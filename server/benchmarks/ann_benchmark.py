@@ -0,0 +1,65 @@
+"""
+Recall@50 and latency of the IVF index against exact row-wise scoring, over a grid of
+n_lists / n_probe settings. Profiles are synthetic clustered vectors, since real profile
+embeddings cluster by location and shared interests.
+Run from the server directory:
+    python -m benchmarks.ann_benchmark --profiles 100000
+"""
+import argparse
+import time
+import numpy as np
+from model.ann_index import IVFIndex
+from model.similarity_search import normalize_rows, top_k
+
+EMBEDDING_DIM = 384
+TOP_K = 50
+
+
+def synthetic_profiles(size, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, EMBEDDING_DIM), dtype=np.float32)
+    members = rng.integers(clusters, size=size)
+    noise = rng.standard_normal((size, EMBEDDING_DIM), dtype=np.float32)
+    return normalize_rows(centers[members] + 1.5 * noise)
+
+
+def run(size, queries, grid):
+    vectors = synthetic_profiles(size, clusters=max(10, size // 500))
+    user_ids = np.arange(size, dtype=np.int64)
+    query_rows = np.random.default_rng(1).choice(size, queries, replace=False)
+
+    exact = []
+    exact_times = []
+    for row in query_rows:
+        start = time.perf_counter()
+        idx, _ = top_k(vectors @ vectors[row], TOP_K, exclude=row)
+        exact_times.append(time.perf_counter() - start)
+        exact.append(set(idx.tolist()))
+    print(f"exact: p50 {np.percentile(exact_times, 50) * 1000:.2f} ms  p99 {np.percentile(exact_times, 99) * 1000:.2f} ms")
+
+    print(f"{'n_lists':>8} {'n_probe':>8} {'build s':>8} {'recall@50':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for n_lists in grid["n_lists"]:
+        start = time.perf_counter()
+        index = IVFIndex(n_lists=n_lists).build(user_ids, vectors)
+        build_time = time.perf_counter() - start
+
+        for n_probe in grid["n_probe"]:
+            recalls = []
+            timings = []
+            for row, truth in zip(query_rows, exact):
+                start = time.perf_counter()
+                found, _ = index.search(vectors[row], TOP_K, vectors.__getitem__, n_probe=n_probe, exclude_ids=[row])
+                timings.append(time.perf_counter() - start)
+                recalls.append(len(truth.intersection(found.tolist())) / TOP_K)
+            print(f"{n_lists:>8} {n_probe:>8} {build_time:>8.1f} {np.mean(recalls):>10.3f} "
+                  f"{np.percentile(timings, 50) * 1000:>8.2f} {np.percentile(timings, 99) * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-lists", type=int, nargs="+", default=[IVFIndex.default_n_lists(100_000) // 2, IVFIndex.default_n_lists(100_000)])
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    args = parser.parse_args()
+    run(args.profiles, args.queries, {"n_lists": args.n_lists, "n_probe": args.n_probe})
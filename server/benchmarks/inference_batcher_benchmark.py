@@ -0,0 +1,87 @@
+"""
+Throughput of single-profile encode calls from 1, 8 and 32 concurrent threads, each thread
+calling the encoder directly versus going through the InferenceBatcher.
+The encoder stands in for a small transformer: hashed token features pushed through a stack
+of dense layers, so a call costs a fixed weight read plus a per-row cost, like the real model.
+Run from the server directory:
+    python -m benchmarks.inference_batcher_benchmark --callers 1 8 32
+"""
+import argparse
+import threading
+import time
+import numpy as np
+from model.hashing_encoder import HashingEncoder
+from model.inference_batcher import InferenceBatcher
+from model.recommendation_model import build_profile_text
+
+EMBEDDING_DIM = 384
+HIDDEN_DIM = 1536
+LAYERS = 6
+
+
+class DenseStackEncoder:
+    name = "dense-stack"
+
+    def __init__(self, seed=0):
+        rng = np.random.default_rng(seed)
+        self.features = HashingEncoder(EMBEDDING_DIM)
+        self.layers = [
+            (rng.standard_normal((EMBEDDING_DIM, HIDDEN_DIM), dtype=np.float32) / np.sqrt(EMBEDDING_DIM),
+             rng.standard_normal((HIDDEN_DIM, EMBEDDING_DIM), dtype=np.float32) / np.sqrt(HIDDEN_DIM))
+            for _ in range(LAYERS)
+        ]
+
+    def encode(self, texts, show_progress_bar=False):
+        hidden = self.features.encode(texts)
+        for up, down in self.layers:
+            hidden = hidden + np.maximum(hidden @ up, 0) @ down
+        return hidden
+
+
+def run_callers(encoder, texts, callers, calls_per_caller):
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(callers)
+
+    def caller(offset):
+        barrier.wait()
+        own = []
+        for call in range(calls_per_caller):
+            text = texts[(offset * calls_per_caller + call) % len(texts)]
+            start = time.perf_counter()
+            encoder.encode([text])
+            own.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=caller, args=(offset,)) for offset in range(callers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return callers * calls_per_caller / (time.perf_counter() - start), np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def run(caller_counts, calls_per_caller):
+    rng = np.random.default_rng(0)
+    texts = [
+        build_profile_text(f"City{rng.integers(500)}", "{" + ",".join(f"Interest{i}" for i in rng.integers(300, size=5)) + "}")
+        for _ in range(10_000)
+    ]
+    encoder = DenseStackEncoder()
+    encoder.encode(texts[:64])
+
+    print(f"{'callers':>8} {'mode':>8} {'texts/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for callers in caller_counts:
+        for mode, wrapped in (("direct", encoder), ("batched", InferenceBatcher(encoder))):
+            throughput, p50, p99 = run_callers(wrapped, texts, callers, calls_per_caller)
+            print(f"{callers:>8} {mode:>8} {throughput:>9.0f} {p50 * 1000:>8.2f} {p99 * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--calls", type=int, default=200, help="encode calls per caller")
+    args = parser.parse_args()
+    run(args.callers, args.calls)
@@ -0,0 +1,52 @@
+"""
+Recall@50, latency and memory of the exact scan at each embedding precision. float16 and
+int8 scan quantized codes and rerank their best candidates in float32; recall is measured
+against the float32 scan.
+Run from the server directory:
+    python -m benchmarks.quantization_benchmark --profiles 100000
+"""
+import argparse
+import time
+import numpy as np
+from benchmarks.ann_benchmark import synthetic_profiles, TOP_K
+from model.quantization import PRECISIONS, quantize, quantized_top_k
+from model.similarity_search import top_k
+
+
+def run(size, queries):
+    vectors = synthetic_profiles(size, clusters=max(10, size // 500))
+    query_rows = np.random.default_rng(1).choice(size, queries, replace=False)
+
+    exact = [set(top_k(vectors @ vectors[row], TOP_K, exclude=row)[0].tolist()) for row in query_rows]
+
+    print(f"{'precision':>10} {'scan MB':>8} {'recall@50':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for precision in PRECISIONS:
+        if precision == "float32":
+            codes, scales = vectors, None
+        else:
+            codes, scales = quantize(vectors, precision)
+        megabytes = (codes.nbytes + (scales.nbytes if scales is not None else 0)) / 2**20
+
+        recalls = []
+        times = []
+        for row, expected in zip(query_rows, exact):
+            start = time.perf_counter()
+            if precision == "float32":
+                idx, _ = top_k(vectors @ vectors[row], TOP_K, exclude=row)
+            else:
+                idx, _ = quantized_top_k(codes, scales, vectors, vectors[row], TOP_K, exclude=row)
+            times.append(time.perf_counter() - start)
+            recalls.append(len(expected & set(idx.tolist())) / TOP_K)
+
+        print(
+            f"{precision:>10} {megabytes:>8.0f} {np.mean(recalls):>10.4f} "
+            f"{np.percentile(times, 50) * 1000:>8.2f} {np.percentile(times, 99) * 1000:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+    run(args.profiles, args.queries)
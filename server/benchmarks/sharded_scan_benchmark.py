@@ -0,0 +1,58 @@
+"""
+Latency of an exact top-k scan in one process versus sharded over a process pool, for single
+queries and for a batch of queries scored together (matrix-matrix).
+The store is written to a temporary directory so worker processes can map it.
+Run from the server directory:
+    python -m benchmarks.sharded_scan_benchmark --profiles 500000 --workers 4
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from model.embedding_store import EmbeddingStore
+from model.sharded_search import ShardedScanner, scan_top_k
+from model.similarity_search import normalize_rows
+
+EMBEDDING_DIM = 384
+TOP_K = 2000
+
+
+def median_ms(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+
+def run(profiles, workers, batch_size, repeats):
+    rng = np.random.default_rng(0)
+    vectors = normalize_rows(rng.standard_normal((profiles, EMBEDDING_DIM), dtype=np.float32))
+    with tempfile.TemporaryDirectory() as directory:
+        store = EmbeddingStore(directory)
+        store._commit("benchmark", np.arange(profiles, dtype=np.int64), np.zeros(profiles, dtype=np.uint64), vectors)
+        del vectors
+        scanner = ShardedScanner(workers=workers, min_profiles=0)
+        queries = np.asarray(store.vectors[rng.choice(profiles, batch_size, replace=False)])
+        # Start the pool and map the file in every worker before timing
+        scanner.search(store, queries[:1], TOP_K)
+
+        print(f"{profiles} profiles, top {TOP_K}, {workers} workers")
+        single = median_ms(lambda: scan_top_k(store.vectors, queries[:1], TOP_K), repeats)
+        sharded = median_ms(lambda: scanner.search(store, queries[:1], TOP_K), repeats)
+        print(f"1 query: in-process {single:>10.1f} ms, sharded {sharded:>10.1f} ms")
+        single = median_ms(lambda: [scan_top_k(store.vectors, query[None, :], TOP_K) for query in queries], repeats)
+        batched = median_ms(lambda: scan_top_k(store.vectors, queries, TOP_K), repeats)
+        sharded = median_ms(lambda: scanner.search(store, queries, TOP_K), repeats)
+        print(f"{batch_size} queries: one by one {single:>10.1f} ms, batched {batched:>10.1f} ms, batched sharded {sharded:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=500_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    run(args.profiles, args.workers, args.batch_size, args.repeats)
@@ -0,0 +1,80 @@
+"""
+Per-process memory of the embedding store when several workers score against it, with the
+vector matrix memory-mapped (shared through the page cache) versus copied into each process.
+Linux only: memory is read from /proc/self/smaps_rollup.
+Run from the server directory:
+    python -m benchmarks.shared_store_benchmark --profiles 100000 --workers 1 2 4
+"""
+import argparse
+import multiprocessing
+import tempfile
+import numpy as np
+from model.embedding_store import EmbeddingStore
+from model.similarity_search import top_k_similar
+
+EMBEDDING_DIM = 384
+
+
+class RandomEncoder:
+    def encode(self, texts, show_progress_bar=False):
+        return np.random.default_rng(len(texts)).standard_normal((len(texts), EMBEDDING_DIM), dtype=np.float32)
+
+
+def memory_mb():
+    """(private, proportional) resident memory of this process in MB"""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0].endswith(":") and len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return private / 1024, fields.get("Pss", 0) / 1024
+
+
+def worker(directory, copy, queries, barrier, results):
+    baseline = memory_mb()
+    store = EmbeddingStore(directory).load()
+    vectors = np.array(store.vectors) if copy else store.vectors
+    for user_idx in range(queries):
+        top_k_similar(vectors, user_idx, 50)
+    # Measure while every worker still holds its mapping, shared pages are split between them
+    barrier.wait()
+    private, pss = memory_mb()
+    results.put((private - baseline[0], pss - baseline[1]))
+    barrier.wait()
+
+
+def run(size, worker_counts, queries):
+    directory = tempfile.mkdtemp()
+    EmbeddingStore(directory).load().sync(
+        np.arange(size), [str(user_id) for user_id in range(size)], RandomEncoder(), "random"
+    )
+    print(f"store: {size} x {EMBEDDING_DIM} float32 = {size * EMBEDDING_DIM * 4 / 2**20:.0f} MB")
+    print(f"{'mode':>6} {'workers':>8} {'private MB/worker':>18} {'PSS MB/worker':>14} {'total PSS MB':>13}")
+
+    context = multiprocessing.get_context("fork")
+    for copy in (True, False):
+        for count in worker_counts:
+            results = context.Queue()
+            barrier = context.Barrier(count)
+            processes = [
+                context.Process(target=worker, args=(directory, copy, queries, barrier, results)) for _ in range(count)
+            ]
+            for process in processes:
+                process.start()
+            measurements = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            private = np.mean([m[0] for m in measurements])
+            pss = np.mean([m[1] for m in measurements])
+            print(f"{'copy' if copy else 'mmap':>6} {count:>8} {private:>18.1f} {pss:>14.1f} {pss * count:>13.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+    run(args.profiles, args.workers, args.queries)
@@ -0,0 +1,62 @@
+"""
+Memory and latency of row-wise top-k scoring versus the full N x N cosine matrix.
+Run from the server directory:
+    python -m benchmarks.similarity_benchmark
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+from model.similarity_search import normalize_rows, top_k_similar
+
+EMBEDDING_DIM = 384
+TOP_K = 50
+# The full matrix is only materialized up to this size, beyond it the cost is extrapolated
+FULL_MATRIX_MAX_PROFILES = 20_000
+
+
+def measure(fn, repeats):
+    """Return (median seconds, peak traced bytes) of fn over a number of runs"""
+    timings = []
+    peak = 0
+    for _ in range(repeats):
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return float(np.median(timings)), peak
+
+
+def full_matrix(normalized, query_idx):
+    similarity = normalized @ normalized.T
+    return similarity[query_idx].argsort()[::-1][1:TOP_K + 1]
+
+
+def run(sizes, repeats):
+    rng = np.random.default_rng(0)
+    print(f"{'profiles':>10} {'row-wise ms':>12} {'row-wise MB':>12} {'full ms':>12} {'full MB':>12}")
+    for size in sizes:
+        normalized = normalize_rows(rng.standard_normal((size, EMBEDDING_DIM), dtype=np.float32))
+        query_idx = int(rng.integers(size))
+
+        row_time, row_peak = measure(lambda: top_k_similar(normalized, query_idx, TOP_K), repeats)
+
+        if size <= FULL_MATRIX_MAX_PROFILES:
+            full_time, full_peak = measure(lambda: full_matrix(normalized, query_idx), 1)
+            full = f"{full_time * 1000:>12.1f} {full_peak / 2**20:>12.1f}"
+        else:
+            # N x N float32 similarity matrix, not allocated
+            full = f"{'-':>12} {size * size * 4 / 2**20:>11.0f}*"
+
+        print(f"{size:>10} {row_time * 1000:>12.2f} {row_peak / 2**20:>12.2f} {full}")
+    print("* estimated size of the similarity matrix alone")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.repeats)
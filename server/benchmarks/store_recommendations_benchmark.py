@@ -0,0 +1,105 @@
+"""
+Rows/sec of the recommendation feed writer: the previous per-row INSERT loop into the former
+user_recommendations_db layout versus write_recommendation_feeds, one user per transaction and
+many users per transaction, followed by the on-disk size of each table.
+Writes go to TEMP tables that shadow the feed tables for this session only,
+so the benchmark can run against the configured database without touching real data.
+Run from the server directory:
+    python -m benchmarks.store_recommendations_benchmark --users 200
+"""
+import argparse
+import time
+import numpy as np
+import psycopg2
+from config.config import POSTGRES_HOST, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_PORT
+from model.recommendation_model import RecommendationModel, write_recommendation_feeds
+
+FEED_SIZE = RecommendationModel.DEFAULT_RECOMMENDATION_LIMIT
+
+
+def legacy_write(connection, cursor, user_id, recommended_ids, similarity_scores):
+    """The writer as it was: DELETE, commit, one INSERT per row, commit"""
+    cursor.execute("DELETE FROM user_recommendations_db WHERE user_id = %s", (user_id,))
+    connection.commit()
+    for rank, (rec_id, score) in enumerate(zip(recommended_ids, similarity_scores), 1):
+        cursor.execute('''
+            INSERT INTO user_recommendations_db (user_id, recommended_user_id, similarity_score, rank)
+            VALUES (%s, %s, %s, %s)
+        ''', (user_id, rec_id, score, rank))
+    connection.commit()
+
+
+def run(users, batch_size):
+    connection = psycopg2.connect(
+        host=POSTGRES_HOST,
+        database=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        port=POSTGRES_PORT
+    )
+    cursor = connection.cursor()
+    # pg_temp is searched first, so every statement below hits the scratch tables
+    cursor.execute('''
+        CREATE TEMP TABLE user_recommendations_db (
+            id SERIAL PRIMARY KEY,
+            user_id INT NOT NULL,
+            recommended_user_id INT NOT NULL,
+            similarity_score FLOAT NOT NULL,
+            rank INT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX ON user_recommendations_db(user_id, rank) INCLUDE (recommended_user_id, similarity_score)")
+    cursor.execute('''
+        CREATE TEMP TABLE user_recommendation_feeds (
+            user_id INT PRIMARY KEY,
+            recommended_user_ids INT[] NOT NULL,
+            similarity_scores REAL[] NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    connection.commit()
+
+    rng = np.random.default_rng(0)
+    feeds = [
+        (user_id, rng.integers(1, 100_000, FEED_SIZE).tolist(), np.sort(rng.random(FEED_SIZE))[::-1].tolist())
+        for user_id in range(1, users + 1)
+    ]
+
+    def report(name, seconds):
+        rows = users * FEED_SIZE
+        print(f"{name:<32} {seconds:>8.2f} s {rows / seconds:>10.0f} rows/s")
+
+    # Twice each: the first pass inserts, the second replaces existing feeds
+    for attempt in ("insert", "replace"):
+        start = time.perf_counter()
+        for feed in feeds:
+            legacy_write(connection, cursor, *feed)
+        report(f"per-row INSERT ({attempt})", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for feed in feeds:
+            write_recommendation_feeds(cursor, [feed])
+            connection.commit()
+        report(f"array, 1 user/txn ({attempt})", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for offset in range(0, users, batch_size):
+            write_recommendation_feeds(cursor, feeds[offset:offset + batch_size])
+            connection.commit()
+        report(f"array, {batch_size} users/txn ({attempt})", time.perf_counter() - start)
+
+    for table in ("user_recommendations_db", "user_recommendation_feeds"):
+        cursor.execute("SELECT pg_total_relation_size(%s::regclass)", (f"pg_temp.{table}",))
+        print(f"{table:<32} {cursor.fetchone()[0] / 1024:>8.0f} KB with indexes")
+
+    cursor.close()
+    connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    run(args.users, args.batch_size)
@@ -9,4 +9,98 @@ POSTGRES_USER = os.getenv("POSTGRES_USER")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT")
 
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
\ No newline at end of file
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+
+# Local state of the recommendation engine (embedding store, batch job checkpoints)
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", os.path.join(DATA_DIR, "embeddings"))
+
+# Approximate nearest-neighbour retrieval, used once the store holds ANN_MIN_PROFILES users
+ANN_MIN_PROFILES = int(os.getenv("ANN_MIN_PROFILES", "20000"))
+ANN_N_LISTS = int(os.getenv("ANN_N_LISTS", "0"))  # 0 picks 4 * sqrt(n)
+ANN_N_PROBE = int(os.getenv("ANN_N_PROBE", "16"))
+
+# Precision of the vectors scanned for recommendations: float32, float16 or int8. Every scan
+# (exact, sharded and the ANN buckets) reads the codes, reduced precisions rerank their best
+# candidates against the float32 vectors.
+EMBEDDING_PRECISION = os.getenv("EMBEDDING_PRECISION", "float32")
+
+# Re-embedded profiles are appended to the live store version as a delta segment (into up to
+# EMBEDDING_DELTA_ROWS rows reserved behind its base rows) instead of rewriting the whole matrix.
+# The delta is folded into a new full version after EMBEDDING_DELTA_MAX_BATCHES appends, once the
+# version is EMBEDDING_DELTA_MAX_SECONDS old, or when the reserved rows run out.
+EMBEDDING_DELTA_ROWS = int(os.getenv("EMBEDDING_DELTA_ROWS", "4096"))
+EMBEDDING_DELTA_MAX_BATCHES = int(os.getenv("EMBEDDING_DELTA_MAX_BATCHES", "50"))
+EMBEDDING_DELTA_MAX_SECONDS = int(os.getenv("EMBEDDING_DELTA_MAX_SECONDS", "600"))
+
+# Profile texts whose vectors are cached per process (about 1.5 KB each at 384 dimensions)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+
+# Profiles fetched per round trip when streaming user_profile through a server-side cursor
+PROFILE_LOAD_CHUNK_SIZE = int(os.getenv("PROFILE_LOAD_CHUNK_SIZE", "5000"))
+# Each API process syncs the embedding stores once at startup in the background, then rebuilds its
+# candidate columns (ages, interests, right swipes...) from user_profile this often
+CANDIDATE_STORE_REFRESH_SECONDS = int(os.getenv("CANDIDATE_STORE_REFRESH_SECONDS", "300"))
+
+# Cache of ranked feeds served by /user/recommendation: "redis" (shared by all workers), "local" (per process
+# LRU, only for a single worker process: an invalidation would not reach the other workers) or "fakeredis"
+# (the redis code path against an in-memory stand-in, for tests)
+RECOMMENDATION_CACHE_BACKEND = os.getenv("RECOMMENDATION_CACHE_BACKEND", "redis")
+RECOMMENDATION_CACHE_TTL_SECONDS = int(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "300"))
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "10000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Bound every Redis call, so an unreachable server cannot hang a request or a swipe; after a failed
+# call the cache is skipped (every read a miss) for REDIS_RETRY_SECONDS
+REDIS_SOCKET_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", "0.5"))
+REDIS_RETRY_SECONDS = float(os.getenv("REDIS_RETRY_SECONDS", "10"))
+
+# Threads per API process computing queued recommendation jobs, and how long a job may stay pending
+RECOMMENDATION_JOB_WORKERS = int(os.getenv("RECOMMENDATION_JOB_WORKERS", "2"))
+RECOMMENDATION_JOB_TIMEOUT_SECONDS = int(os.getenv("RECOMMENDATION_JOB_TIMEOUT_SECONDS", "600"))
+# Jobs older than this are deleted, finished or abandoned; must exceed the timeout above
+RECOMMENDATION_JOB_RETENTION_SECONDS = int(os.getenv("RECOMMENDATION_JOB_RETENTION_SECONDS", "86400"))
+# Message queue (e.g. redis://localhost:6379/1) shared with the socket server so the API can emit
+# recommendations_ready events; unset, clients poll the job status endpoint only
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+
+# Hybrid ranking: the HYBRID_CANDIDATE_POOL most similar profiles are re-scored with a weighted
+# mean of embedding similarity, interest overlap, verified flag and account tenure
+HYBRID_CANDIDATE_POOL = int(os.getenv("HYBRID_CANDIDATE_POOL", "200"))
+HYBRID_WEIGHTS = {
+    "similarity": float(os.getenv("HYBRID_WEIGHT_SIMILARITY", "1.0")),
+    "interests": float(os.getenv("HYBRID_WEIGHT_INTERESTS", "0.3")),
+    "verified": float(os.getenv("HYBRID_WEIGHT_VERIFIED", "0.1")),
+    "tenure": float(os.getenv("HYBRID_WEIGHT_TENURE", "0.05"))
+}
+
+# Score candidates on both directions (does the user fit what the candidate swipes right on too)
+RECIPROCAL_SCORING = os.getenv("RECIPROCAL_SCORING", "true").lower() == "true"
+
+# Weight of each embedded field in the similarity of two profiles: "profile" is the location and
+# interests text candidates are retrieved with, the others have a vector store each under
+# EMBEDDING_STORE_DIR/fields. A weight of 0 turns a field off.
+EMBEDDING_FIELD_WEIGHTS = {
+    "profile": float(os.getenv("EMBEDDING_WEIGHT_PROFILE", "1.0")),
+    "bio": float(os.getenv("EMBEDDING_WEIGHT_BIO", "0.5")),
+    "occupation": float(os.getenv("EMBEDDING_WEIGHT_OCCUPATION", "0.2")),
+    "prompts": float(os.getenv("EMBEDDING_WEIGHT_PROMPTS", "0.3"))
+}
+
+# Swipe feedback (Rocchio): every swipe moves a user's feedback vector toward the right-swiped profile
+# or away from the left-swiped one by SWIPE_FEEDBACK_RATE, and the ranking query is the user's own
+# embedding plus SWIPE_FEEDBACK_WEIGHT times that vector. A weight of 0 turns it off.
+SWIPE_FEEDBACK_RATE = float(os.getenv("SWIPE_FEEDBACK_RATE", "0.1"))
+SWIPE_FEEDBACK_WEIGHT = float(os.getenv("SWIPE_FEEDBACK_WEIGHT", "0.5"))
+SWIPE_FEEDBACK_NEGATIVE_WEIGHT = float(os.getenv("SWIPE_FEEDBACK_NEGATIVE_WEIGHT", "0.5"))
+
+# Two-stage candidate generation: each retriever (embedding, interests, location) returns up to
+# RETRIEVAL_POOL_SIZE ids, only their union is scored exactly and re-ranked. The interest and
+# location retrievers only run when the embedding stage is approximate (the ANN index): an exact
+# scan already returns the true nearest profiles the exact stage would keep.
+RECOMMENDATION_RETRIEVERS = [name.strip() for name in os.getenv("RECOMMENDATION_RETRIEVERS", "embedding,interests,location").split(",") if name.strip()]
+RETRIEVAL_POOL_SIZE = int(os.getenv("RETRIEVAL_POOL_SIZE", "2000"))
+
+# Sharded exact scan: with SHARDED_SCAN_WORKERS > 0 and at least SHARDED_SCAN_MIN_PROFILES profiles, the
+# embedding matrix is scanned in shards by a pool of worker processes instead of through the ANN index
+SHARDED_SCAN_WORKERS = int(os.getenv("SHARDED_SCAN_WORKERS", "0"))
+SHARDED_SCAN_MIN_PROFILES = int(os.getenv("SHARDED_SCAN_MIN_PROFILES", "200000"))
@@ -0,0 +1,22 @@
+from app import app
+from flask import jsonify
+from utils.logger import logging
+from model.recommendation_model import embedding_model_status, embedding_cache_stats, start_embedding_model_loader
+from model.recommendation_cache import get_recommendation_cache
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """Readiness of this worker: 200 once the embedding model is loaded, 503 while it is loading"""
+    try:
+        start_embedding_model_loader()
+        model_status = embedding_model_status()
+        ready = model_status["state"] in ('ready', 'degraded')
+        return jsonify({
+            "status": "ready" if ready else "loading",
+            "embedding_model": model_status,
+            "embedding_cache": embedding_cache_stats(),
+            "recommendation_cache": get_recommendation_cache().stats()
+        }), 200 if ready else 503
+    except Exception as e:
+        logging.error(f"Error in health_ready: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
@@ -1,53 +1,20 @@
 from app import app
 from flask import jsonify, request
-from model.recommendation_model import RecommendationModel
+from model.recommendation_model import start_embedding_model_loader, start_profile_sync
+from model.recommendation_jobs import submit_recommendation_job, get_recommendation_job
+from model.candidate_store import parse_preference_filters
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from utils.logger import logging
 from utils.get_user_id import get_user_id_from_username
 import time
-import threading
-
-# Global variables for tracking model loading status
-model_loading_lock = threading.Lock()
-model_loading_in_progress = False
-recommendation_model_instance = None
-
-def get_or_create_recommendation_model():
-    """Get an existing model instance or create a new one with proper locking"""
-    global model_loading_in_progress, recommendation_model_instance
-
-    # Quick check without lock
-    if recommendation_model_instance is not None:
-        return recommendation_model_instance
-
-    with model_loading_lock:
-        # Check again with lock
-        if recommendation_model_instance is not None:
-            return recommendation_model_instance
-
-        # Mark loading as in progress
-        model_loading_in_progress = True
-        
-        try:
-            # Create new model instance
-            logging.info("Creating new RecommendationModel instance...")
-            start_time = time.time()
-            model = RecommendationModel()
-            elapsed_time = time.time() - start_time
-            logging.info(f"RecommendationModel instance created in {elapsed_time:.2f} seconds")
-            
-            # Store in global
-            recommendation_model_instance = model
-            return model
-        except Exception as e:
-            logging.error(f"Error creating RecommendationModel: {str(e)}")
-            # Reset flag to allow future attempts
-            model_loading_in_progress = False
-            raise e
 
 @app.route('/user/recommendation', methods=['POST'])
 @jwt_required()
 def get_user_recommendations():
+    """
+    Queue the computation of the current user's feed, answers 202 with a job id to poll.
+    The JSON body may narrow the feed with min_age, max_age, genders, verified_only and same_location.
+    """
     start_time = time.time()
     try:
         # Get current user's username from JWT token
@@ -61,24 +28,24 @@ def get_user_recommendations():
                 "status": "error",
                 "message": "User not found in database"
             }), 404
-            
-        # Initialize recommendation model with improved error handling
+
         try:
-            recommendation_model = get_or_create_recommendation_model()
-            logging.info(f"Recommendation model initialized in {time.time() - start_time:.2f} seconds")
-        except Exception as e:
-            logging.error(f"Failed to initialize recommendation model: {str(e)}")
-            return jsonify({
-                "status": "error",
-                "message": "Unable to load recommendation system. Please try again later.",
-                "details": str(e)
-            }), 503  # Service Unavailable
-        
-        # Get recommendations (model returns a tuple with (jsonify_response, status_code))
-        recommendations, status_code = recommendation_model.user_recommendation_model(current_user_id)
-        logging.info(f"Recommendations generated in {time.time() - start_time:.2f} seconds")
+            filters = parse_preference_filters(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        # The job ranks against the stores the profile sync thread keeps fresh, and finishes
+        # with a degraded feed instead of waiting while the embedding model loads
+        start_embedding_model_loader()
+        start_profile_sync()
+        job_id = submit_recommendation_job(app, current_user_id, filters)
+        logging.info(f"Recommendation job {job_id} queued in {time.time() - start_time:.2f} seconds")
 
-        return recommendations, status_code
+        return jsonify({
+            "status": "accepted",
+            "job_id": job_id,
+            "status_url": f"/user/recommendation/jobs/{job_id}"
+        }), 202
         
     except Exception as e:
         elapsed_time = time.time() - start_time
@@ -87,4 +54,35 @@ def get_user_recommendations():
             "status": "error",
             "message": "An error occurred while generating recommendations",
             "details": str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+@app.route('/user/recommendation/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_user_recommendation_job(job_id):
+    """
+    State of a recommendation job, with recommended_users, similarity_scores and stage timings once it is done,
+    degraded when it was answered while the embedding model was loading
+    """
+    try:
+        current_user = get_jwt_identity()
+        current_user_id = get_user_id_from_username(current_user)
+        if not current_user_id:
+            return jsonify({
+                "status": "error",
+                "message": "User not found in database"
+            }), 404
+
+        job = get_recommendation_job(job_id, current_user_id)
+        if job is None:
+            return jsonify({"status": "error", "message": "Job not found"}), 404
+
+        status = {"done": "success", "failed": "error"}.get(job["state"], "pending")
+        return jsonify({"status": status, **job}), 200
+
+    except Exception as e:
+        logging.error(f"Error in get_user_recommendation_job: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": "An error occurred while reading the recommendation job",
+            "details": str(e)
+        }), 500
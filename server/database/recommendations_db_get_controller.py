@@ -1,4 +1,4 @@
-from flask import jsonify
+from flask import jsonify, request
 from app import app
 import psycopg2
 from flask_jwt_extended import jwt_required, get_jwt_identity
@@ -15,6 +15,16 @@ def get_current_user_recommedation_data():
         current_user = get_jwt_identity()
         current_user_id = get_user_id_from_username(current_user)
 
+        # Keyset pagination: ?limit=10&after_rank=<next_after_rank of the previous page>
+        try:
+            limit = int(request.args.get('limit', RecommendationModel.DEFAULT_PAGE_SIZE))
+            after_rank = request.args.get('after_rank')
+            after_rank = int(after_rank) if after_rank not in (None, '') else None
+        except ValueError:
+            return jsonify({"status": "error", "message": "limit and after_rank must be integers"}), 400
+        if not 1 <= limit <= RecommendationModel.MAX_PAGE_SIZE:
+            return jsonify({"status": "error", "message": f"limit must be between 1 and {RecommendationModel.MAX_PAGE_SIZE}"}), 400
+
         conn = psycopg2.connect(
             host=POSTGRES_HOST,
             database=POSTGRES_DB,
@@ -26,7 +36,7 @@ def get_current_user_recommedation_data():
         # Connect to database
         
         model = RecommendationModel(conn)
-        response = model.get_recommendations(current_user_id)
+        response = model.get_recommendations(current_user_id, limit=limit, after_rank=after_rank)
         
         conn.close()
         
@@ -4,6 +4,17 @@ from utils.logger import logging
 from psycopg2.extras import DictCursor
 import sys
 
+# A user's ranked feed after a given rank as (user_id, recommended_user_id, similarity_score, rank),
+# the feed arrays unnested in rank order, params: user_id, after_rank
+FEED_SOURCE = """(
+    SELECT f.user_id, u.recommended_user_id, u.similarity_score, u.rank
+    FROM user_recommendation_feeds f
+    CROSS JOIN LATERAL unnest(f.recommended_user_ids, f.similarity_scores)
+        WITH ORDINALITY AS u(recommended_user_id, similarity_score, rank)
+    WHERE f.user_id = %s
+    AND u.rank > %s
+)"""
+
 
 class RecommendationModel:
     def __init__(self, connection):
@@ -17,10 +28,21 @@ class RecommendationModel:
             logging.error(f"Error initializing RecommendationModel: {e}")
             raise CustomException(e, sys)
 
-    def get_recommendations(self, user_id):
-        """Fetch recommendations for a user from database"""
+    DEFAULT_PAGE_SIZE = 10
+    MAX_PAGE_SIZE = 50
+
+    def get_recommendations(self, user_id, limit=DEFAULT_PAGE_SIZE, after_rank=None):
+        """
+        Fetch one page of a user's recommendations from database, keyset-paginated on rank
+        Args:
+            user_id (int): Requesting user
+            limit (int): Recommendations per page
+            after_rank (int, optional): Rank of the last recommendation of the previous page
+        Returns:
+            dict: recommended_users of the page and next_after_rank, None on the last page
+        """
         try:
-            logging.info(f"Fetching recommendations for {user_id}")
+            logging.info(f"Fetching recommendations for {user_id} after rank {after_rank}")
 
             self.cursor.execute("""SELECT 
                                 ud.username AS recommended_user_username,
@@ -37,13 +59,14 @@ class RecommendationModel:
                                 up_recommended.created_at AS recommended_user_created_at,
                                 up_recommended.isVerified AS recommended_user_isVerified,
                                 ur.similarity_score,
+                                ur.rank,
                                 CASE
                                 WHEN age(NOW(), ud.created_at) < INTERVAL '3 months' THEN 0
                                 WHEN age(NOW(), ud.created_at) >= INTERVAL '3 months' AND age(NOW(), ud.created_at) < INTERVAL '6 months' THEN 1
                                 ELSE 2
                     END AS level  
                             FROM 
-                                user_recommendations_db ur
+                                """ + FEED_SOURCE + """ ur
 
                             -- Join for current user's profile
                             JOIN 
@@ -57,21 +80,24 @@ class RecommendationModel:
                             JOIN 
                                 user_db ud ON up_recommended.user_id = ud.id
 
-                            WHERE 
-                                ur.user_id = %s
-
                             ORDER BY 
-                                ur.rank ASC;""", (user_id,))
+                                ur.rank ASC
+                            
+                            -- One row more than the page tells whether another page follows
+                            LIMIT %s;""", (user_id, after_rank if after_rank is not None else 0, limit + 1))
             logging.info(f"Found recommendations for {user_id}")
             user_data = self.cursor.fetchall()
-            if not user_data:
+            if not user_data and after_rank is None:
                 return {"error": "User not found"}, 404
             
             recommended_users = []
-            for row in user_data:
+            for row in user_data[:limit]:
                 recommended_users.append(dict(row))
             
-            return {"recommended_users": recommended_users}
+            return {
+                "recommended_users": recommended_users,
+                "next_after_rank": recommended_users[-1]["rank"] if len(user_data) > limit else None
+            }
 
         except Exception as e:
             logging.error(f"Error in get_recommendations: {str(e)}")
@@ -103,3 +103,84 @@ ALTER TABLE user_profile
 RENAME COLUMN profile_photo TO images;
 
 ALTER TABLE user_profile ADD COLUMN isVerified BOOLEAN DEFAULT FALSE;
+
+-- Track profile changes so the batch recommendation job can recompute only changed users
+ALTER TABLE user_profile ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION set_user_profile_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER user_profile_set_updated_at
+BEFORE UPDATE ON user_profile
+FOR EACH ROW EXECUTE FUNCTION set_user_profile_updated_at();
+
+CREATE INDEX idx_user_profile_updated_at ON user_profile(updated_at);
+
+-- Index-only lookups of the users someone already swiped on or matched, excluded from recommendations
+CREATE INDEX idx_swipe_logs_user_target ON swipe_logs(user_id, target_user_id);
+CREATE INDEX idx_matches_user2 ON matches(user2_id, user1_id);
+
+-- Asynchronous recommendation jobs: POST /user/recommendation queues one, clients poll its status
+CREATE TABLE recommendation_jobs (
+    job_id UUID PRIMARY KEY,
+    user_id INT NOT NULL REFERENCES user_db(id),
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX idx_recommendation_jobs_user ON recommendation_jobs(user_id, created_at DESC);
+
+-- Keyset pagination of a user's feed on rank, covers the ranked read without touching the heap;
+-- replaces the user_id-only index, which is a prefix of it
+CREATE INDEX idx_user_recommendations_user_rank ON user_recommendations_db(user_id, rank) INCLUDE (recommended_user_id, similarity_score);
+DROP INDEX idx_user_recommendations_user_id;
+
+-- Preference filters (age range, genders, verified only, same location) a recommendation job ranks with
+ALTER TABLE recommendation_jobs ADD COLUMN filters JSONB DEFAULT NULL;
+
+-- Compact feed storage: one row per user with the ranked ids and
+-- scores as arrays, position in the arrays is the rank
+CREATE TABLE user_recommendation_feeds (
+    user_id INT PRIMARY KEY REFERENCES user_db(id) ON DELETE CASCADE,
+    recommended_user_ids INT[] NOT NULL,
+    similarity_scores REAL[] NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CHECK (cardinality(recommended_user_ids) = cardinality(similarity_scores))
+);
+
+INSERT INTO user_recommendation_feeds (user_id, recommended_user_ids, similarity_scores, created_at)
+SELECT user_id,
+       array_agg(recommended_user_id ORDER BY rank),
+       array_agg(similarity_score::real ORDER BY rank),
+       MAX(created_at)
+FROM user_recommendations_db
+GROUP BY user_id;
+
+-- user_recommendation_feeds is the only stored feed from here on, the per-row table (and its indexes)
+-- would otherwise hold stale feeds next to it
+DROP TABLE user_recommendations_db;
+
+-- Debug metadata of a finished recommendation job: time and candidate count of every ranking stage
+ALTER TABLE recommendation_jobs ADD COLUMN debug JSONB DEFAULT NULL;
+
+-- Feed of a finished job ranked with preference filters, which is not stored as the user's feed
+ALTER TABLE recommendation_jobs ADD COLUMN result JSONB DEFAULT NULL;
+
+-- Set when a job finished while the embedding model was still loading, with the user's stored feed,
+-- a feed ranked on the persisted embeddings or random fallback recommendations
+ALTER TABLE recommendation_jobs ADD COLUMN degraded BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- Deleting a user deletes their recommendation jobs, like every other per-user table
+ALTER TABLE recommendation_jobs DROP CONSTRAINT recommendation_jobs_user_id_fkey;
+ALTER TABLE recommendation_jobs ADD CONSTRAINT recommendation_jobs_user_id_fkey
+    FOREIGN KEY (user_id) REFERENCES user_db(id) ON DELETE CASCADE;
+
+-- Jobs past RECOMMENDATION_JOB_RETENTION_SECONDS are purged by age
+CREATE INDEX idx_recommendation_jobs_created ON recommendation_jobs(created_at);
@@ -6,9 +6,28 @@ workers = 2  # Limited workers for free tier
 timeout = 120
 bind = "0.0.0.0:10000"
 worker_class = "sync"
-preload_app = True
+preload_app = True  # Workers memory-map the embedding store read-only, its pages are shared across them
 
 # Log settings
 accesslog = "-"  # Log to stdout
 errorlog = "-"   # Log to stderr
 loglevel = "info"
+
+
+def on_starting(server):
+    # Swipes and profile edits invalidate cached feeds in the worker that handled them only,
+    # the other workers would keep serving stale feeds until the TTL
+    from config.config import RECOMMENDATION_CACHE_BACKEND
+    if RECOMMENDATION_CACHE_BACKEND == "local" and server.cfg.workers > 1:
+        raise RuntimeError(
+            f"RECOMMENDATION_CACHE_BACKEND=local cannot be shared by {server.cfg.workers} workers, use redis or a single worker"
+        )
+
+
+def post_fork(server, worker):
+    # The master's model loader thread is not copied into workers, resume the load
+    # in any worker forked before it finished
+    from model.recommendation_model import start_embedding_model_loader, start_profile_sync
+    start_embedding_model_loader()
+    # Candidate columns live in each worker's memory, every worker builds and refreshes its own
+    start_profile_sync()
@@ -0,0 +1,178 @@
+import numpy as np
+from model.similarity_search import normalize_rows, top_k
+
+# Rows scored per block when assigning vectors to centroids, bounds the temporary score matrix
+ASSIGN_BLOCK_SIZE = 16384
+
+
+def assign_to_centroids(vectors, centroids):
+    """Index of the most similar centroid for every vector"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+        block = vectors[start:start + ASSIGN_BLOCK_SIZE]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(vectors, n_clusters, iterations=10, seed=0):
+    """
+    Cluster normalized vectors by cosine similarity.
+    Args:
+        vectors (np.ndarray): (n, dim) L2-normalized vectors
+        n_clusters (int): Number of centroids
+        iterations (int): Lloyd iterations
+        seed (int): Seed for initialization and re-seeding empty clusters
+    Returns:
+        np.ndarray: (n_clusters, dim) L2-normalized centroids
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign_to_centroids(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over normalized embeddings for approximate inner-product search.
+    Vectors are bucketed by their nearest k-means centroid and a query only scans the
+    n_probe closest buckets. Inserts and deletes are incremental; centroids are only
+    recomputed by train().
+
+    Buckets hold user_ids only: vectors are looked up from the caller's matrix at query
+    time, so the index adds no copy of a (possibly memory-mapped) embedding matrix.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, kmeans_iterations=10, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self.centroids = None
+        self.trained_size = 0
+        self._list_ids = []
+        self._list_sizes = None
+        # user_id -> (list, position) for O(1) deletes
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, user_id):
+        return int(user_id) in self._positions
+
+    @staticmethod
+    def default_n_lists(size):
+        """Roughly 4 * sqrt(n) buckets, the usual starting point for IVF"""
+        return max(1, int(4 * np.sqrt(size)))
+
+    def train(self, vectors, max_training_points=100_000):
+        """Fit the centroids on (a sample of) the vectors and empty the index"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n_lists = self.n_lists or self.default_n_lists(len(vectors))
+        if len(vectors) > max_training_points:
+            sample = np.random.default_rng(self.seed).choice(len(vectors), max_training_points, replace=False)
+            vectors = vectors[sample]
+
+        self.centroids = spherical_kmeans(vectors, n_lists, self.kmeans_iterations, self.seed)
+        self._list_ids = [np.empty(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        self._list_sizes = np.zeros(len(self.centroids), dtype=np.int64)
+        self._positions = {}
+        self.trained_size = len(vectors)
+        return self
+
+    def build(self, user_ids, vectors):
+        """Train on the vectors and insert all of them"""
+        self.train(vectors)
+        self.add(user_ids, vectors)
+        self.trained_size = len(user_ids)
+        return self
+
+    def _grow(self, list_no, needed):
+        capacity = len(self._list_ids[list_no])
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity, 16)
+        ids = np.empty(capacity, dtype=np.int64)
+        size = self._list_sizes[list_no]
+        ids[:size] = self._list_ids[list_no][:size]
+        self._list_ids[list_no] = ids
+
+    def add(self, user_ids, vectors):
+        """Insert users, vectors are only used to pick their bucket. Re-adding a user moves it"""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(user_ids) == 0:
+            return
+        self.remove([user_id for user_id in user_ids.tolist() if user_id in self._positions])
+
+        assignments = assign_to_centroids(vectors, self.centroids)
+        order = np.argsort(assignments, kind="stable")
+        lists, starts = np.unique(assignments[order], return_index=True)
+        bounds = np.append(starts, len(order))
+
+        for list_no, start, end in zip(lists.tolist(), bounds[:-1], bounds[1:]):
+            members = order[start:end]
+            size = int(self._list_sizes[list_no])
+            self._grow(list_no, size + len(members))
+            self._list_ids[list_no][size:size + len(members)] = user_ids[members]
+            for offset, user_id in enumerate(user_ids[members].tolist()):
+                self._positions[user_id] = (list_no, size + offset)
+            self._list_sizes[list_no] = size + len(members)
+
+    def remove(self, user_ids):
+        """Delete users from the index, unknown ids are ignored"""
+        for user_id in user_ids:
+            position = self._positions.pop(int(user_id), None)
+            if position is None:
+                continue
+            list_no, pos = position
+            last = int(self._list_sizes[list_no]) - 1
+            if pos != last:
+                # Move the last entry into the hole
+                moved_id = int(self._list_ids[list_no][last])
+                self._list_ids[list_no][pos] = moved_id
+                self._positions[moved_id] = (list_no, pos)
+            self._list_sizes[list_no] = last
+
+    def search(self, query, k, vectors_for, n_probe=None, exclude_ids=None, rerank_for=None, rerank_factor=4):
+        """
+        Approximate top-k by inner product.
+        Args:
+            query (np.ndarray): (dim,) normalized query vector
+            k (int): Number of results
+            vectors_for (callable): Maps an array of indexed user_ids to their (n, dim) vectors,
+                approximate ones (e.g. dequantized codes) when rerank_for is given
+            n_probe (int, optional): Buckets to scan, defaults to the index setting
+            exclude_ids (array-like, optional): user_ids that must not be returned
+            rerank_for (callable, optional): Maps user_ids to their exact vectors, the best
+                k * rerank_factor of the probed buckets are rescored on them
+            rerank_factor (int): Candidates kept per result for the rerank
+        Returns:
+            tuple: (user_ids, scores) ordered from most to least similar
+        """
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        probes, _ = top_k(self.centroids @ query, n_probe)
+        ids = np.concatenate([self._list_ids[p][:self._list_sizes[p]] for p in probes])
+        vectors = vectors_for(ids)
+
+        exclude = None
+        if exclude_ids is not None and len(exclude_ids):
+            exclude = np.isin(ids, np.asarray(exclude_ids, dtype=np.int64))
+        if rerank_for is None:
+            idx, scores = top_k(vectors @ query, k, exclude=exclude)
+            return ids[idx], scores
+        idx, _ = top_k(vectors @ query, k * rerank_factor, exclude=exclude)
+        ids = ids[np.sort(idx)]
+        idx, scores = top_k(rerank_for(ids) @ query, k)
+        return ids[idx], scores
@@ -0,0 +1,333 @@
+import threading
+import numpy as np
+
+# Characters around an interest in the stored literals: '{a,b}', '["a", "b"]'
+INTEREST_STRIP_CHARS = ' "\'{}[]'
+
+# gender_enum spellings collapse onto one code per gender, 0 is unknown
+GENDER_CODES = {'male': 1, 'female': 2, 'non-binary': 3, 'other': 4, 'prefer not to say': 5}
+# Stored instead of an age for profiles without one, fails every age bound
+MISSING_AGE = -1
+
+_candidate_store_lock = threading.Lock()
+_candidate_store = None
+
+
+def parse_interest_literals(interests):
+    """
+    Split interest literals into normalized tokens without a Python loop over the tokens
+    Args:
+        interests (array-like): Literals such as '{Hiking,Books}', None where missing
+    Returns:
+        tuple: (tokens as a str array, row of the profile each token belongs to)
+    """
+    interests = np.asarray(interests, dtype=object)
+    literals = np.where(np.equal(interests, None), '', interests).astype(str)
+    parts = np.char.split(np.char.strip(literals, '{}[]'), ',')
+    counts = np.fromiter(map(len, parts), dtype=np.int64, count=len(parts))
+    if not counts.sum():
+        return np.empty(0, dtype=str), np.empty(0, dtype=np.int64)
+
+    tokens = np.char.lower(np.char.strip(np.concatenate(parts).astype(str), INTEREST_STRIP_CHARS))
+    owners = np.repeat(np.arange(len(parts)), counts)
+    keep = np.char.str_len(tokens) > 0
+    return tokens[keep], owners[keep]
+
+
+def encode_genders(genders):
+    """gender_enum values (None where missing) to GENDER_CODES, looked up once per distinct value"""
+    genders = np.asarray(genders, dtype=object)
+    values = np.char.lower(np.char.strip(np.where(np.equal(genders, None), '', genders).astype(str)))
+    unique_values, inverse = np.unique(values, return_inverse=True)
+    codes = np.array([GENDER_CODES.get(value, 0) for value in unique_values.tolist()], dtype=np.int8)
+    return codes[inverse.ravel()]
+
+
+def parse_preference_filters(data):
+    """
+    Validate the preference filters of a recommendation request
+    Args:
+        data (dict): Request body, may hold min_age, max_age, genders, verified_only and same_location
+    Returns:
+        dict or None: Normalized filters, None when none is set
+    Raises:
+        ValueError: On a malformed filter or a body that is not a JSON object
+    """
+    if data is not None and not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    data = data or {}
+    filters = {}
+    for bound in ('min_age', 'max_age'):
+        if data.get(bound) is not None:
+            if isinstance(data[bound], bool) or not isinstance(data[bound], int) or data[bound] < 0:
+                raise ValueError(f"{bound} must be a non-negative integer")
+            filters[bound] = data[bound]
+    if 'min_age' in filters and 'max_age' in filters and filters['min_age'] > filters['max_age']:
+        raise ValueError("min_age must not exceed max_age")
+    if data.get('genders'):
+        if not isinstance(data['genders'], list) or not all(isinstance(gender, str) for gender in data['genders']):
+            raise ValueError("genders must be a list of strings")
+        unknown = [gender for gender in data['genders'] if gender.strip().lower() not in GENDER_CODES]
+        if unknown:
+            raise ValueError(f"Unknown genders {unknown}, expected some of {sorted(GENDER_CODES)}")
+        filters['genders'] = sorted({GENDER_CODES[gender.strip().lower()] for gender in data['genders']})
+    for flag in ('verified_only', 'same_location'):
+        if data.get(flag):
+            filters[flag] = True
+    return filters or None
+
+
+def popcount(words):
+    """Set bits per uint64 word"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    # numpy < 2.0: count through a byte lookup table
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return table[words.view(np.uint8)].reshape(*words.shape, 8).sum(axis=-1)
+
+
+class CandidateStore:
+    """
+    Per-user columns the ranking stage scores candidates on, as compact numpy arrays
+    aligned on user_ids (sorted): interests as a bitset over a shared vocabulary,
+    verified flag, tenure level (0 < 3 months, 1 < 6 months, 2 older), age (MISSING_AGE when
+    unknown), gender code (GENDER_CODES) and location id (0 when unknown).
+    Right swipes are kept in CSR form: the targets of row i are
+    right_swipe_targets[right_swipe_indptr[i]:right_swipe_indptr[i + 1]]. So is the inverted
+    index of interests: the rows holding token t are
+    interest_index_rows[interest_index_indptr[t]:interest_index_indptr[t + 1]].
+    """
+
+    def __init__(self, user_ids, interest_bits, verified, level, vocabulary, age, gender, location,
+                 right_swipe_indptr=None, right_swipe_targets=None, interest_index_indptr=None, interest_index_rows=None):
+        self.user_ids = user_ids
+        self.interest_bits = interest_bits
+        self.interest_counts = popcount(interest_bits).sum(axis=1).astype(np.int32)
+        self.verified = verified
+        self.level = level
+        self.vocabulary = vocabulary
+        self.age = age
+        self.gender = gender
+        self.location = location
+        if right_swipe_indptr is None:
+            right_swipe_indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+            right_swipe_targets = np.empty(0, dtype=np.int64)
+        self.right_swipe_indptr = right_swipe_indptr
+        self.right_swipe_targets = right_swipe_targets
+        if interest_index_indptr is None:
+            interest_index_indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+            interest_index_rows = np.empty(0, dtype=np.int64)
+        self.interest_index_indptr = interest_index_indptr
+        self.interest_index_rows = interest_index_rows
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def rows_of(self, user_ids):
+        """
+        Rows of the given users
+        Returns:
+            tuple: (rows, mask of the users present), rows of absent users are meaningless
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if not len(self.user_ids):
+            return np.zeros(len(user_ids), dtype=np.int64), np.zeros(len(user_ids), dtype=bool)
+        rows = np.minimum(np.searchsorted(self.user_ids, user_ids), len(self.user_ids) - 1)
+        return rows, self.user_ids[rows] == user_ids
+
+    def filter_mask(self, filters, user_id):
+        """
+        Rows that pass a user's preference filters, one vectorized comparison per filter
+        Args:
+            filters (dict): As returned by parse_preference_filters()
+            user_id (int): Requesting user, same_location compares against their location
+        Returns:
+            np.ndarray: bool per row
+        """
+        mask = np.ones(len(self.user_ids), dtype=bool)
+        if 'min_age' in filters:
+            mask &= self.age >= filters['min_age']
+        if 'max_age' in filters:
+            mask &= (self.age != MISSING_AGE) & (self.age <= filters['max_age'])
+        if 'genders' in filters:
+            allowed = np.zeros(len(GENDER_CODES) + 1, dtype=bool)
+            allowed[filters['genders']] = True
+            mask &= allowed[self.gender]
+        if filters.get('verified_only'):
+            mask &= self.verified
+        if filters.get('same_location'):
+            rows, present = self.rows_of([user_id])
+            location = self.location[rows[0]] if present[0] else 0
+            mask &= (self.location == location) & (location != 0)
+        return mask
+
+    def blocked_rows(self, store_user_ids, filters, user_id):
+        """
+        Rows of another table keyed by user_id (the embedding store) whose users fail the filters.
+        Users missing from the columns cannot be checked and are blocked.
+        """
+        allowed = self.filter_mask(filters, user_id)
+        if len(store_user_ids) == len(self.user_ids) and np.array_equal(store_user_ids, self.user_ids):
+            # Built from the same profile stream, rows line up
+            return np.flatnonzero(~allowed)
+        rows, present = self.rows_of(store_user_ids)
+        return np.flatnonzero(~(present & allowed[rows]))
+
+    def rows_sharing_interests(self, user_id):
+        """
+        Rows sharing at least one interest with a user, through the inverted index
+        Returns:
+            tuple: (rows, number of shared interests per row), empty for users without interests
+        """
+        rows, present = self.rows_of([user_id])
+        if not present[0] or not self.interest_counts[rows[0]]:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # Bit i of word w is token 64 * w + i
+        tokens = np.flatnonzero(np.unpackbits(self.interest_bits[rows[0]].view(np.uint8), bitorder='little'))
+        starts = self.interest_index_indptr[tokens]
+        lengths = self.interest_index_indptr[tokens + 1] - starts
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        postings = self.interest_index_rows[np.repeat(starts, lengths) + offsets]
+        matched, overlap = np.unique(postings, return_counts=True)
+        return matched, overlap
+
+    def right_swipes_of(self, user_ids):
+        """
+        Right-swiped users of each of the given users, gathered without a Python loop
+        Returns:
+            tuple: (position in user_ids of each swipe's owner, swiped user_id)
+        """
+        rows, present = self.rows_of(user_ids)
+        starts = self.right_swipe_indptr[rows]
+        lengths = np.where(present, self.right_swipe_indptr[rows + 1] - starts, 0)
+        owners = np.repeat(np.arange(len(rows)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return owners, self.right_swipe_targets[np.repeat(starts, lengths) + offsets]
+
+    @classmethod
+    def from_chunks(cls, chunks, right_swipe_chunks=()):
+        """
+        Build the columns from profile chunks as yielded by stream_profiles()
+        Args:
+            chunks (iterable): dicts with user_id, interest, location, age, gender, is_verified and level arrays
+            right_swipe_chunks (iterable): (swiper user_ids, swiped user_ids) pairs as yielded by stream_right_swipes()
+        """
+        builder = CandidateStoreBuilder()
+        for chunk in chunks:
+            builder.add(chunk)
+        for swiper_ids, target_ids in right_swipe_chunks:
+            builder.add_right_swipes(swiper_ids, target_ids)
+        return builder.build()
+
+
+class CandidateStoreBuilder:
+    """Collects profile chunks while they stream past, e.g. on their way to the embedding store"""
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.locations = {}
+        self._chunks = []
+        self._count = 0
+        self._right_swipes = []
+
+    def add(self, chunk):
+        tokens, owners = parse_interest_literals(chunk["interest"])
+        # Only the distinct tokens of the chunk go through the vocabulary dict
+        unique_tokens, inverse = np.unique(tokens, return_inverse=True)
+        token_ids = np.array([self.vocabulary.setdefault(token, len(self.vocabulary)) for token in unique_tokens.tolist()], dtype=np.int64)
+        # Location ids are numbered like interests, 0 is kept for profiles without a location
+        locations = np.asarray(chunk["location"], dtype=object)
+        has_location = ~np.equal(locations, None)
+        unique_locations, location_inverse = np.unique(
+            np.char.lower(np.char.strip(np.where(has_location, locations, '').astype(str))), return_inverse=True
+        )
+        location_ids = np.array([
+            self.locations.setdefault(location, len(self.locations) + 1) if location else 0
+            for location in unique_locations.tolist()
+        ], dtype=np.int32)
+        ages = np.asarray(chunk["age"], dtype=object)
+        self._chunks.append({
+            "user_id": np.asarray(chunk["user_id"], dtype=np.int64),
+            "is_verified": np.asarray(chunk["is_verified"], dtype=bool),
+            "level": np.asarray(chunk["level"], dtype=np.int8),
+            "age": np.where(np.equal(ages, None), MISSING_AGE, ages).astype(np.int16),
+            "gender": encode_genders(chunk["gender"]),
+            "location": location_ids[location_inverse.ravel()],
+            "interest_rows": owners + self._count,
+            "interest_ids": token_ids[inverse.ravel()] if len(tokens) else np.empty(0, dtype=np.int64)
+        })
+        self._count += len(chunk["user_id"])
+
+    def add_right_swipes(self, swiper_ids, target_ids):
+        self._right_swipes.append((np.asarray(swiper_ids, dtype=np.int64), np.asarray(target_ids, dtype=np.int64)))
+
+    def _right_swipe_csr(self, user_ids):
+        """Group the collected right swipes by the row of their swiper, swipers without a profile are dropped"""
+        indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        if not self._right_swipes or not len(user_ids):
+            return indptr, np.empty(0, dtype=np.int64)
+        swiper_ids = np.concatenate([pair[0] for pair in self._right_swipes])
+        target_ids = np.concatenate([pair[1] for pair in self._right_swipes])
+        rows = np.minimum(np.searchsorted(user_ids, swiper_ids), len(user_ids) - 1)
+        keep = user_ids[rows] == swiper_ids
+        rows, target_ids = rows[keep], target_ids[keep]
+        order = np.argsort(rows, kind="stable")
+        np.cumsum(np.bincount(rows, minlength=len(user_ids)), out=indptr[1:])
+        return indptr, target_ids[order]
+
+    def build(self):
+        def column(name, dtype):
+            if not self._chunks:
+                return np.empty(0, dtype=dtype)
+            return np.concatenate([chunk[name] for chunk in self._chunks]).astype(dtype, copy=False)
+
+        user_ids = column("user_id", np.int64)
+        interest_rows = column("interest_rows", np.int64)
+        interest_ids = column("interest_ids", np.int64)
+        words = max(1, -(-len(self.vocabulary) // 64))
+        interest_bits = np.zeros((len(user_ids), words), dtype=np.uint64)
+        np.bitwise_or.at(
+            interest_bits,
+            (interest_rows, interest_ids // 64),
+            np.left_shift(np.uint64(1), (interest_ids % 64).astype(np.uint64))
+        )
+
+        verified = column("is_verified", bool)
+        level = column("level", np.int8)
+        age = column("age", np.int16)
+        gender = column("gender", np.int8)
+        location = column("location", np.int32)
+        if len(user_ids) > 1 and (np.diff(user_ids) < 0).any():
+            order = np.argsort(user_ids, kind="stable")
+            user_ids, interest_bits = user_ids[order], interest_bits[order]
+            verified, level, age, gender, location = verified[order], level[order], age[order], gender[order], location[order]
+            new_rows = np.empty_like(order)
+            new_rows[order] = np.arange(len(order))
+            interest_rows = new_rows[interest_rows]
+        return CandidateStore(
+            user_ids, interest_bits, verified, level, self.vocabulary, age, gender, location,
+            *self._right_swipe_csr(user_ids), *self._interest_index(interest_rows, interest_ids, len(user_ids))
+        )
+
+    def _interest_index(self, interest_rows, interest_ids, count):
+        """Rows of every interest token in CSR form, a token listed twice on a profile counts once"""
+        indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        if not len(interest_ids):
+            return indptr, np.empty(0, dtype=np.int64)
+        # One sort on (token, row) groups the postings by token and drops duplicates
+        keys = np.unique(interest_ids * max(count, 1) + interest_rows)
+        tokens, rows = np.divmod(keys, max(count, 1))
+        np.cumsum(np.bincount(tokens, minlength=len(self.vocabulary)), out=indptr[1:])
+        return indptr, rows
+
+
+def get_candidate_store():
+    """The process-wide candidate columns, None until the first profile sync built them"""
+    return _candidate_store
+
+
+def set_candidate_store(candidate_store):
+    """Swap in freshly built columns, readers holding the previous ones keep a consistent copy"""
+    global _candidate_store
+    with _candidate_store_lock:
+        _candidate_store = candidate_store
@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from config.config import EMBEDDING_CACHE_SIZE
+
+
+class CachedEncoder:
+    """
+    Encodes each distinct text once per call and remembers recent text -> vector results.
+
+    Duplicate texts in a call (many users share the same location and interests) are encoded
+    once and their vector scattered back to every position. Vectors of recently seen texts are
+    kept in a bounded LRU, so later calls only encode texts missing from it.
+    Any other attribute is read from the wrapped encoder, so it can stand in for it.
+    """
+
+    def __init__(self, encoder, max_entries=EMBEDDING_CACHE_SIZE):
+        self.encoder = encoder
+        self.max_entries = max_entries
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.duplicates = 0
+
+    def __getattr__(self, name):
+        # Only called for attributes the cache does not define itself
+        return getattr(self.encoder, name)
+
+    def encode(self, texts, show_progress_bar=False):
+        """
+        Encode texts, reusing cached vectors and encoding duplicates once
+        Args:
+            texts (list): Texts to encode
+            show_progress_bar (bool): Forwarded to the wrapped encoder
+        Returns:
+            np.ndarray: (len(texts), dim) float32 embeddings
+        """
+        texts = list(texts)
+        if not texts:
+            return np.asarray(self.encoder.encode(texts), dtype=np.float32)
+
+        unique_texts, inverse = np.unique(np.array(texts, dtype=object), return_inverse=True)
+        unique_texts = unique_texts.tolist()
+
+        with self._lock:
+            cached = [self._vectors.get(text) for text in unique_texts]
+            for text, vector in zip(unique_texts, cached):
+                if vector is not None:
+                    self._vectors.move_to_end(text)
+            hit_count = sum(vector is not None for vector in cached)
+            self.hits += hit_count
+            self.misses += len(unique_texts) - hit_count
+            self.duplicates += len(texts) - len(unique_texts)
+
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        if missing:
+            encoded = np.asarray(
+                self.encoder.encode([unique_texts[i] for i in missing], show_progress_bar=show_progress_bar),
+                dtype=np.float32
+            )
+            for i, vector in zip(missing, encoded):
+                cached[i] = vector
+            self._remember([unique_texts[i] for i in missing], encoded)
+
+        return np.stack(cached)[inverse.ravel()]
+
+    def _remember(self, texts, vectors):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            # Only the most recent max_entries of a large call can stay anyway
+            for text, vector in zip(texts[-self.max_entries:], vectors[-self.max_entries:]):
+                self._vectors[text] = vector.copy()
+                self._vectors.move_to_end(text)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Counters for monitoring, hit rate is over distinct texts looked up"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._vectors),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "duplicates_skipped": self.duplicates,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,128 @@
+import sys
+import queue
+import threading
+import numpy as np
+import psycopg2
+from psycopg2.extras import DictCursor
+from utils.exception import CustomException
+from utils.logger import logging
+from config.config import POSTGRES_HOST, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_PORT
+from model.embedding_store import get_embedding_store
+from model.recommendation_model import get_profile_encoder, get_encoder_name, build_profile_text
+from model.field_embeddings import PROFILE_FIELDS, get_field_stores, field_texts
+
+# user_profile columns that feed the profile text or a field store, writes to them make an embedding stale
+EMBEDDED_PROFILE_FIELDS = {'location', 'interest', 'interests'} | set(PROFILE_FIELDS)
+# Maximum number of users re-embedded in one encode call
+REFRESH_BATCH_SIZE = 64
+# How long the worker keeps collecting users after the first one arrives
+REFRESH_BATCH_WINDOW_SECONDS = 0.5
+
+_refresh_queue = queue.Queue()
+_worker_lock = threading.Lock()
+_worker_thread = None
+
+
+def enqueue_embedding_refresh(user_id):
+    """
+    Mark a user's embedding as stale so the background worker re-embeds it.
+    Never raises: a failed enqueue only delays freshness until the next full sync.
+    """
+    try:
+        _ensure_worker()
+        _refresh_queue.put(int(user_id))
+        logging.info(f"Queued embedding refresh for user {user_id}")
+    except Exception as e:
+        logging.error(f"Error queueing embedding refresh for user {user_id}: {str(e)}")
+
+
+def _ensure_worker():
+    """Start the refresh worker in this process if it is not running (e.g. after a gunicorn fork)"""
+    global _worker_thread
+    if _worker_thread is not None and _worker_thread.is_alive():
+        return
+
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=_run_worker, name="embedding-refresh", daemon=True)
+            _worker_thread.start()
+            logging.info("Embedding refresh worker started")
+
+
+def _next_batch():
+    """Block for the first stale user, then collect more until the batch is full or the window closes"""
+    batch = {_refresh_queue.get()}
+    while len(batch) < REFRESH_BATCH_SIZE:
+        try:
+            batch.add(_refresh_queue.get(timeout=REFRESH_BATCH_WINDOW_SECONDS))
+        except queue.Empty:
+            break
+    return sorted(batch)
+
+
+def _run_worker():
+    while True:
+        user_ids = _next_batch()
+        try:
+            refresh_embeddings(user_ids)
+        except Exception as e:
+            logging.error(f"Embedding refresh failed for users {user_ids}: {str(e)}")
+
+
+def refresh_embeddings(user_ids):
+    """
+    Re-embed the given users through the shared embedding model, one encode call per store.
+    Only the profile text and fields whose text changed are encoded again.
+    Args:
+        user_ids (list): Users whose profile changed
+    Returns:
+        int: Number of embeddings written
+    """
+    try:
+        connection = psycopg2.connect(
+            host=POSTGRES_HOST,
+            database=POSTGRES_DB,
+            user=POSTGRES_USER,
+            password=POSTGRES_PASSWORD,
+            port=POSTGRES_PORT
+        )
+        try:
+            cursor = connection.cursor(cursor_factory=DictCursor)
+            cursor.execute('''
+                SELECT
+                    user_id, location, interest AS interests, bio, occupation,
+                    (
+                        SELECT string_agg(v #>> '{}', ' ')
+                        FROM jsonb_path_query(prompts::jsonb, 'strict $.**') AS v
+                        WHERE jsonb_typeof(v) = 'string'
+                    ) AS prompts
+                FROM user_profile
+                WHERE user_id = ANY(%s)
+                AND (location IS NOT NULL OR interest IS NOT NULL)
+            ''', (list(user_ids),))
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+
+        if not rows:
+            return 0
+
+        encoder = get_profile_encoder()
+        encoder_name = get_encoder_name(encoder)
+        user_ids = np.array([row['user_id'] for row in rows], dtype=np.int64)
+        written = get_embedding_store().upsert(
+            user_ids,
+            [build_profile_text(row['location'], row['interests']) for row in rows],
+            encoder,
+            encoder_name
+        )
+        # A cleared field keeps its old vector until the next full sync drops it
+        for field, field_store in get_field_stores().items():
+            present, texts = field_texts([row[field] for row in rows])
+            written += field_store.upsert(user_ids[present], texts, encoder, encoder_name)
+        logging.info(f"Refreshed {written} profile and field embeddings for {len(rows)} users")
+        return written
+    except Exception as e:
+        logging.error(f"Error refreshing embeddings: {str(e)}")
+        raise CustomException(e, sys)
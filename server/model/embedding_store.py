@@ -0,0 +1,725 @@
+import os
+import sys
+import copy
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+from utils.exception import CustomException
+from utils.logger import logging
+from config.config import (
+    EMBEDDING_STORE_DIR, EMBEDDING_PRECISION, ANN_N_LISTS, ANN_N_PROBE,
+    EMBEDDING_DELTA_ROWS, EMBEDDING_DELTA_MAX_BATCHES, EMBEDDING_DELTA_MAX_SECONDS
+)
+from model.similarity_search import normalize_rows, top_k
+from model.quantization import PRECISIONS, RERANK_FACTOR, quantize, quantized_top_k
+from model.ann_index import IVFIndex
+
+# Layout of the store directory:
+#   CURRENT               "<version> <rows> <batches>": the live version, how many of its rows are
+#                         published and how many delta batches were appended to it; swapped atomically
+#   .lock                 serializes writers across processes
+#   .sync-leader          held for life by the one process that runs the startup full sync
+#   v<ns>-<pid>/          one version
+#       meta.json         encoder name, base row count, row capacity, dimension, precision of the codes
+#       user_ids.npy      header mapping row -> user_id: the base rows sorted, then the delta rows
+#       hashes.npy        profile text hash per row
+#       vectors.npy       (capacity, dim) float32, memory-mapped read-only by every worker
+#       codes.npy         float16/int8 copy of vectors.npy when a reduced precision is configured
+#       scales.npy        per-row int8 scales
+# Every file holds EMBEDDING_DELTA_ROWS reserved rows behind the base rows. Re-embedded profiles
+# are appended there and published by moving the row count in CURRENT, so published rows are
+# never written again and a profile's older row stays in place, superseded by its newest one.
+STORE_POINTER_FILE = "CURRENT"
+STORE_LOCK_FILE = ".lock"
+SYNC_LEADER_FILE = ".sync-leader"
+# Versions kept on disk, so a reader that just read CURRENT can still open the previous one
+KEPT_VERSIONS = 2
+# Per-row files of a version, appended to together
+ROW_FILES = ("user_ids", "hashes", "vectors", "codes", "scales")
+
+# Lock and global instance shared by every RecommendationModel in the process
+store_lock = threading.Lock()
+_embedding_store = None
+# Open while this process is the sync leader, see claim_sync_leader()
+_sync_leader_file = None
+
+
+def claim_sync_leader(directory=EMBEDDING_STORE_DIR):
+    """
+    Elect this process to run the full profile sync, so forked API workers do not each repeat it.
+    The claim is a non-blocking flock held until the process exits, a worker forked after the
+    leader died takes over.
+    Returns:
+        bool: True when this process is (now) the leader
+    """
+    global _sync_leader_file
+    if _sync_leader_file is not None:
+        return True
+    os.makedirs(directory, exist_ok=True)
+    leader_file = open(os.path.join(directory, SYNC_LEADER_FILE), "w")
+    try:
+        fcntl.flock(leader_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        leader_file.close()
+        return False
+    _sync_leader_file = leader_file
+    return True
+
+
+def hash_profile_texts(texts):
+    """
+    Fingerprint profile texts so unchanged profiles can skip re-encoding.
+    Args:
+        texts (list): Profile texts
+    Returns:
+        np.ndarray: uint64 hash per text
+    """
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little") for text in texts),
+        dtype=np.uint64,
+        count=len(texts)
+    )
+
+
+def latest_rows(user_ids):
+    """
+    The last occurrence of every user in an append-ordered id column
+    Returns:
+        tuple: (sorted unique user_ids, position of each one's last occurrence)
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    unique_ids, first_from_end = np.unique(user_ids[::-1], return_index=True)
+    return unique_ids, len(user_ids) - 1 - first_from_end
+
+
+def save_rows(path, rows, capacity):
+    """Save rows as an .npy file with room for capacity rows, the reserved ones are left unwritten (sparse)"""
+    if capacity == len(rows) or not rows.itemsize or not np.prod(rows.shape[1:], dtype=np.int64):
+        np.save(path, rows)
+        return
+    column = np.lib.format.open_memmap(path, mode="w+", dtype=rows.dtype, shape=(capacity,) + rows.shape[1:])
+    column[:len(rows)] = rows
+    column.flush()
+    del column
+
+
+class EmbeddingStore:
+    """
+    Profile embeddings keyed by user_id and a hash of the profile text, persisted on disk.
+    Vectors are stored L2-normalized.
+
+    A full write produces a new version and swaps the CURRENT pointer, so the vector matrix
+    can be memory-mapped read-only and its pages shared by all gunicorn workers through the
+    page cache instead of being copied into each process. Upserts of a few profiles append to
+    the live version's delta segment instead and only touch the rows they add; the delta is
+    folded into a new full version on a coalesced schedule (see EMBEDDING_DELTA_MAX_BATCHES).
+
+    Base rows are sorted by user_id and delta rows follow in append order, so look rows up
+    with lookup(), index_of() or rows_of() rather than by searching user_ids, and leave
+    superseded_rows out of any scan over vectors.
+    """
+
+    def __init__(self, directory=EMBEDDING_STORE_DIR, precision=EMBEDDING_PRECISION):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unsupported embedding precision {precision!r}, expected one of {PRECISIONS}")
+        self.directory = directory
+        self.precision = precision
+        self.lock = threading.RLock()
+        self.version = None
+        self.encoder_name = None
+        # Rows of the version written in full, the delta segment starts after them
+        self.base_count = 0
+        self.delta_batches = 0
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        # Reduced precision copy of vectors scanned instead of them, None in float32 mode
+        self.codes = None
+        self.scales = None
+        # Rows whose user has a newer row in the delta segment, sorted
+        self.superseded_rows = np.empty(0, dtype=np.int64)
+        # Users in the delta segment, sorted, and the row of their newest vector
+        self._delta_ids = np.empty(0, dtype=np.int64)
+        self._delta_rows = np.empty(0, dtype=np.int64)
+        # Whole mapped files of the version (capacity rows) the attributes above are views of
+        self._columns = {}
+        self._capacity = 0
+        # Precision of the codes file the version was written with
+        self._version_precision = None
+        # Codes quantized in this process because the version was written at another precision
+        self._local_codes = False
+        # Approximate nearest-neighbour index, built on first use and kept in sync incrementally
+        self.index = None
+
+    def __len__(self):
+        """Published rows, superseded ones included, i.e. the length of vectors"""
+        return len(self.user_ids)
+
+    def _current_pointer(self):
+        """(version, published rows or None for the base rows only, delta batches) from CURRENT"""
+        try:
+            with open(os.path.join(self.directory, STORE_POINTER_FILE)) as f:
+                parts = f.read().split()
+        except FileNotFoundError:
+            return None
+        if not parts:
+            return None
+        rows = int(parts[1]) if len(parts) > 1 else None
+        return parts[0], rows, int(parts[2]) if len(parts) > 2 else 0
+
+    def _write_pointer(self, version, rows, batches):
+        tmp_pointer = os.path.join(self.directory, f"{STORE_POINTER_FILE}.{os.getpid()}.tmp")
+        with open(tmp_pointer, "w") as f:
+            f.write(f"{version} {rows} {batches}")
+        os.replace(tmp_pointer, os.path.join(self.directory, STORE_POINTER_FILE))
+
+    def _read_version(self, version):
+        """meta.json of a version and its per-row files mapped whole"""
+        version_dir = os.path.join(self.directory, version)
+        with open(os.path.join(version_dir, "meta.json")) as f:
+            meta = json.load(f)
+        meta.setdefault("capacity", meta["count"])
+        meta.setdefault("precision", "float32")
+        if not meta["capacity"] or not meta["dim"]:
+            # An empty file cannot be mapped
+            return meta, {
+                "user_ids": np.empty(0, dtype=np.int64),
+                "hashes": np.empty(0, dtype=np.uint64),
+                "vectors": np.empty((0, meta["dim"]), dtype=np.float32)
+            }
+
+        columns = {name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode="r") for name in ("user_ids", "hashes", "vectors")}
+        if meta["precision"] != "float32":
+            columns["codes"] = np.load(os.path.join(version_dir, "codes.npy"), mmap_mode="r")
+            if meta["precision"] == "int8":
+                columns["scales"] = np.load(os.path.join(version_dir, "scales.npy"), mmap_mode="r")
+        return meta, columns
+
+    def load(self):
+        """Map the persisted store if one exists"""
+        self.refresh()
+        if self.version is None:
+            logging.info(f"No embedding store found at {self.directory}, starting empty")
+        return self
+
+    def refresh(self):
+        """
+        Map the live version if another process (or thread) replaced it since the last call,
+        or only the rows appended to its delta segment when it is still the same version.
+        Returns:
+            bool: True when newer rows were mapped
+        """
+        try:
+            pointer = self._current_pointer()
+            if pointer is None:
+                return False
+            version, rows, batches = pointer
+            if version == self.version:
+                if rows is None or rows == len(self.user_ids):
+                    return False
+                with self.lock:
+                    appended = self._extend(rows, batches)
+                logging.info(f"Mapped {appended} delta rows of embedding store version {version}")
+                return True
+
+            try:
+                meta, columns = self._read_version(version)
+            except FileNotFoundError:
+                # Pruned between reading CURRENT and opening it, the pointer has moved on
+                version, rows, batches = self._current_pointer()
+                meta, columns = self._read_version(version)
+
+            with self.lock:
+                self._apply(version, meta, columns, meta["count"] if rows is None else rows, batches)
+            logging.info(f"Mapped embedding store version {version} with {len(self)} rows")
+            return True
+        except Exception as e:
+            logging.error(f"Error loading embedding store: {str(e)}")
+            raise CustomException(e, sys)
+
+    def _set_rows(self, rows):
+        """Expose the first rows of the mapped files and index the delta segment, must hold self.lock"""
+        columns = self._columns
+        self.user_ids = columns["user_ids"][:rows]
+        self.hashes = columns["hashes"][:rows]
+        self.vectors = columns["vectors"][:rows]
+        self.codes, self.scales, self._local_codes = None, None, False
+        if self.precision != "float32" and rows:
+            if self._version_precision == self.precision:
+                self.codes = columns["codes"][:rows]
+                self.scales = columns["scales"][:rows] if "scales" in columns else None
+            else:
+                # Written by a process configured differently, quantize locally (all rows, on every append)
+                self.codes, self.scales = quantize(self.vectors, self.precision)
+                self._local_codes = True
+
+        # A user appears at most once among the base rows, its newest row wins
+        delta_ids, delta_last = latest_rows(self.user_ids[self.base_count:])
+        self._delta_ids = delta_ids
+        self._delta_rows = self.base_count + delta_last
+        base_rows, in_base = self._search_base(delta_ids)
+        superseded_delta = np.setdiff1d(np.arange(self.base_count, rows), self._delta_rows, assume_unique=True)
+        self.superseded_rows = np.sort(np.concatenate([base_rows[in_base], superseded_delta]))
+
+    def _search_base(self, user_ids):
+        """Rows of users among the sorted base rows, clipped into range, and whether they were found"""
+        base = self.user_ids[:self.base_count]
+        if not len(base):
+            return np.zeros(len(user_ids), dtype=np.int64), np.zeros(len(user_ids), dtype=bool)
+        rows = np.minimum(np.searchsorted(base, user_ids), len(base) - 1)
+        return rows, base[rows] == user_ids
+
+    def _extend(self, rows, batches):
+        """Map rows appended to the live version's delta segment and index them, must hold self.lock"""
+        start = len(self.user_ids)
+        self._set_rows(rows)
+        self.delta_batches = batches
+        if self.index is not None:
+            appended_ids, last = latest_rows(self.user_ids[start:])
+            self.index.add(appended_ids, self.vectors[start + last])
+        return rows - start
+
+    def _apply(self, version, meta, columns, rows, batches):
+        """Swap in another version and patch the ANN index with what changed, must hold self.lock"""
+        # The arrays are swapped, not modified, so a shallow copy keeps answering for the old version
+        previous = copy.copy(self) if self.index is not None else None
+
+        self._columns = columns
+        self._capacity = meta["capacity"]
+        self._version_precision = meta["precision"]
+        self.base_count = meta["count"]
+        self.delta_batches = batches
+        self.encoder_name = meta["encoder_name"]
+        self.version = version
+        self._set_rows(rows)
+
+        if previous is not None:
+            if previous.encoder_name != self.encoder_name:
+                self.index = None
+            else:
+                user_ids, rows = self.live()
+                unchanged, _ = previous._diff(user_ids, self.hashes[rows])
+                changed = np.flatnonzero(~unchanged)
+                self.index.remove(np.setdiff1d(previous.live_user_ids(), user_ids, assume_unique=True).tolist())
+                self.index.add(user_ids[changed], self.vectors[rows[changed]])
+
+    def _write_version(self, encoder_name, user_ids, hashes, vectors):
+        """Persist a new full version with room for a delta segment and atomically point CURRENT at it"""
+        version = f"v{time.time_ns():020d}-{os.getpid()}"
+        version_dir = os.path.join(self.directory, version)
+        os.makedirs(version_dir)
+        capacity = len(user_ids) + EMBEDDING_DELTA_ROWS if vectors.shape[1] else len(user_ids)
+        save_rows(os.path.join(version_dir, "user_ids.npy"), user_ids, capacity)
+        save_rows(os.path.join(version_dir, "hashes.npy"), hashes, capacity)
+        save_rows(os.path.join(version_dir, "vectors.npy"), vectors, capacity)
+        if self.precision != "float32" and capacity:
+            codes, scales = quantize(vectors, self.precision)
+            save_rows(os.path.join(version_dir, "codes.npy"), codes, capacity)
+            if scales is not None:
+                save_rows(os.path.join(version_dir, "scales.npy"), scales, capacity)
+        with open(os.path.join(version_dir, "meta.json"), "w") as f:
+            json.dump({
+                "encoder_name": encoder_name,
+                "count": len(user_ids),
+                "capacity": capacity,
+                "dim": int(vectors.shape[1]),
+                "precision": self.precision if capacity else "float32"
+            }, f)
+
+        self._write_pointer(version, len(user_ids), 0)
+        logging.info(f"Saved embedding store version {version} with {len(user_ids)} profiles")
+
+        # Workers still mapping a pruned version keep their mapping, unlinked files stay readable
+        versions = sorted(name for name in os.listdir(self.directory) if name.startswith("v"))
+        for name in versions[:-KEPT_VERSIONS]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def _append(self, user_ids, hashes, vectors):
+        """
+        Write rows into the live version's reserved rows and publish them, must hold the write lock.
+        Only the appended rows are written, readers map them with the next refresh().
+        """
+        start = len(self.user_ids)
+        end = start + len(user_ids)
+        rows = {"user_ids": user_ids, "hashes": hashes, "vectors": vectors}
+        if self._version_precision != "float32":
+            # Codes at the precision the version was written with, whatever this process scans
+            rows["codes"], scales = quantize(vectors, self._version_precision)
+            if scales is not None:
+                rows["scales"] = scales
+
+        version_dir = os.path.join(self.directory, self.version)
+        for name in ROW_FILES:
+            if name not in rows:
+                continue
+            column = np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode="r+")
+            column[start:end] = rows[name]
+            column.flush()
+            del column
+
+        self._write_pointer(self.version, end, self.delta_batches + 1)
+        logging.info(f"Appended {len(user_ids)} profiles to the delta segment of embedding store version {self.version}")
+        self.refresh()
+
+    def _fold_due(self):
+        """Whether the delta segment is due to be folded into a full version"""
+        if not self.delta_batches:
+            return False
+        written_at = int(self.version[1:].split("-")[0]) / 1e9
+        return self.delta_batches >= EMBEDDING_DELTA_MAX_BATCHES or time.time() - written_at >= EMBEDDING_DELTA_MAX_SECONDS
+
+    def _fold(self, encoder_name, user_ids=None, hashes=None, vectors=None):
+        """Write the live rows, with the given ones replacing or joining them, as a new full version"""
+        live_ids, live_rows = self.live()
+        parts = [(live_ids, self.hashes[live_rows], self.vectors[live_rows])] if len(live_ids) else []
+        if user_ids is not None:
+            parts.append((user_ids, hashes, vectors))
+        merged_ids = np.concatenate([part[0] for part in parts]) if parts else np.empty(0, dtype=np.int64)
+        # The given rows come last, so they win over the live ones
+        merged_ids, keep = latest_rows(merged_ids)
+        merged_hashes = np.concatenate([part[1] for part in parts])[keep] if parts else np.empty(0, dtype=np.uint64)
+        merged_vectors = np.concatenate([part[2] for part in parts])[keep] if parts else np.empty((0, self.vectors.shape[1]), dtype=np.float32)
+        self._commit(encoder_name, merged_ids, merged_hashes, merged_vectors)
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize writers across threads and processes, and start from the live version"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock, open(os.path.join(self.directory, STORE_LOCK_FILE), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _commit(self, encoder_name, user_ids, hashes, vectors):
+        """Write a new version and map it read-only, dropping the in-memory copy"""
+        try:
+            self._write_version(encoder_name, user_ids, hashes, vectors)
+        except Exception as e:
+            logging.error(f"Error saving embedding store: {str(e)}")
+            raise CustomException(e, sys)
+        self.refresh()
+
+    def lookup(self, user_ids):
+        """
+        Rows of users, their newest row when the delta segment holds one
+        Returns:
+            tuple: (rows, mask of users found), rows of users not found are in range but meaningless
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        rows, present = self._search_base(user_ids)
+        if len(self._delta_ids) and len(user_ids):
+            positions = np.minimum(np.searchsorted(self._delta_ids, user_ids), len(self._delta_ids) - 1)
+            in_delta = self._delta_ids[positions] == user_ids
+            rows = np.where(in_delta, self._delta_rows[positions], rows)
+            present = present | in_delta
+        return rows, present
+
+    def live(self):
+        """
+        Every stored user once, with the row of their newest vector
+        Returns:
+            tuple: (sorted user_ids, their rows)
+        """
+        if not len(self._delta_ids):
+            return self.user_ids, np.arange(len(self.user_ids))
+        user_ids = np.union1d(self.user_ids[:self.base_count], self._delta_ids)
+        return user_ids, self.lookup(user_ids)[0]
+
+    def live_user_ids(self):
+        """Every stored user once, sorted"""
+        return self.live()[0]
+
+    def index_of(self, user_id):
+        """Row of a user in the store, or None if the user has no embedding"""
+        rows, present = self.lookup([user_id])
+        return int(rows[0]) if present[0] else None
+
+    def rows_of(self, user_ids):
+        """Rows of the given users that have an embedding, users missing from the store are dropped"""
+        rows, present = self.lookup(user_ids)
+        return rows[present]
+
+    def vectors_for(self, user_ids):
+        """Stored vectors of users known to be in the store"""
+        return self.vectors[self.lookup(user_ids)[0]]
+
+    @property
+    def persisted_codes(self):
+        """True when the scanned codes are the version's codes file, which other processes can map"""
+        return self.codes is not None and not self._local_codes
+
+    def approximate_vectors_for(self, user_ids):
+        """Dequantized codes of users known to be in the store, their float32 vectors without codes"""
+        if self.codes is None:
+            return self.vectors_for(user_ids)
+        rows = self.lookup(user_ids)[0]
+        vectors = self.codes[rows].astype(np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][:, None]
+        return vectors
+
+    def ann_search(self, query, k, exclude_ids=None):
+        """
+        Approximate top-k through the ANN index. At reduced precision the probed buckets are
+        scored on the codes and the best candidates reranked in float32.
+        Returns:
+            tuple: (user_ids, scores) ordered from most to least similar
+        """
+        with self.lock:
+            index = self.get_index()
+            if self.codes is None:
+                return index.search(query, k, self.vectors_for, exclude_ids=exclude_ids)
+            return index.search(query, k, self.approximate_vectors_for, exclude_ids=exclude_ids,
+                                rerank_for=self.vectors_for, rerank_factor=RERANK_FACTOR)
+
+    def _diff(self, user_ids, hashes):
+        """Mask of rows that are unchanged in the current store, and their current row numbers"""
+        if not len(self.user_ids):
+            return np.zeros(len(user_ids), dtype=bool), np.zeros(len(user_ids), dtype=np.int64)
+        rows, present = self.lookup(user_ids)
+        return present & (self.hashes[rows] == hashes), rows
+
+    def excluding_superseded(self, exclude=None):
+        """Rows a scan over vectors must skip: the given ones and every superseded row"""
+        if not len(self.superseded_rows):
+            return exclude
+        if exclude is None:
+            return self.superseded_rows
+        return np.concatenate([np.asarray(exclude, dtype=np.int64).ravel(), self.superseded_rows])
+
+    def top_k(self, query, k, exclude=None):
+        """
+        Exact scan of every stored vector, at the configured precision.
+        Reduced precisions scan the codes and rerank the best candidates in float32.
+        Returns:
+            tuple: (rows, similarity scores) ordered from most to least similar
+        """
+        with self.lock:
+            exclude = self.excluding_superseded(exclude)
+            if self.codes is None:
+                return top_k(self.vectors @ query, k, exclude=exclude)
+            return quantized_top_k(self.codes, self.scales, self.vectors, query, k, exclude=exclude)
+
+    def sync(self, user_ids, texts, encoder, encoder_name):
+        """
+        Bring the store in line with the current set of profiles.
+        Only new or changed profiles are encoded; users missing from user_ids are dropped.
+        Args:
+            user_ids (array-like): user_id of every profile
+            texts (list): Profile text of every profile, aligned with user_ids
+            encoder: Object exposing encode(texts, show_progress_bar=False)
+            encoder_name (str): Identity of the encoder, a different encoder invalidates every vector
+        Returns:
+            int: Number of profiles that were (re-)encoded
+        """
+        return self.sync_chunks([(user_ids, texts)], encoder, encoder_name)
+
+    def sync_chunks(self, chunks, encoder, encoder_name):
+        """
+        Same as sync() for profiles streamed in chunks, e.g. straight from a database cursor.
+        Each chunk is hashed and its new or changed profiles encoded as it arrives, so only the
+        user_ids, hashes and vectors of the whole set are kept, never every profile text.
+        Args:
+            chunks (iterable): (user_ids, texts) pairs, together covering every profile once
+            encoder: Object exposing encode(texts, show_progress_bar=False)
+            encoder_name (str): Identity of the encoder, a different encoder invalidates every vector
+        Returns:
+            int: Number of profiles that were (re-)encoded
+        """
+        with self.syncing(encoder, encoder_name) as sync:
+            for user_ids, texts in chunks:
+                sync.add(user_ids, texts)
+        return sync.encoded
+
+    @contextmanager
+    def syncing(self, encoder, encoder_name):
+        """
+        Stage the chunks fed to the yielded StoreSync without holding any lock, and commit them
+        under the write lock when the block exits without an error. Lets one profile stream
+        sync several stores while requests keep ranking on the live version.
+        """
+        sync = StoreSync(self, encoder, encoder_name)
+        yield sync
+        with self._write_lock():
+            sync.commit()
+
+    def upsert(self, user_ids, texts, encoder, encoder_name):
+        """
+        Encode and store the given profiles, leaving every other row untouched.
+        The rows are appended to the delta segment, which is folded into a new full version
+        once it is due or full.
+        Args:
+            user_ids (array-like): Users whose profile changed
+            texts (list): Their current profile text, aligned with user_ids
+            encoder: Object exposing encode(texts, show_progress_bar=False)
+            encoder_name (str): Identity of the encoder
+        Returns:
+            int: Number of profiles written, profiles whose text did not change are skipped
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if len(user_ids) == 0:
+            return 0
+
+        hashes = hash_profile_texts(texts)
+        with self.lock:
+            if encoder_name == self.encoder_name:
+                # A write that left the embedded text as it was needs no encode
+                unchanged, _ = self._diff(user_ids, hashes)
+                changed = np.flatnonzero(~unchanged)
+                user_ids, hashes, texts = user_ids[changed], hashes[changed], [texts[i] for i in changed]
+        if len(user_ids) == 0:
+            return 0
+        encoded = normalize_rows(encoder.encode(list(texts), show_progress_bar=False))
+
+        with self._write_lock():
+            if len(self.user_ids) and encoder_name != self.encoder_name:
+                # Mixing vector spaces would corrupt ranking, the next full sync re-encodes everything
+                logging.warning(f"Skipping upsert of {len(user_ids)} profiles, store holds {self.encoder_name} vectors")
+                return 0
+
+            if self.version is not None and encoder_name == self.encoder_name and len(self) + len(user_ids) <= self._capacity:
+                self._append(user_ids, hashes, encoded)
+                if self._fold_due():
+                    self._fold(encoder_name)
+            else:
+                self._fold(encoder_name, user_ids, hashes, encoded)
+            return len(user_ids)
+
+    def get_index(self):
+        """
+        Approximate nearest-neighbour index over the stored vectors.
+        Built on first use and retrained once the store has doubled since the last training.
+        """
+        with self.lock:
+            if self.index is None or len(self) > 2 * self.index.trained_size:
+                logging.info(f"Building ANN index over {len(self)} profile embeddings")
+                user_ids, rows = self.live()
+                vectors = self.vectors[rows] if len(self.superseded_rows) else self.vectors
+                self.index = IVFIndex(n_lists=ANN_N_LISTS or None, n_probe=ANN_N_PROBE).build(user_ids, vectors)
+            return self.index
+
+
+class StoreSync:
+    """
+    One sync of an EmbeddingStore, fed chunk by chunk. Chunks are hashed and encoded into a
+    staging buffer with the store lock held only to copy the unchanged vectors; commit() runs
+    under the write lock created by EmbeddingStore.syncing() and keeps profiles another writer
+    re-embedded meanwhile.
+    """
+
+    def __init__(self, store, encoder, encoder_name):
+        self.store = store
+        self.encoder = encoder
+        self.encoder_name = encoder_name
+        self.parts = []
+        # Users stored when staging began, a user stored since then was written by someone else
+        self.base_ids = None
+        # Profiles (re-)encoded, set by commit()
+        self.encoded = 0
+
+    def add(self, user_ids, texts):
+        """Hash a chunk of profiles, copy the vectors of the unchanged ones and encode the others"""
+        store = self.store
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if not len(user_ids):
+            return
+        hashes = hash_profile_texts(texts)
+        with store.lock:
+            if self.base_ids is None:
+                self.base_ids = store.live_user_ids().copy()
+            if len(store.user_ids):
+                rows, base_present = store.lookup(user_ids)
+                base_hashes = store.hashes[rows]
+            else:
+                rows, base_present = np.zeros(len(user_ids), dtype=np.int64), np.zeros(len(user_ids), dtype=bool)
+                base_hashes = np.zeros(len(user_ids), dtype=np.uint64)
+            known = base_present & (base_hashes == hashes)
+            if self.encoder_name != store.encoder_name:
+                known[:] = False
+            known_vectors = np.array(store.vectors[rows[known]]) if known.any() else None
+
+        encoded = None
+        stale = np.flatnonzero(~known)
+        if len(stale):
+            logging.info(f"Encoding {len(stale)} new or changed profiles")
+            encoded = normalize_rows(self.encoder.encode([texts[i] for i in stale], show_progress_bar=False))
+        self.parts.append((user_ids, hashes, known, known_vectors, encoded, base_present, base_hashes))
+
+    def commit(self):
+        """
+        Write the staged chunks as the new version, unless nothing changed and there is no delta
+        to fold. Must hold the write lock.
+        """
+        store, parts = self.store, self.parts
+        total = sum(len(part[0]) for part in parts)
+        stale_count = sum(int((~part[2]).sum()) for part in parts)
+        if stale_count == 0 and total == len(store) and not store.delta_batches:
+            return 0
+
+        dim = next((part[4].shape[1] for part in parts if part[4] is not None),
+                   next((part[3].shape[1] for part in parts if part[3] is not None), store.vectors.shape[1]))
+        user_ids = np.concatenate([part[0] for part in parts]) if parts else np.empty(0, dtype=np.int64)
+        hashes = np.concatenate([part[1] for part in parts]) if parts else np.empty(0, dtype=np.uint64)
+        vectors = np.empty((total, dim), dtype=np.float32)
+        offset = 0
+        for part_ids, _, known, known_vectors, encoded, _, _ in parts:
+            block = vectors[offset:offset + len(part_ids)]
+            if known_vectors is not None:
+                block[known] = known_vectors
+            if encoded is not None:
+                block[~known] = encoded
+            offset += len(part_ids)
+
+        if len(store.user_ids) and store.encoder_name == self.encoder_name:
+            user_ids, hashes, vectors = self._keep_concurrent_writes(parts, user_ids, hashes, vectors)
+
+        # Streamed profiles usually arrive ordered by user_id, avoid copying the matrix then
+        if len(user_ids) > 1 and (np.diff(user_ids) < 0).any():
+            order = np.argsort(user_ids, kind="stable")
+            user_ids, hashes, vectors = user_ids[order], hashes[order], vectors[order]
+
+        store._commit(self.encoder_name, user_ids, hashes, vectors)
+        self.encoded = stale_count
+        return stale_count
+
+    def _keep_concurrent_writes(self, parts, user_ids, hashes, vectors):
+        """Take the live row of every profile written since it was staged, and of every profile added since staging began"""
+        store = self.store
+        base_present = np.concatenate([part[5] for part in parts])
+        base_hashes = np.concatenate([part[6] for part in parts])
+        rows, present = store.lookup(user_ids)
+        live_hashes = store.hashes[rows]
+        rewritten = np.flatnonzero(present & (~base_present | (live_hashes != base_hashes)) & (live_hashes != hashes))
+        if len(rewritten):
+            hashes[rewritten] = live_hashes[rewritten]
+            vectors[rewritten] = store.vectors[rows[rewritten]]
+
+        live_ids, live_rows = store.live()
+        added = ~np.isin(live_ids, self.base_ids if self.base_ids is not None else []) & ~np.isin(live_ids, user_ids)
+        if added.any():
+            logging.info(f"Keeping {int(added.sum())} profiles stored while the sync ran")
+            user_ids = np.concatenate([user_ids, live_ids[added]])
+            hashes = np.concatenate([hashes, store.hashes[live_rows[added]]])
+            vectors = np.concatenate([vectors, store.vectors[live_rows[added]]])
+        return user_ids, hashes, vectors
+
+
+def get_embedding_store():
+    """Get the process-wide embedding store, mapping the latest version another process may have written"""
+    global _embedding_store
+    if _embedding_store is None:
+        with store_lock:
+            if _embedding_store is None:
+                _embedding_store = EmbeddingStore().load()
+                return _embedding_store
+
+    _embedding_store.refresh()
+    return _embedding_store
@@ -0,0 +1,85 @@
+import os
+import threading
+import numpy as np
+from config.config import EMBEDDING_STORE_DIR, EMBEDDING_FIELD_WEIGHTS
+from model.embedding_store import EmbeddingStore
+
+# Profile fields embedded on their own, next to the location and interests profile text.
+# Each has its own store, so editing a bio re-encodes the bio only.
+PROFILE_FIELDS = ("bio", "occupation", "prompts")
+FIELD_STORE_DIR = os.path.join(EMBEDDING_STORE_DIR, "fields")
+
+_field_stores_lock = threading.Lock()
+_field_stores = None
+
+
+def enabled_fields(weights=EMBEDDING_FIELD_WEIGHTS):
+    """Fields with a non-zero weight, the others are neither encoded nor scored"""
+    return [field for field in PROFILE_FIELDS if weights.get(field, 0)]
+
+
+def open_field_stores(directory=FIELD_STORE_DIR, weights=EMBEDDING_FIELD_WEIGHTS):
+    """Map the store of every enabled field, e.g. in a batch worker process"""
+    return {field: EmbeddingStore(os.path.join(directory, field)).load() for field in enabled_fields(weights)}
+
+
+def get_field_stores():
+    """Get the process-wide field stores, mapping versions another process may have written"""
+    global _field_stores
+    if _field_stores is None:
+        with _field_stores_lock:
+            if _field_stores is None:
+                _field_stores = open_field_stores()
+                return _field_stores
+
+    for store in _field_stores.values():
+        store.refresh()
+    return _field_stores
+
+
+def field_texts(values):
+    """
+    Embeddable texts of one field column
+    Args:
+        values (array-like): Field values, None or blank where missing
+    Returns:
+        tuple: (mask of profiles with a value, their stripped texts)
+    """
+    values = np.asarray(values, dtype=object)
+    present = ~np.equal(values, None)
+    texts = np.char.strip(values[present].astype(str))
+    filled = texts != ''
+    present[np.flatnonzero(present)[~filled]] = False
+    return present, texts[filled].tolist()
+
+
+def blend_field_similarity(field_stores, user_id, candidate_ids, similarity, weights=EMBEDDING_FIELD_WEIGHTS):
+    """
+    Combine the profile similarity of candidates with the similarity of each embedded field.
+    A field missing on either side drops out of that candidate's weighted mean.
+    Args:
+        field_stores (dict): field -> EmbeddingStore
+        user_id (int): Requesting user
+        candidate_ids (np.ndarray): Candidates
+        similarity (np.ndarray): Their profile similarity
+        weights (dict): Weight of the profile and of each field
+    Returns:
+        np.ndarray: float32 weighted mean per candidate, on the cosine scale
+    """
+    candidate_ids = np.asarray(candidate_ids, dtype=np.int64)
+    scores = weights.get("profile", 1.0) * np.asarray(similarity, dtype=np.float32)
+    total = np.full(len(candidate_ids), weights.get("profile", 1.0), dtype=np.float32)
+    for field, store in field_stores.items():
+        weight = weights.get(field, 0)
+        if not weight:
+            continue
+        with store.lock:
+            user_idx = store.index_of(user_id)
+            if user_idx is None or not len(candidate_ids):
+                continue
+            rows, present = store.lookup(candidate_ids)
+            field_similarity = np.zeros(len(candidate_ids), dtype=np.float32)
+            field_similarity[present] = store.vectors[rows[present]] @ store.vectors[user_idx]
+        scores += weight * field_similarity
+        total += weight * present
+    return np.divide(scores, total, out=np.zeros_like(scores), where=total > 0)
@@ -0,0 +1,100 @@
+import re
+import hashlib
+import numpy as np
+from model.similarity_search import normalize_rows
+
+# Same width as all-MiniLM-L6-v2, so either encoder fits the embedding store
+HASHING_ENCODER_DIM = 384
+# Token -> (bucket, sign) entries kept before the cache is reset
+HASHING_CACHE_SIZE = 100_000
+# Relative weight of the location features against the interest features
+LOCATION_WEIGHT = 1.0
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Start of the texts built by build_profile_text(), any other text is free text such as a bio
+PROFILE_TEXT_PREFIX = "location: "
+
+
+class HashingEncoder:
+    """
+    Deterministic encoder built from a profile's location and interest tokens with the
+    hashing trick: every token is hashed into one of `dim` signed buckets, so no vocabulary
+    has to be fitted and the same profile text always maps to the same vector.
+
+    Profiles sharing a location or interests get a high cosine similarity, which makes it a
+    meaningful degraded mode when the SentenceTransformer cannot be loaded, and a cheap
+    first-stage retriever. Free-text fields (bio, occupation, prompts) are encoded as a bag of
+    their words, so they match on shared words only.
+    """
+
+    def __init__(self, dim=HASHING_ENCODER_DIM):
+        self.dim = dim
+        self.name = f"hashing-v2-{dim}"
+        self._features = {}
+
+    def _feature(self, token):
+        """Bucket and sign of a token, stable across processes unlike hash()"""
+        feature = self._features.get(token)
+        if feature is None:
+            digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            feature = (digest % self.dim, 1.0 if digest >> 63 else -1.0)
+            if len(self._features) >= HASHING_CACHE_SIZE:
+                self._features.clear()
+            self._features[token] = feature
+        return feature
+
+    @staticmethod
+    def tokenize(text):
+        """
+        Namespaced tokens of a profile text built by build_profile_text(), or the words of a
+        free-text field
+        Args:
+            text (str): 'Location: <location> Interests: <interests>', or e.g. a bio
+        Returns:
+            tuple: (tokens, weights) lists
+        """
+        text = text.lower()
+        if not text.startswith(PROFILE_TEXT_PREFIX):
+            words = [f"word:{word}" for word in TOKEN_PATTERN.findall(text)]
+            return words, [1.0] * len(words)
+
+        location, _, interests = text.partition(" interests: ")
+        location = location.removeprefix(PROFILE_TEXT_PREFIX)
+        location_words = TOKEN_PATTERN.findall(location)
+
+        # The whole location as one feature as well, so 'new york' and 'york' are not equivalent
+        tokens = [f"loc:{word}" for word in location_words] + [f"place:{' '.join(location_words)}"]
+        weights = [LOCATION_WEIGHT] * len(tokens)
+        interest_tokens = [f"int:{word}" for word in TOKEN_PATTERN.findall(interests)]
+        return tokens + interest_tokens, weights + [1.0] * len(interest_tokens)
+
+    def encode(self, texts, show_progress_bar=False):
+        """
+        Encode profile texts into L2-normalized vectors
+        Args:
+            texts (list): Profile texts
+            show_progress_bar (bool): Accepted for SentenceTransformer compatibility, ignored
+        Returns:
+            np.ndarray: (len(texts), dim) float32 vectors
+        """
+        tokens, weights, counts = [], [], []
+        for text in texts:
+            text_tokens, text_weights = self.tokenize(text)
+            tokens.extend(text_tokens)
+            weights.extend(text_weights)
+            counts.append(len(text_tokens))
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not tokens:
+            return vectors
+
+        # Hash each distinct token once, then scatter every occurrence in one pass
+        vocabulary, inverse = np.unique(np.array(tokens), return_inverse=True)
+        features = np.array([self._feature(token) for token in vocabulary.tolist()], dtype=np.float64).reshape(-1, 2)
+        buckets = features[inverse, 0].astype(np.int64)
+        values = (features[inverse, 1] * np.array(weights)).astype(np.float32)
+        rows = np.repeat(np.arange(len(texts)), counts)
+
+        # Colliding tokens accumulate in their shared bucket
+        np.add.at(vectors, (rows, buckets), values)
+        return normalize_rows(vectors)
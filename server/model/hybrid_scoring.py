@@ -0,0 +1,79 @@
+import numpy as np
+from config.config import HYBRID_WEIGHTS
+from model.candidate_store import popcount
+from model.similarity_search import top_k
+
+# Tenure levels run from 0 (account younger than 3 months) to 2 (older than 6 months)
+MAX_TENURE_LEVEL = 2
+
+
+def interest_jaccard(query_bits, query_count, candidate_bits, candidate_counts):
+    """
+    Jaccard overlap between one user's interest bitset and every candidate's
+    Args:
+        query_bits (np.ndarray): (words,) uint64 bitset of the requesting user
+        query_count (int): Interests of the requesting user
+        candidate_bits (np.ndarray): (n, words) uint64 bitsets
+        candidate_counts (np.ndarray): (n,) interests per candidate
+    Returns:
+        np.ndarray: (n,) float32 overlap in [0, 1], 0 when neither side has interests
+    """
+    overlap = popcount(candidate_bits & query_bits).sum(axis=1)
+    union = candidate_counts + query_count - overlap
+    return np.divide(overlap, union, out=np.zeros(len(overlap), dtype=np.float32), where=union > 0).astype(np.float32)
+
+
+def hybrid_scores(similarity, jaccard, verified, level, weights=HYBRID_WEIGHTS):
+    """
+    Weighted mean of the ranking signals of a candidate set, one numpy pass
+    Args:
+        similarity (np.ndarray): Cosine similarity per candidate
+        jaccard (np.ndarray): Interest overlap per candidate
+        verified (np.ndarray): Verified flag per candidate
+        level (np.ndarray): Tenure level per candidate
+        weights (dict): Weight of similarity, interests, verified and tenure
+    Returns:
+        np.ndarray: float32 score per candidate, on the scale of the similarity
+    """
+    total = sum(weights.values()) or 1.0
+    scores = (
+        weights["similarity"] * np.asarray(similarity, dtype=np.float32)
+        + weights["interests"] * jaccard
+        + weights["verified"] * np.asarray(verified, dtype=np.float32)
+        + weights["tenure"] * (np.asarray(level, dtype=np.float32) / MAX_TENURE_LEVEL)
+    )
+    return scores / np.float32(total)
+
+
+def rerank_candidates(candidate_store, user_id, candidate_ids, similarity, limit, weights=HYBRID_WEIGHTS):
+    """
+    Re-order candidates retrieved by embedding similarity with the hybrid score
+    Args:
+        candidate_store (CandidateStore): Columns of every profile
+        user_id (int): Requesting user
+        candidate_ids (np.ndarray): Candidates ranked by similarity
+        similarity (np.ndarray): Their cosine similarity
+        limit (int): Number of recommendations
+        weights (dict): Weight of each signal
+    Returns:
+        tuple: (user_ids, hybrid scores) of the best limit candidates, best first
+    """
+    rows, present = candidate_store.rows_of(candidate_ids)
+    query_rows, query_present = candidate_store.rows_of([user_id])
+    if query_present[0]:
+        query_bits = candidate_store.interest_bits[query_rows[0]]
+        query_count = candidate_store.interest_counts[query_rows[0]]
+        jaccard = interest_jaccard(query_bits, query_count, candidate_store.interest_bits[rows], candidate_store.interest_counts[rows])
+    else:
+        jaccard = np.zeros(len(rows), dtype=np.float32)
+
+    # Profiles created after the columns were built score on similarity alone
+    scores = hybrid_scores(
+        similarity,
+        np.where(present, jaccard, 0),
+        candidate_store.verified[rows] & present,
+        np.where(present, candidate_store.level[rows], 0),
+        weights
+    )
+    idx, scores = top_k(scores, limit)
+    return np.asarray(candidate_ids)[idx], scores
@@ -0,0 +1,118 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
+from utils.logger import logging
+
+# Texts encoded together at most, and the largest request that still goes through the queue
+INFERENCE_BATCH_SIZE = 64
+# How long the scheduler keeps collecting requests after the first one arrives
+INFERENCE_BATCH_WAIT_SECONDS = 0.005
+
+
+class InferenceBatcher:
+    """
+    Coalesces concurrent encode() calls into one batched encode on the wrapped encoder.
+
+    Callers block on encode() as before; a scheduler thread collects their requests for up to
+    max_wait_seconds or max_batch_size texts, runs a single encode over all of them and hands
+    every caller back its own rows. Requests that are already a full batch skip the queue.
+    Any other attribute is read from the wrapped encoder, so the batcher can stand in for it.
+    """
+
+    def __init__(self, encoder, max_batch_size=INFERENCE_BATCH_SIZE, max_wait_seconds=INFERENCE_BATCH_WAIT_SECONDS):
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._requests = queue.Queue()
+        self._worker_lock = threading.Lock()
+        self._worker_thread = None
+        # Carried over when a request does not fit in the batch being collected
+        self._pending = None
+        # Callers currently inside encode(), the scheduler stops waiting once all of them are batched
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Only called for attributes the batcher does not define itself
+        return getattr(self.encoder, name)
+
+    def encode(self, texts, show_progress_bar=False):
+        """
+        Encode texts, batched with whatever other threads are encoding at the same time
+        Args:
+            texts (list): Texts to encode
+            show_progress_bar (bool): Forwarded to the encoder for requests that skip the queue
+        Returns:
+            np.ndarray: (len(texts), dim) embeddings
+        """
+        texts = list(texts)
+        if len(texts) >= self.max_batch_size:
+            return self.encoder.encode(texts, show_progress_bar=show_progress_bar)
+        if not texts:
+            return self.encoder.encode(texts)
+
+        self._ensure_worker()
+        future = Future()
+        with self._waiting_lock:
+            self._waiting += 1
+        try:
+            self._requests.put((texts, future))
+            return future.result()
+        finally:
+            with self._waiting_lock:
+                self._waiting -= 1
+
+    def _ensure_worker(self):
+        """Start the scheduler in this process if it is not running (e.g. after a gunicorn fork)"""
+        if self._worker_thread is not None and self._worker_thread.is_alive():
+            return
+
+        with self._worker_lock:
+            if self._worker_thread is None or not self._worker_thread.is_alive():
+                self._worker_thread = threading.Thread(target=self._run_worker, name="inference-batcher", daemon=True)
+                self._worker_thread.start()
+                logging.info("Inference batcher started")
+
+    def _next_batch(self):
+        """
+        Block for the first request, then collect more until the batch is full, the wait is over
+        or every caller currently waiting is in the batch (a lone caller is not delayed)
+        """
+        first = self._pending if self._pending is not None else self._requests.get()
+        self._pending = None
+        batch = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.max_wait_seconds
+        while size < self.max_batch_size and len(batch) < self._waiting:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if size + len(request[0]) > self.max_batch_size:
+                self._pending = request
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _run_worker(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                embeddings = np.asarray(self.encoder.encode([text for texts, _ in batch for text in texts]))
+            except Exception as e:
+                logging.error(f"Batched encode of {len(batch)} requests failed: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            # Fan the rows back out in request order
+            offset = 0
+            for texts, future in batch:
+                future.set_result(embeddings[offset:offset + len(texts)])
+                offset += len(texts)
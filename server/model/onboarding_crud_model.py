@@ -6,6 +6,8 @@ from utils.exception import CustomException
 import sys
 from flask_jwt_extended import get_jwt_identity
 import json
+from model.embedding_refresh import EMBEDDED_PROFILE_FIELDS, enqueue_embedding_refresh
+from model.recommendation_cache import invalidate_recommendations
 
 
 class UserUpdateDetailmodel:
@@ -58,6 +60,10 @@ class UserUpdateDetailmodel:
             '''
             self.cursor.execute(query, (user_id, value))
             self.connection.commit()
+
+            if field_name in EMBEDDED_PROFILE_FIELDS:
+                enqueue_embedding_refresh(user_id)
+                invalidate_recommendations(user_id)
             return {"status": "success"}
             
         except Exception as e:
@@ -0,0 +1,62 @@
+import numpy as np
+from model.similarity_search import top_k
+
+PRECISIONS = ("float32", "float16", "int8")
+# Rows dequantized per block while scanning, keeps the float32 temporary in cache
+SCAN_BLOCK_SIZE = 1024
+# Quantized scoring keeps this many candidates per requested result for the float32 rerank
+RERANK_FACTOR = 4
+
+
+def quantize(vectors, precision):
+    """
+    Compress L2-normalized vectors for scanning.
+    Args:
+        vectors (np.ndarray): (n, dim) float32 vectors
+        precision (str): 'float16' or 'int8'
+    Returns:
+        tuple: (codes, scales), scales is the per-row int8 step size or None for float16
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if precision == "float16":
+        return vectors.astype(np.float16), None
+    if precision == "int8":
+        # Symmetric per-row scalar quantization
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unsupported precision {precision!r}, expected one of {PRECISIONS}")
+
+
+def quantized_scores(codes, scales, query):
+    """Approximate inner products of a float32 query against quantized rows, dequantizing block by block"""
+    query = np.asarray(query, dtype=np.float32)
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCAN_BLOCK_SIZE):
+        block = codes[start:start + SCAN_BLOCK_SIZE]
+        scores[start:start + len(block)] = block.astype(np.float32) @ query
+    if scales is not None:
+        scores *= scales
+    return scores
+
+
+def quantized_top_k(codes, scales, vectors, query, k, exclude=None):
+    """
+    Top-k by scanning quantized codes, then reranking the best candidates in float32.
+    Only the reranked rows of the float32 matrix are read, so a memory-mapped matrix
+    stays mostly on disk.
+    Args:
+        codes (np.ndarray): Quantized rows from quantize()
+        scales (np.ndarray or None): Per-row scales from quantize()
+        vectors (np.ndarray): Full precision (n, dim) rows aligned with codes
+        query (np.ndarray): (dim,) normalized float32 query
+        k (int): Number of results
+        exclude (int or array-like, optional): Rows that must not be returned
+    Returns:
+        tuple: (rows, float32 scores) ordered from most to least similar
+    """
+    candidates, _ = top_k(quantized_scores(codes, scales, query), k * RERANK_FACTOR, exclude=exclude)
+    candidates = np.sort(candidates)
+    idx, scores = top_k(vectors[candidates] @ query, k)
+    return candidates[idx], scores
@@ -0,0 +1,65 @@
+import numpy as np
+from model.similarity_search import normalize_rows
+
+
+def preference_vectors(store, candidate_store, user_ids):
+    """
+    What each user swipes right on: the normalized mean embedding of the profiles they liked
+    Args:
+        store (EmbeddingStore): Embeddings of the liked profiles
+        candidate_store (CandidateStore): Right swipes of every profile
+        user_ids (array-like): Users to build preference vectors for
+    Returns:
+        tuple: ((len(user_ids), dim) float32 vectors, mask of users with at least one embedded right swipe)
+    """
+    owners, targets = candidate_store.right_swipes_of(user_ids)
+    preferences = np.zeros((len(user_ids), store.vectors.shape[1]), dtype=np.float32)
+    if not len(targets) or not len(store):
+        return preferences, np.zeros(len(user_ids), dtype=bool)
+
+    rows, embedded = store.lookup(targets)
+    owners, rows = owners[embedded], rows[embedded]
+    if not len(owners):
+        return preferences, np.zeros(len(user_ids), dtype=bool)
+
+    # Swipes come grouped by owner, so each owner's vectors are summed as one contiguous slice
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    preferences[owners[starts]] = np.add.reduceat(store.vectors[rows], starts, axis=0)
+    has_preference = np.zeros(len(user_ids), dtype=bool)
+    has_preference[owners[starts]] = True
+    return normalize_rows(preferences), has_preference
+
+
+def reciprocal_similarity(store, candidate_store, user_id, candidate_ids, feedback=None):
+    """
+    Two-sided score of candidates: the harmonic mean of how well each candidate fits what the
+    user likes and how well the user fits what each candidate likes. A side without right
+    swipes falls back to its own embedding, the user's side is then moved by their swipe
+    feedback like their ranking query. Must hold store.lock.
+    Args:
+        store (EmbeddingStore): Embeddings of the user and the candidates
+        candidate_store (CandidateStore): Right swipes of every profile
+        user_id (int): Requesting user
+        candidate_ids (np.ndarray): Candidates, all present in the store
+        feedback (np.ndarray, optional): Weighted swipe feedback of the user, see FeedbackStore.offset_for()
+    Returns:
+        np.ndarray: float32 score per candidate on the cosine scale [-1, 1]
+    """
+    candidate_ids = np.asarray(candidate_ids, dtype=np.int64)
+    user_vector = store.vectors[store.index_of(user_id)]
+    candidate_vectors = store.vectors_for(candidate_ids)
+
+    # One matrix product per direction over the whole candidate set
+    preferences, has_preference = preference_vectors(store, candidate_store, np.append(candidate_ids, user_id))
+    user_preference = preferences[-1] if has_preference[-1] else user_vector
+    if feedback is not None:
+        user_preference = normalize_rows(user_preference + feedback)
+    forward = candidate_vectors @ user_preference
+    backward_preferences = np.where(has_preference[:-1, None], preferences[:-1], candidate_vectors)
+    backward = backward_preferences @ user_vector
+
+    # Harmonic mean on [0, 1], so one side that would not like the other drags the pair down
+    forward, backward = (forward + 1) / 2, (backward + 1) / 2
+    total = forward + backward
+    harmonic = np.divide(2 * forward * backward, total, out=np.zeros_like(total), where=total > 0)
+    return (2 * harmonic - 1).astype(np.float32)
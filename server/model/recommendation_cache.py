@@ -0,0 +1,254 @@
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+from utils.exception import CustomException
+from utils.logger import logging
+from utils.fake_redis import FakeRedis, ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError, WatchError
+from config.config import (
+    RECOMMENDATION_CACHE_BACKEND, RECOMMENDATION_CACHE_TTL_SECONDS, RECOMMENDATION_CACHE_SIZE, REDIS_URL,
+    REDIS_SOCKET_TIMEOUT_SECONDS, REDIS_RETRY_SECONDS
+)
+
+# Redis keys: the cached feed, and when it was last invalidated
+REDIS_FEED_KEY = "recommendations:feed:{}"
+REDIS_INVALIDATED_KEY = "recommendations:invalidated:{}"
+
+_cache_lock = threading.Lock()
+_recommendation_cache = None
+
+
+class LocalCacheBackend:
+    """
+    In-process LRU of ranked feeds with a TTL.
+    Each gunicorn worker has its own copy, so an invalidation only reaches the worker that
+    handled the write; other workers would serve their entry until it expires. Only for a
+    single worker process, gunicorn refuses to start with it and more workers.
+    """
+
+    def __init__(self, ttl_seconds=RECOMMENDATION_CACHE_TTL_SECONDS, max_entries=RECOMMENDATION_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._feeds = OrderedDict()
+        # user_id -> time of the last invalidation, dropped once older than the TTL
+        self._invalidated = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._feeds.get(user_id)
+            if entry is None:
+                return None
+            if entry["expires_at"] <= time.time():
+                del self._feeds[user_id]
+                return None
+            self._feeds.move_to_end(user_id)
+            return entry["recommended_ids"], entry["similarity_scores"]
+
+    def set(self, user_id, recommended_ids, similarity_scores, computed_at):
+        if self.max_entries <= 0:
+            return False
+        now = time.time()
+        with self._lock:
+            if self._invalidated.get(user_id, 0) >= computed_at:
+                return False
+            self._feeds[user_id] = {
+                "recommended_ids": list(recommended_ids),
+                "similarity_scores": list(similarity_scores),
+                "expires_at": now + self.ttl_seconds
+            }
+            self._feeds.move_to_end(user_id)
+            while len(self._feeds) > self.max_entries:
+                self._feeds.popitem(last=False)
+            return True
+
+    def invalidate(self, user_ids):
+        now = time.time()
+        with self._lock:
+            for user_id in user_ids:
+                self._feeds.pop(user_id, None)
+                self._invalidated[user_id] = now
+            # A feed computed before an invalidation older than the TTL is stale anyway
+            if len(self._invalidated) > self.max_entries:
+                cutoff = now - self.ttl_seconds
+                self._invalidated = {user_id: at for user_id, at in self._invalidated.items() if at > cutoff}
+
+
+class RedisCacheBackend:
+    """
+    Ranked feeds in Redis, shared by every worker and process.
+    Entries expire through the key TTL; invalidation deletes the feed and leaves a marker for
+    the same TTL so a computation that started before the write does not cache its result.
+    A call that cannot reach Redis counts as a miss, and the cache is skipped for
+    REDIS_RETRY_SECONDS so requests do not each wait for the timeout.
+    """
+
+    def __init__(self, client=None, ttl_seconds=RECOMMENDATION_CACHE_TTL_SECONDS, retry_seconds=REDIS_RETRY_SECONDS):
+        if client is None:
+            # Imported here so the local backend does not need the redis package
+            import redis
+            client = redis.Redis.from_url(
+                REDIS_URL, socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS, socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS
+            )
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        # time.time() before which Redis is not called after it was unreachable
+        self._retry_at = 0.0
+
+    def _available(self):
+        return time.time() >= self._retry_at
+
+    def _unreachable(self, action, e):
+        self._retry_at = time.time() + self.retry_seconds
+        logging.warning(f"Redis unreachable while {action}, skipping the recommendation cache for {self.retry_seconds}s: {str(e)}")
+
+    def get(self, user_id):
+        if not self._available():
+            return None
+        try:
+            value = self.client.get(REDIS_FEED_KEY.format(user_id))
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            self._unreachable("reading a feed", e)
+            return None
+        if value is None:
+            return None
+        entry = json.loads(value)
+        return entry["recommended_ids"], entry["similarity_scores"]
+
+    def set(self, user_id, recommended_ids, similarity_scores, computed_at):
+        if not self._available():
+            return False
+        invalidated_key = REDIS_INVALIDATED_KEY.format(user_id)
+        payload = json.dumps({
+            "recommended_ids": list(recommended_ids),
+            "similarity_scores": list(similarity_scores)
+        })
+        try:
+            with self.client.pipeline() as pipeline:
+                # An invalidation landing between the check and the write aborts the transaction
+                pipeline.watch(invalidated_key)
+                invalidated_at = pipeline.get(invalidated_key)
+                if invalidated_at is not None and float(invalidated_at) >= computed_at:
+                    return False
+                pipeline.multi()
+                pipeline.setex(REDIS_FEED_KEY.format(user_id), self.ttl_seconds, payload)
+                pipeline.execute()
+        except WatchError:
+            return False
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            self._unreachable("caching a feed", e)
+            return False
+        return True
+
+    def invalidate(self, user_ids):
+        if not self._available():
+            logging.warning(f"Redis unreachable, cached feeds of users {user_ids} stay until their TTL")
+            return
+        now = str(time.time())
+        pipeline = self.client.pipeline()
+        for user_id in user_ids:
+            pipeline.delete(REDIS_FEED_KEY.format(user_id))
+            pipeline.setex(REDIS_INVALIDATED_KEY.format(user_id), self.ttl_seconds, now)
+        try:
+            pipeline.execute()
+        except (RedisConnectionError, RedisTimeoutError) as e:
+            self._unreachable("invalidating feeds", e)
+
+
+class RecommendationCache:
+    """
+    Ranked recommendation ids and scores per user, served instead of recomputing the feed.
+    Backend errors are logged and treated as misses, the cache never fails a request.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        """
+        Cached feed of a user
+        Returns:
+            tuple or None: (recommended user_ids, similarity scores), None on a miss
+        """
+        try:
+            cached = self.backend.get(int(user_id))
+        except Exception as e:
+            logging.error(f"Error reading cached recommendations for user {user_id}: {str(e)}")
+            cached = None
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return cached
+
+    def set(self, user_id, recommended_ids, similarity_scores, computed_at):
+        """
+        Cache a feed unless the user was invalidated after its computation started
+        Args:
+            user_id (int): Requesting user
+            recommended_ids (list): Ranked user_ids
+            similarity_scores (list): Their scores
+            computed_at (float): time.time() when the computation started
+        """
+        try:
+            self.backend.set(int(user_id), recommended_ids, similarity_scores, computed_at)
+        except Exception as e:
+            logging.error(f"Error caching recommendations for user {user_id}: {str(e)}")
+
+    def invalidate(self, *user_ids):
+        """Drop the cached feeds of users affected by a profile change, swipe or match"""
+        try:
+            self.backend.invalidate([int(user_id) for user_id in user_ids])
+            self.invalidations += len(user_ids)
+        except Exception as e:
+            logging.error(f"Error invalidating cached recommendations for users {user_ids}: {str(e)}")
+
+    def stats(self):
+        """Counters of this process for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations
+        }
+
+
+def get_recommendation_cache():
+    """Get the process-wide recommendation cache, backend picked by RECOMMENDATION_CACHE_BACKEND"""
+    global _recommendation_cache
+    if _recommendation_cache is None:
+        with _cache_lock:
+            if _recommendation_cache is None:
+                try:
+                    if RECOMMENDATION_CACHE_BACKEND == "redis":
+                        backend = RedisCacheBackend()
+                    elif RECOMMENDATION_CACHE_BACKEND == "fakeredis":
+                        backend = RedisCacheBackend(FakeRedis())
+                    elif RECOMMENDATION_CACHE_BACKEND == "local":
+                        backend = LocalCacheBackend()
+                    else:
+                        raise ValueError(f"Unsupported recommendation cache backend {RECOMMENDATION_CACHE_BACKEND!r}, expected 'redis', 'local' or 'fakeredis'")
+                except Exception as e:
+                    logging.error(f"Error creating recommendation cache: {str(e)}")
+                    raise CustomException(e, sys)
+                _recommendation_cache = RecommendationCache(backend)
+                logging.info(f"Recommendation cache using {type(backend).__name__}")
+    return _recommendation_cache
+
+
+def invalidate_recommendations(*user_ids):
+    """
+    Drop cached feeds after a write that changes them.
+    Never raises: a failed invalidation only leaves a feed stale until its TTL.
+    """
+    try:
+        get_recommendation_cache().invalidate(*user_ids)
+    except Exception as e:
+        logging.error(f"Error invalidating cached recommendations for users {user_ids}: {str(e)}")
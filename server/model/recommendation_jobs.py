@@ -0,0 +1,238 @@
+import sys
+import json
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from psycopg2.extras import DictCursor
+from utils.exception import CustomException
+from utils.logger import logging
+from config.config import (
+    POSTGRES_HOST, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_PORT,
+    RECOMMENDATION_JOB_WORKERS, RECOMMENDATION_JOB_TIMEOUT_SECONDS, RECOMMENDATION_JOB_RETENTION_SECONDS,
+    SOCKETIO_MESSAGE_QUEUE
+)
+from model.recommendation_model import RecommendationModel, read_recommendation_feed, is_embedding_model_loaded
+
+# Socket.IO event sent to the room of the user whose feed is ready (room "user_<id>")
+RECOMMENDATIONS_READY_EVENT = 'recommendations_ready'
+PENDING_STATES = ('queued', 'running')
+
+_executor_lock = threading.Lock()
+_executor = None
+# One RecommendationModel (and database connection) per job thread, cursors are not thread safe
+_thread_state = threading.local()
+_socketio_emitter = None
+
+
+def _connect():
+    return psycopg2.connect(
+        host=POSTGRES_HOST,
+        database=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        port=POSTGRES_PORT
+    )
+
+
+def _get_executor():
+    """Job threads of this process, created on first use so every gunicorn worker gets its own"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=RECOMMENDATION_JOB_WORKERS, thread_name_prefix="recommendation-job")
+                logging.info(f"Recommendation job pool started with {RECOMMENDATION_JOB_WORKERS} threads")
+    return _executor
+
+
+def _get_thread_model():
+    model = getattr(_thread_state, 'model', None)
+    if model is None or model.connection.closed:
+        model = RecommendationModel()
+        _thread_state.model = model
+    return model
+
+
+def submit_recommendation_job(flask_app, user_id, filters=None):
+    """
+    Queue the computation of a user's feed and return at once.
+    A user with a job still queued or running for the same filters gets that job back
+    instead of a second one.
+    Args:
+        flask_app: Flask app the job runs in, the model answers with jsonify()
+        user_id (int): Requesting user
+        filters (dict, optional): Preference filters from parse_preference_filters()
+    Returns:
+        str: job_id to poll with get_recommendation_job()
+    """
+    try:
+        connection = _connect()
+        try:
+            filters_json = json.dumps(filters, sort_keys=True) if filters else None
+            cursor = connection.cursor()
+            cursor.execute('''
+                SELECT job_id FROM recommendation_jobs
+                WHERE user_id = %s
+                AND status IN %s
+                AND created_at > NOW() - make_interval(secs => %s)
+                AND filters IS NOT DISTINCT FROM %s::jsonb
+                ORDER BY created_at DESC
+                LIMIT 1
+            ''', (user_id, PENDING_STATES, RECOMMENDATION_JOB_TIMEOUT_SECONDS, filters_json))
+            pending = cursor.fetchone()
+            if pending:
+                logging.info(f"Recommendation job {pending[0]} already pending for user {user_id}")
+                return str(pending[0])
+
+            # The user's expired jobs go with the new one, so active users never pile them up
+            cursor.execute('''
+                DELETE FROM recommendation_jobs
+                WHERE user_id = %s
+                AND created_at < NOW() - make_interval(secs => %s)
+            ''', (user_id, RECOMMENDATION_JOB_RETENTION_SECONDS))
+            job_id = str(uuid.uuid4())
+            cursor.execute('''
+                INSERT INTO recommendation_jobs (job_id, user_id, status, filters)
+                VALUES (%s, %s, 'queued', %s)
+            ''', (job_id, user_id, filters_json))
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+
+        _get_executor().submit(_run_job, flask_app, job_id, user_id, filters)
+        logging.info(f"Queued recommendation job {job_id} for user {user_id}")
+        return job_id
+    except Exception as e:
+        logging.error(f"Error queueing recommendation job for user {user_id}: {str(e)}")
+        raise CustomException(e, sys)
+
+
+def purge_recommendation_jobs(connection):
+    """
+    Delete every job older than RECOMMENDATION_JOB_RETENTION_SECONDS, finished or abandoned
+    by a worker that died, e.g. from the batch job
+    Returns:
+        int: Number of jobs deleted
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('''
+            DELETE FROM recommendation_jobs
+            WHERE created_at < NOW() - make_interval(secs => %s)
+        ''', (RECOMMENDATION_JOB_RETENTION_SECONDS,))
+        deleted = cursor.rowcount
+    connection.commit()
+    logging.info(f"Purged {deleted} expired recommendation jobs")
+    return deleted
+
+
+def _set_job_status(model, job_id, status, error=None, debug=None, result=None, degraded=False):
+    model.cursor.execute('''
+        UPDATE recommendation_jobs
+        SET status = %s,
+            error = %s,
+            debug = COALESCE(%s::jsonb, debug),
+            result = COALESCE(%s::jsonb, result),
+            degraded = %s,
+            finished_at = CASE WHEN %s IN ('done', 'failed') THEN CURRENT_TIMESTAMP END
+        WHERE job_id = %s
+    ''', (status, error, json.dumps(debug) if debug is not None else None,
+          json.dumps(result) if result is not None else None, degraded, status, job_id))
+    model.connection.commit()
+
+
+def _run_job(flask_app, job_id, user_id, filters=None):
+    """Compute and store a user's feed on a job thread, then tell the user it is ready"""
+    try:
+        model = _get_thread_model()
+        _set_job_status(model, job_id, 'running')
+        with flask_app.app_context():
+            if is_embedding_model_loaded():
+                response, status_code = model.user_recommendation_model(user_id, filters)
+            else:
+                # Do not hold the job for the model load, finish it with a degraded feed
+                response, status_code = model.degraded_recommendations(user_id, filters)
+        if status_code == 200:
+            body = response.get_json()
+            # A filtered feed is not stored as the user's feed, the job keeps it
+            result = {key: body[key] for key in ('recommended_users', 'similarity_scores')} if filters else None
+            # Stage timings of the ranking pipeline, returned with the job
+            _set_job_status(model, job_id, 'done', debug=body.get('debug'), result=result, degraded=body.get('degraded', False))
+            notify_recommendations_ready(user_id, job_id)
+        else:
+            _set_job_status(model, job_id, 'failed', response.get_json().get('message'))
+        logging.info(f"Recommendation job {job_id} for user {user_id} finished with status {status_code}")
+    except Exception as e:
+        logging.error(f"Recommendation job {job_id} for user {user_id} failed: {str(e)}")
+        try:
+            model = _get_thread_model()
+            model.connection.rollback()
+            _set_job_status(model, job_id, 'failed', str(e))
+        except Exception as status_error:
+            logging.error(f"Error marking recommendation job {job_id} as failed: {str(status_error)}")
+
+
+def notify_recommendations_ready(user_id, job_id):
+    """
+    Emit RECOMMENDATIONS_READY_EVENT to the user's Socket.IO room through the message queue
+    shared with the socket server. Without SOCKETIO_MESSAGE_QUEUE clients only poll.
+    """
+    global _socketio_emitter
+    if not SOCKETIO_MESSAGE_QUEUE:
+        return
+    try:
+        if _socketio_emitter is None:
+            from flask_socketio import SocketIO
+            _socketio_emitter = SocketIO(message_queue=SOCKETIO_MESSAGE_QUEUE)
+        _socketio_emitter.emit(RECOMMENDATIONS_READY_EVENT, {"job_id": job_id}, room=f"user_{user_id}")
+    except Exception as e:
+        logging.error(f"Error notifying user {user_id} of recommendation job {job_id}: {str(e)}")
+
+
+def get_recommendation_job(job_id, user_id):
+    """
+    State of one of a user's recommendation jobs, with the feed once it is done
+    Args:
+        job_id (str): Job returned by submit_recommendation_job()
+        user_id (int): Requesting user, other users' jobs are not found
+    Returns:
+        dict or None: job_id, state, error, debug (stage timings of the ranking), degraded (answered
+            while the embedding model was loading, see degraded_recommendations()) and, when done,
+            recommended_users and similarity_scores: the job's own list when it ranked with
+            preference filters, the user's stored feed otherwise
+    """
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return None
+
+    try:
+        connection = _connect()
+        try:
+            cursor = connection.cursor(cursor_factory=DictCursor)
+            cursor.execute('''
+                SELECT status, error, debug, result, degraded,
+                       created_at < NOW() - make_interval(secs => %s) AS expired
+                FROM recommendation_jobs
+                WHERE job_id = %s AND user_id = %s
+            ''', (RECOMMENDATION_JOB_TIMEOUT_SECONDS, job_id, user_id))
+            job = cursor.fetchone()
+            if job is None:
+                return None
+
+            result = {"job_id": job_id, "state": job['status'], "error": job['error'], "debug": job['debug'], "degraded": job['degraded']}
+            if job['status'] in PENDING_STATES and job['expired']:
+                # The worker running it went away, a new POST queues a fresh job
+                result.update(state='failed', error='Job timed out')
+            elif job['status'] == 'done' and job['result'] is not None:
+                result.update(job['result'])
+            elif job['status'] == 'done':
+                result["recommended_users"], result["similarity_scores"] = read_recommendation_feed(cursor, user_id)
+            cursor.close()
+            return result
+        finally:
+            connection.close()
+    except Exception as e:
+        logging.error(f"Error reading recommendation job {job_id}: {str(e)}")
+        raise CustomException(e, sys)
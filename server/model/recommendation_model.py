@@ -1,32 +1,692 @@
 import os
 import sys
 import psycopg2
-from psycopg2.extras import DictCursor
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+from psycopg2.extras import DictCursor, execute_values
 import numpy as np
 from utils.exception import CustomException
 from utils.logger import logging
-from config.config import POSTGRES_HOST, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_PORT
+from model.embedding_store import get_embedding_store, claim_sync_leader
+from model.hashing_encoder import HashingEncoder
+from model.inference_batcher import InferenceBatcher
+from model.embedding_cache import CachedEncoder
+from model.recommendation_cache import get_recommendation_cache
+from model.candidate_store import CandidateStoreBuilder, get_candidate_store, set_candidate_store
+from model.hybrid_scoring import rerank_candidates
+from model.reciprocal_scoring import reciprocal_similarity
+from model.field_embeddings import get_field_stores, field_texts, blend_field_similarity
+from model.swipe_feedback import get_feedback_store
+from model.sharded_search import get_sharded_scanner, scan_top_k, quantized_scan_top_k
+from model.similarity_search import normalize_rows, top_k
+from config.config import POSTGRES_HOST, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_PORT, ANN_MIN_PROFILES, PROFILE_LOAD_CHUNK_SIZE, CANDIDATE_STORE_REFRESH_SECONDS, HYBRID_CANDIDATE_POOL, RECIPROCAL_SCORING, RECOMMENDATION_RETRIEVERS, RETRIEVAL_POOL_SIZE
 from flask import jsonify
 import time
 import threading
+from contextlib import ExitStack
 
 # Create a lock for the model loading
 model_lock = threading.Lock()
 # Global variable to hold the model
 _embedding_model = None
+# The model behind the text cache and micro-batching scheduler shared by request and refresh threads
+_profile_encoder = None
+_profile_encoder_model = None
+# Background thread loading the model at boot, and how the load went
+_model_loader_start_lock = threading.Lock()
+_model_loader_thread = None
+_model_load_started_at = None
+_model_load_seconds = None
+# Background thread syncing the embedding stores and rebuilding the candidate columns of this process
+_profile_sync_start_lock = threading.Lock()
+_profile_sync_thread = None
 # Number of retries for model loading
 MAX_MODEL_LOAD_RETRIES = 3
+# SentenceTransformer used for profile embeddings
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+# Rows per multi-row INSERT statement when writing recommendation feeds
+RECOMMENDATION_INSERT_PAGE_SIZE = 1000
 
-# Dummy encoder for fallback
-class DummyEncoder:
-    """Fallback encoder when HuggingFace model fails to load"""
-    def encode(self, texts, show_progress_bar=False):
-        """Create random vectors for texts - not meaningful but allows basic service"""
-        logging.warning(f"Using DummyEncoder for {len(texts)} texts")
-        # Create random embeddings of size 384 (same as all-MiniLM-L6-v2)
-        return np.random.rand(len(texts), 384)
+def get_embedding_model():
+    """Get the process-wide embedding model, loading it on first use"""
+    global _embedding_model, _model_load_started_at, _model_load_seconds
+    if _embedding_model is not None:
+        return _embedding_model
+
+    with model_lock:
+        if _embedding_model is None:
+            _model_load_started_at = time.time()
+            retries = 0
+            last_error = None
+
+            # Try loading the model with retries
+            while retries < MAX_MODEL_LOAD_RETRIES:
+                try:
+                    # Try to load the model with increased timeout
+                    logging.info(f"Loading SentenceTransformer model (attempt {retries+1}/{MAX_MODEL_LOAD_RETRIES})...")
+                    start_time = time.time()
+
+                    # Import here to avoid startup delay if HF servers are slow
+                    from sentence_transformers import SentenceTransformer
+                    _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+                    elapsed_time = time.time() - start_time
+                    logging.info(f"SentenceTransformer model loaded in {elapsed_time:.2f} seconds")
+                    break
+                except Exception as e:
+                    last_error = e
+                    retries += 1
+                    logging.error(f"Error loading SentenceTransformer model (attempt {retries}/{MAX_MODEL_LOAD_RETRIES}): {str(e)}")
+                    time.sleep(2)  # Wait before retrying
+
+            # If all retries failed, fall back to the deterministic hashing encoder
+            if _embedding_model is None:
+                logging.warning("All attempts to load SentenceTransformer failed, using HashingEncoder")
+                _embedding_model = HashingEncoder()
+            _model_load_seconds = time.time() - _model_load_started_at
+    return _embedding_model
+
+def get_profile_encoder():
+    """
+    Get the process-wide embedding model wrapped for profile texts: duplicate and recently
+    seen texts are not encoded again, and concurrent encode calls share one batch
+    """
+    global _profile_encoder, _profile_encoder_model
+    model = get_embedding_model()
+    if _profile_encoder_model is not model:
+        with model_lock:
+            if _profile_encoder_model is not model:
+                _profile_encoder = CachedEncoder(InferenceBatcher(model))
+                _profile_encoder_model = model
+    return _profile_encoder
+
+def embedding_cache_stats():
+    """Hit and miss counters of the profile text cache, None before the first encode"""
+    return _profile_encoder.stats() if _profile_encoder is not None else None
+
+def is_embedding_model_loaded():
+    """True once get_embedding_model() returns without blocking"""
+    return _embedding_model is not None
+
+def start_embedding_model_loader():
+    """
+    Load the embedding model in a background thread so no request waits for it.
+    Safe to call repeatedly: does nothing once the model is loaded or while a load is running,
+    and restarts the load in a forked worker whose parent had not finished it.
+    """
+    global _model_loader_thread
+    if _embedding_model is not None or (_model_loader_thread is not None and _model_loader_thread.is_alive()):
+        return
+
+    with _model_loader_start_lock:
+        if _embedding_model is None and (_model_loader_thread is None or not _model_loader_thread.is_alive()):
+            _model_loader_thread = threading.Thread(target=get_embedding_model, name="embedding-model-loader", daemon=True)
+            _model_loader_thread.start()
+            logging.info("Embedding model loader started")
+
+def embedding_model_status():
+    """
+    State of the process-wide embedding model for readiness checks
+    Returns:
+        dict: state ('not_started', 'loading', 'ready' or 'degraded' when the fallback encoder is in use),
+              encoder name and load timings in seconds
+    """
+    model = _embedding_model
+    if model is not None:
+        state = 'degraded' if isinstance(model, HashingEncoder) else 'ready'
+    elif _model_loader_thread is not None and _model_loader_thread.is_alive():
+        state = 'loading'
+    else:
+        state = 'not_started'
+    return {
+        "state": state,
+        "encoder": get_encoder_name(model) if model is not None else None,
+        "load_seconds": round(_model_load_seconds, 2) if _model_load_seconds is not None else None,
+        "loading_for_seconds": round(time.time() - _model_load_started_at, 2) if state == 'loading' and _model_load_started_at else None
+    }
+
+def start_profile_sync(interval=CANDIDATE_STORE_REFRESH_SECONDS):
+    """
+    Keep the profile data ranking reads fresh without any request paying for it: a background
+    thread builds the candidate columns, syncs the embedding stores with user_profile once the
+    embedding model is loaded, then rebuilds the candidate columns every interval seconds.
+    Only the process elected by claim_sync_leader() runs the sync, the others map the versions
+    it writes. Edited profiles are re-embedded in between by the embedding refresh worker.
+    Safe to call repeatedly: does nothing while the thread runs. Every process needs its own,
+    the candidate columns live in its memory, so call it in each forked worker rather than
+    in a preloading parent.
+    """
+    global _profile_sync_thread
+    if _profile_sync_thread is not None and _profile_sync_thread.is_alive():
+        return
+
+    with _profile_sync_start_lock:
+        if _profile_sync_thread is None or not _profile_sync_thread.is_alive():
+            _profile_sync_thread = threading.Thread(target=_run_profile_sync, args=(interval,), name="profile-sync", daemon=True)
+            _profile_sync_thread.start()
+            logging.info("Profile sync started")
+
+def _run_profile_sync(interval):
+    model = None
+    synced = False
+    while True:
+        try:
+            if model is None or model.connection.closed:
+                model = RecommendationModel()
+            built = False
+            if get_candidate_store() is None:
+                # Needs no embedding model, so filters and the hybrid stage work while it loads
+                model.refresh_candidate_store()
+                model.connection.rollback()
+                built = True
+            if not synced and claim_sync_leader():
+                model.sync_embedding_store()
+                synced = True
+            elif not built:
+                model.refresh_candidate_store()
+            # End the snapshot the streams read in, the connection idles until the next rebuild
+            model.connection.rollback()
+        except Exception as e:
+            logging.error(f"Profile sync failed: {str(e)}")
+            try:
+                model.connection.rollback()
+            except Exception:
+                model = None
+        time.sleep(interval)
+
+def _reset_model_locks_after_fork():
+    """A loader thread does not survive fork, a lock it held would stay locked forever in the child"""
+    global model_lock, _model_loader_start_lock, _profile_sync_start_lock
+    if _embedding_model is None:
+        model_lock = threading.Lock()
+        _model_loader_start_lock = threading.Lock()
+    _profile_sync_start_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_model_locks_after_fork)
+
+def get_encoder_name(encoder):
+    """Identity of an encoder, stored next to the vectors it produced"""
+    return getattr(encoder, 'name', EMBEDDING_MODEL_NAME)
+
+def build_profile_text(location, interests):
+    """
+    Build the text that gets embedded for a profile
+    Args:
+        location (str or None): Profile location
+        interests (str or None): Postgres array literal such as '{Hiking,Books}'
+    Returns:
+        str: Profile text
+    """
+    location = location if location is not None else 'unknown'
+    interests = interests.strip('{}').split(',') if isinstance(interests, str) else ['none']
+    return f"Location: {location} Interests: {' '.join(interests)}"
+
+def build_profile_texts(locations, interests):
+    """
+    Column-wise build_profile_text() for many profiles at once, the texts are identical
+    Args:
+        locations (array-like): Profile locations, None where missing
+        interests (array-like): Postgres array literals such as '{Hiking,Books}', None where missing
+    Returns:
+        list: Profile text per profile
+    """
+    locations = np.asarray(locations, dtype=object)
+    interests = np.asarray(interests, dtype=object)
+    locations = np.where(np.equal(locations, None), 'unknown', locations).astype(str)
+    # '{a,b}' -> 'a b' on the whole column instead of a split and join per row
+    missing_interests = np.equal(interests, None)
+    interests = np.char.replace(np.char.strip(np.where(missing_interests, '', interests).astype(str), '{}'), ',', ' ')
+    interests = np.where(missing_interests, 'none', interests)
+    return np.char.add(np.char.add('Location: ', locations), np.char.add(' Interests: ', interests)).tolist()
+
+def stream_profiles(connection, chunk_size=PROFILE_LOAD_CHUNK_SIZE):
+    """
+    Stream every profile with a location or interests through a server-side cursor
+    Args:
+        connection: psycopg2 connection, the cursor lives in its current transaction
+        chunk_size (int): Profiles fetched per round trip
+    Yields:
+        dict: Columns of a chunk ordered by user_id: user_id, profile_text, location, interest,
+              age, gender, is_verified, level (account tenure as computed for the feed) and the raw
+              text of every field in PROFILE_FIELDS
+    """
+    with connection.cursor(name='profile_loader') as cursor:
+        cursor.itersize = chunk_size
+        cursor.execute('''
+            SELECT
+                p.user_id,
+                p.location,
+                p.interest,
+                COALESCE(p.isVerified, FALSE),
+                CASE
+                    WHEN age(NOW(), ud.created_at) < INTERVAL '3 months' THEN 0
+                    WHEN age(NOW(), ud.created_at) < INTERVAL '6 months' THEN 1
+                    ELSE 2
+                END,
+                p.age,
+                p.gender::text,
+                p.bio,
+                p.occupation,
+                -- Every string in the prompts JSON (questions and answers) as one text
+                (
+                    SELECT string_agg(v #>> '{}', ' ')
+                    FROM jsonb_path_query(p.prompts::jsonb, 'strict $.**') AS v
+                    WHERE jsonb_typeof(v) = 'string'
+                )
+            FROM user_profile p
+            LEFT JOIN user_db ud ON ud.id = p.user_id
+            WHERE p.location IS NOT NULL
+            OR p.interest IS NOT NULL
+            ORDER BY p.user_id
+        ''')
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            columns = np.array(rows, dtype=object).reshape(-1, 10)
+            yield {
+                "user_id": columns[:, 0].astype(np.int64),
+                "profile_text": build_profile_texts(columns[:, 1], columns[:, 2]),
+                "location": columns[:, 1],
+                "interest": columns[:, 2],
+                "is_verified": columns[:, 3].astype(bool),
+                "level": columns[:, 4].astype(np.int8),
+                "age": columns[:, 5],
+                "gender": columns[:, 6],
+                "bio": columns[:, 7],
+                "occupation": columns[:, 8],
+                "prompts": columns[:, 9]
+            }
+
+def stream_right_swipes(connection, chunk_size=PROFILE_LOAD_CHUNK_SIZE):
+    """
+    Stream every right swipe through a server-side cursor
+    Args:
+        connection: psycopg2 connection, the cursor lives in its current transaction
+        chunk_size (int): Swipes fetched per round trip
+    Yields:
+        tuple: (swiper user_ids, swiped user_ids) as np.ndarray per chunk
+    """
+    with connection.cursor(name='right_swipe_loader') as cursor:
+        cursor.itersize = chunk_size
+        cursor.execute('''
+            SELECT user_id, target_user_id
+            FROM swipe_logs
+            WHERE swipe_direction = 'right'
+        ''')
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+            yield pairs[:, 0], pairs[:, 1]
+
+def fetch_seen_user_ids(cursor, user_ids):
+    """
+    Users that each of the given users already swiped on or matched with, in one query
+    Args:
+        cursor: psycopg2 cursor
+        user_ids (list): Requesting users
+    Returns:
+        dict: user_id -> np.ndarray of seen user_ids, users without history are absent
+    """
+    cursor.execute('''
+        SELECT user_id, target_user_id FROM swipe_logs WHERE user_id = ANY(%(ids)s)
+        UNION
+        SELECT user1_id, user2_id FROM matches WHERE user1_id = ANY(%(ids)s)
+        UNION
+        SELECT user2_id, user1_id FROM matches WHERE user2_id = ANY(%(ids)s)
+    ''', {"ids": [int(user_id) for user_id in user_ids]})
+    pairs = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+    if not len(pairs):
+        return {}
+
+    # Group by requesting user without a Python loop over the pairs
+    pairs = pairs[np.argsort(pairs[:, 0], kind="stable")]
+    owners, starts = np.unique(pairs[:, 0], return_index=True)
+    return dict(zip(owners.tolist(), np.split(pairs[:, 1], starts[1:])))
+
+class RankingContext:
+    """One user's ranking as the pipeline stages see it, built and used under store.lock"""
+
+    def __init__(self, store, user_id, limit, exclude_ids=None, candidate_store=None, filters=None, field_stores=None,
+                 feedback_store=None):
+        self.store = store
+        self.user_id = user_id
+        self.limit = limit
+        self.exclude_ids = np.asarray(exclude_ids if exclude_ids is not None else [], dtype=np.int64)
+        self.candidate_store = candidate_store
+        self.filters = filters
+        self.field_stores = field_stores
+        self.user_idx = store.index_of(user_id)
+
+        query = store.vectors[self.user_idx] if self.user_idx is not None else None
+        # Weighted swipe feedback the query is moved by, None without any
+        self.feedback = None
+        if query is not None and feedback_store is not None:
+            self.feedback = feedback_store.offset_for(user_id, store.encoder_name, len(query))
+            if self.feedback is not None:
+                query = normalize_rows(query + self.feedback)
+        self.query = query
+        # Set when the embedding retrieval of many users ran as one batch, see rank_similar_users_batch()
+        self.embedding_candidates = None
+
+        # Preference filters as a mask over the candidate columns and as blocked embedding store rows
+        self.allowed = None
+        self.blocked_rows = np.empty(0, dtype=np.int64)
+        if filters and candidate_store is None:
+            raise ValueError("Preference filters need the candidate columns, none are built yet")
+        if filters:
+            self.allowed = candidate_store.filter_mask(filters, user_id)
+            self.blocked_rows = candidate_store.blocked_rows(store.user_ids, filters, user_id)
+
+    def excluded_rows(self):
+        """Embedding store rows that must not be retrieved, superseded delta rows included"""
+        return np.concatenate([self.store.rows_of(self.exclude_ids), self.blocked_rows, self.store.superseded_rows, [self.user_idx]])
+
+    def keep_candidates(self, rows):
+        """Mask of candidate column rows that may be recommended: not the user, not excluded, passing the filters"""
+        keep = ~np.isin(self.candidate_store.user_ids[rows], np.append(self.exclude_ids, self.user_id))
+        if self.allowed is not None:
+            keep &= self.allowed[rows]
+        return keep
+
+
+class EmbeddingRetriever:
+    """
+    Nearest profiles to the query: an exact scan, sharded over worker processes or through the
+    ANN index once the store is large
+    """
+    name = "embedding"
+
+    def is_exact(self, context):
+        """True when retrieve() returns the true nearest profiles, i.e. the store is scanned rather than the ANN index searched"""
+        if context.embedding_candidates is not None:
+            return True
+        scanner = get_sharded_scanner()
+        return (scanner is not None and scanner.applies(context.store)) or len(context.store) < ANN_MIN_PROFILES
+
+    def retrieve(self, context, pool):
+        if context.embedding_candidates is not None:
+            return context.embedding_candidates
+        store = context.store
+        scanner = get_sharded_scanner()
+        if scanner is not None and scanner.applies(store):
+            rows, _ = scanner.search(store, context.query[None, :], pool, [context.excluded_rows()])
+            return store.user_ids[rows[0][rows[0] >= 0]]
+        if len(store) >= ANN_MIN_PROFILES:
+            candidate_ids, _ = store.ann_search(
+                context.query, pool,
+                exclude_ids=np.concatenate([context.exclude_ids, store.user_ids[context.blocked_rows], [context.user_id]])
+            )
+            return candidate_ids
+        # Excluded rows are masked before top-k so the pool is filled with fresh candidates
+        rows, _ = store.top_k(context.query, pool, exclude=context.excluded_rows())
+        return store.user_ids[rows]
+
+
+class InterestRetriever:
+    """Profiles sharing the most interests with the user, through the inverted interest index"""
+    name = "interests"
+
+    def retrieve(self, context, pool):
+        if context.candidate_store is None:
+            return np.empty(0, dtype=np.int64)
+        rows, overlap = context.candidate_store.rows_sharing_interests(context.user_id)
+        keep = context.keep_candidates(rows)
+        rows, overlap = rows[keep], overlap[keep]
+        idx, _ = top_k(overlap.astype(np.float32), pool)
+        return context.candidate_store.user_ids[rows[idx]]
+
+
+class LocationRetriever:
+    """Profiles in the user's location, a sample of them when the location holds more than the pool"""
+    name = "location"
+
+    def retrieve(self, context, pool):
+        candidate_store = context.candidate_store
+        if candidate_store is None:
+            return np.empty(0, dtype=np.int64)
+        user_rows, present = candidate_store.rows_of([context.user_id])
+        location = candidate_store.location[user_rows[0]] if present[0] else 0
+        if not location:
+            return np.empty(0, dtype=np.int64)
+        rows = np.flatnonzero(candidate_store.location == location)
+        rows = rows[context.keep_candidates(rows)]
+        if len(rows) > pool:
+            # Seeded per user, so a user sees a stable sample between requests
+            rows = np.random.default_rng(context.user_id).choice(rows, pool, replace=False)
+        return candidate_store.user_ids[rows]
+
+
+class ExactReranker:
+    """Exact float32 cosine similarity of every retrieved candidate, keeping the best pool"""
+    name = "exact"
+
+    def applies(self, context):
+        return True
+
+    def rerank(self, context, candidate_ids, scores, pool):
+        store = context.store
+        if not len(store) or not len(candidate_ids):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, present = store.lookup(candidate_ids)
+        candidate_ids, rows = candidate_ids[present], rows[present]
+        idx, scores = top_k(store.vectors[rows] @ context.query, pool)
+        return candidate_ids[idx], scores
+
+
+class ReciprocalReranker:
+    """Two-sided similarity, see reciprocal_similarity()"""
+    name = "reciprocal"
+
+    def applies(self, context):
+        return context.candidate_store is not None and RECIPROCAL_SCORING
+
+    def rerank(self, context, candidate_ids, scores, pool):
+        if not len(candidate_ids):
+            return candidate_ids, scores
+        return candidate_ids, reciprocal_similarity(
+            context.store, context.candidate_store, context.user_id, candidate_ids, context.feedback
+        )
+
+
+class FieldReranker:
+    """Blend in the similarity of bio, occupation and prompts, see blend_field_similarity()"""
+    name = "fields"
+
+    def applies(self, context):
+        return bool(context.field_stores)
+
+    def rerank(self, context, candidate_ids, scores, pool):
+        return candidate_ids, blend_field_similarity(context.field_stores, context.user_id, candidate_ids, scores)
+
+
+class HybridReranker:
+    """Weighted hybrid score over the candidate columns, see rerank_candidates()"""
+    name = "hybrid"
+
+    def applies(self, context):
+        return context.candidate_store is not None
+
+    def rerank(self, context, candidate_ids, scores, pool):
+        return rerank_candidates(context.candidate_store, context.user_id, candidate_ids, scores, context.limit)
+
+
+RETRIEVERS = {retriever.name: retriever for retriever in (EmbeddingRetriever, InterestRetriever, LocationRetriever)}
+
+
+class RecommendationPipeline:
+    """
+    Two-stage ranking: cheap retrievers each return up to retrieval_pool candidate ids, then
+    rerankers score only the union of those, the first one exactly against the query.
+    When the embedding retrieval is an exact scan it runs alone and returns just the pool the
+    exact stage keeps: another retriever's candidates could at best tie with it.
+    Every stage is timed.
+    """
+
+    def __init__(self, retrievers, rerankers=None, retrieval_pool=RETRIEVAL_POOL_SIZE, rerank_pool=HYBRID_CANDIDATE_POOL):
+        self.retrievers = retrievers
+        self.rerankers = rerankers if rerankers is not None else [ExactReranker(), ReciprocalReranker(), FieldReranker(), HybridReranker()]
+        self.retrieval_pool = retrieval_pool
+        self.rerank_pool = rerank_pool
+
+    @classmethod
+    def from_names(cls, names=RECOMMENDATION_RETRIEVERS, **kwargs):
+        """Pipeline with the named retrievers, e.g. RECOMMENDATION_RETRIEVERS"""
+        unknown = [name for name in names if name not in RETRIEVERS]
+        if unknown or not names:
+            raise ValueError(f"Unsupported retrievers {unknown or names}, expected some of {sorted(RETRIEVERS)}")
+        return cls([RETRIEVERS[name]() for name in names], **kwargs)
+
+    def rank(self, context, timings=None):
+        """
+        Args:
+            context (RankingContext): The ranking, its store.lock must be held
+            timings (list, optional): Gets one {"stage", "ms", "candidates"} entry per stage run
+        Returns:
+            tuple: (recommended user_ids, scores) as numpy arrays, best first
+        """
+        timings = timings if timings is not None else []
+
+        def timed(name, started_at, count):
+            timings.append({"stage": name, "ms": round((time.perf_counter() - started_at) * 1000, 3), "candidates": int(count)})
+
+        # Without a later stage to use the extra candidates the exact stage keeps only the feed
+        needs_pool = context.candidate_store is not None or bool(context.field_stores)
+        pool = max(context.limit, self.rerank_pool) if needs_pool else context.limit
+
+        retrievers, retrieval_pool = self.retrievers, self.retrieval_pool
+        exact = [retriever for retriever in retrievers if isinstance(retriever, EmbeddingRetriever) and retriever.is_exact(context)]
+        if exact and retrieval_pool >= pool:
+            # The exact scan's own top pool is what the exact stage would keep
+            retrievers, retrieval_pool = exact, pool
+
+        retrieved = []
+        for retriever in retrievers:
+            started_at = time.perf_counter()
+            candidate_ids = np.asarray(retriever.retrieve(context, retrieval_pool), dtype=np.int64)
+            retrieved.append(candidate_ids)
+            timed(f"retrieve:{retriever.name}", started_at, len(candidate_ids))
+        candidate_ids = np.unique(np.concatenate(retrieved)) if retrieved else np.empty(0, dtype=np.int64)
+        scores = np.zeros(len(candidate_ids), dtype=np.float32)
+
+        for reranker in self.rerankers:
+            if not reranker.applies(context):
+                continue
+            started_at = time.perf_counter()
+            candidate_ids, scores = reranker.rerank(context, candidate_ids, scores, pool)
+            timed(f"rerank:{reranker.name}", started_at, len(candidate_ids))
+
+        idx, scores = top_k(np.asarray(scores, dtype=np.float32), context.limit)
+        return candidate_ids[idx], scores
+
+def rank_similar_users(store, user_id, limit, exclude_ids=None, candidate_store=None, filters=None, field_stores=None,
+                       feedback_store=None, timings=None):
+    """
+    Rank the profiles most similar to a user with the RecommendationPipeline of RECOMMENDATION_RETRIEVERS
+    Args:
+        store (EmbeddingStore): Store holding the user's embedding
+        user_id (int): Requesting user
+        limit (int): Number of recommendations
+        exclude_ids (array-like, optional): user_ids that must not be recommended, e.g. already swiped or matched
+        candidate_store (CandidateStore, optional): Profile columns, when given the interest and location
+            retrievers run and the HYBRID_CANDIDATE_POOL most similar candidates are re-ranked with the
+            hybrid score, on reciprocal similarity when RECIPROCAL_SCORING is on
+        filters (dict, optional): Preference filters from parse_preference_filters(), applied to
+            candidate_store's columns as a mask before any similarity is computed
+        field_stores (dict, optional): field -> EmbeddingStore, when given the similarity of the
+            retrieved candidates is blended with their per-field similarity by EMBEDDING_FIELD_WEIGHTS
+        feedback_store (FeedbackStore, optional): Swipe feedback, when given candidates are retrieved
+            with the user's embedding moved toward their right swipes and away from their left swipes
+        timings (list, optional): Gets the time and candidate count of every pipeline stage
+    Returns:
+        tuple or None: (recommended user_ids, scores) as numpy arrays, None if the user has no embedding.
+            Scores are cosine similarities, or hybrid scores when candidate_store is given
+    """
+    pipeline = RecommendationPipeline.from_names(RECOMMENDATION_RETRIEVERS)
+    with store.lock:
+        context = RankingContext(store, user_id, limit, exclude_ids, candidate_store, filters, field_stores, feedback_store)
+        if context.user_idx is None:
+            return None
+        return pipeline.rank(context, timings)
+
+def rank_similar_users_batch(store, user_ids, limit, exclude_map=None, candidate_store=None, field_stores=None,
+                             feedback_store=None, scanner=None):
+    """
+    rank_similar_users() for many users at once. When their embedding retrieval is an exact scan,
+    all their queries are scored together in one matrix-matrix pass over the store, sharded over
+    scanner's processes when it applies.
+    Args:
+        store (EmbeddingStore): Store holding the users' embeddings
+        user_ids (list): Requesting users
+        limit (int): Recommendations per user
+        exclude_map (dict, optional): user_id -> user_ids that must not be recommended to them
+        candidate_store, field_stores, feedback_store: As for rank_similar_users()
+        scanner (ShardedScanner, optional): Process pool for the exact scan
+    Returns:
+        dict: user_id -> (recommended user_ids, scores), users without an embedding are absent
+    """
+    exclude_map = exclude_map or {}
+    pipeline = RecommendationPipeline.from_names(RECOMMENDATION_RETRIEVERS)
+    with store.lock:
+        contexts = [
+            RankingContext(store, user_id, limit, exclude_map.get(user_id), candidate_store, None, field_stores, feedback_store)
+            for user_id in user_ids
+        ]
+        contexts = [context for context in contexts if context.user_idx is not None]
+
+        sharded = scanner is not None and scanner.applies(store)
+        if contexts and EmbeddingRetriever.name in RECOMMENDATION_RETRIEVERS and (sharded or len(store) < ANN_MIN_PROFILES):
+            queries = np.stack([context.query for context in contexts])
+            excludes = [context.excluded_rows() for context in contexts]
+            if sharded:
+                rows, _ = scanner.search(store, queries, pipeline.retrieval_pool, excludes)
+            elif store.codes is not None:
+                rows, _ = quantized_scan_top_k(store.codes, store.scales, store.vectors, queries, pipeline.retrieval_pool, excludes)
+            else:
+                rows, _ = scan_top_k(store.vectors, queries, pipeline.retrieval_pool, excludes)
+            for context, context_rows in zip(contexts, rows):
+                context.embedding_candidates = store.user_ids[context_rows[context_rows >= 0]]
+
+        return {context.user_id: pipeline.rank(context) for context in contexts}
+
+def write_recommendation_feeds(cursor, feeds):
+    """
+    Replace users' stored feeds, each feed is one upserted user_recommendation_feeds row.
+    Runs inside the caller's transaction, so readers never see a user without recommendations.
+    Args:
+        cursor: psycopg2 cursor
+        feeds (list): (user_id, recommended_ids, similarity_scores) per user
+    Returns:
+        int: Number of recommendations written
+    """
+    # A user listed twice would hit the same row twice in one upsert, the last feed wins
+    latest = {feed[0]: feed for feed in feeds}
+    execute_values(cursor, '''
+        INSERT INTO user_recommendation_feeds (user_id, recommended_user_ids, similarity_scores)
+        VALUES %s
+        ON CONFLICT (user_id) DO UPDATE
+        SET recommended_user_ids = EXCLUDED.recommended_user_ids,
+            similarity_scores = EXCLUDED.similarity_scores,
+            created_at = CURRENT_TIMESTAMP
+    ''', [
+        (user_id, [int(rec_id) for rec_id in recommended_ids], [float(score) for score in similarity_scores])
+        for user_id, recommended_ids, similarity_scores in latest.values()
+    ], template="(%s, %s::int[], %s::real[])", page_size=RECOMMENDATION_INSERT_PAGE_SIZE)
+    return sum(len(feed[1]) for feed in latest.values())
+
+def read_recommendation_feed(cursor, user_id):
+    """
+    A user's stored feed in rank order
+    Returns:
+        tuple: (recommended user_ids, similarity scores), empty lists without a stored feed
+    """
+    cursor.execute('''
+        SELECT recommended_user_ids, similarity_scores
+        FROM user_recommendation_feeds
+        WHERE user_id = %s
+    ''', (user_id,))
+    row = cursor.fetchone()
+    return (list(row[0]), list(row[1])) if row else ([], [])
 
 class RecommendationModel:
     DEFAULT_RECOMMENDATION_LIMIT = 50
@@ -44,106 +704,136 @@ class RecommendationModel:
             self.cursor = self.connection.cursor(cursor_factory=DictCursor)
             logging.info("Database connection established")
 
-            # Load the model in a thread-safe way with a global instance
-            global _embedding_model
-            with model_lock:
-                if _embedding_model is None:
-                    retries = 0
-                    last_error = None
-                    
-                    # Try loading the model with retries
-                    while retries < MAX_MODEL_LOAD_RETRIES:
-                        try:
-                            # Try to load the model with increased timeout
-                            logging.info(f"Loading SentenceTransformer model (attempt {retries+1}/{MAX_MODEL_LOAD_RETRIES})...")
-                            start_time = time.time()
-                            
-                            # Import here to avoid startup delay if HF servers are slow
-                            from sentence_transformers import SentenceTransformer
-                            _embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-                            
-                            elapsed_time = time.time() - start_time
-                            logging.info(f"SentenceTransformer model loaded in {elapsed_time:.2f} seconds")
-                            break
-                        except Exception as e:
-                            last_error = e
-                            retries += 1
-                            logging.error(f"Error loading SentenceTransformer model (attempt {retries}/{MAX_MODEL_LOAD_RETRIES}): {str(e)}")
-                            time.sleep(2)  # Wait before retrying
-                    
-                    # If all retries failed, use dummy encoder
-                    if _embedding_model is None:
-                        logging.warning("All attempts to load SentenceTransformer failed, using DummyEncoder")
-                        _embedding_model = DummyEncoder()
-            
-            # Set the model reference for this instance
-            self.embedding_model = _embedding_model
-
         except Exception as e:
             logging.error(f"Error during RecommendationModel initialization: {str(e)}")
             if hasattr(self, 'connection') and self.connection:
                 self.connection.rollback()
             raise CustomException(e, sys)
 
-    def user_recommendation_model(self, user_id):
-        try:
-            # Fetch user profiles
-            query = '''
-                SELECT 
-                    user_id,
-                    location,
-                    interest as interests
-                FROM user_profile 
-                WHERE location IS NOT NULL 
-                OR interest IS NOT NULL
-            '''
-            self.cursor.execute(query)
-            user_profiles = self.cursor.fetchall()
+    @property
+    def embedding_model(self):
+        """Process-wide (cached, batched) embedding model, blocks until it is loaded"""
+        return get_profile_encoder()
+
+    def sync_embedding_store(self):
+        """
+        Bring the shared embedding store up to date with user_profile, streamed in chunks,
+        and rebuild the candidate columns. Only new or changed profiles are encoded, without
+        holding any store lock, each store takes its write lock only to write the new version.
+        Every profile is still streamed and hashed: run it at startup or in the batch job, never
+        per request.
+        """
+        store = get_embedding_store()
+        field_stores = get_field_stores()
+        encoder = self.embedding_model
+        encoder_name = get_encoder_name(encoder)
+        # The same pass collects the columns the hybrid ranking stage scores candidates on
+        candidates = CandidateStoreBuilder()
 
-            if not user_profiles:
-                logging.warning("No user profiles found with location or interests")
-                return jsonify({"status": "error", "message": "No profiles available"}), 404
+        # Staged during the stream, every store commits when the block exits
+        with ExitStack() as stack:
+            profile_sync = stack.enter_context(store.syncing(encoder, encoder_name))
+            field_syncs = {field: stack.enter_context(field_store.syncing(encoder, encoder_name)) for field, field_store in field_stores.items()}
+            for chunk in stream_profiles(self.connection):
+                candidates.add(chunk)
+                profile_sync.add(chunk["user_id"], chunk["profile_text"])
+                for field, field_sync in field_syncs.items():
+                    present, texts = field_texts(chunk[field])
+                    field_sync.add(chunk["user_id"][present], texts)
+        encoded = profile_sync.encoded + sum(field_sync.encoded for field_sync in field_syncs.values())
 
-            # Convert to DataFrame
-            df = pd.DataFrame(user_profiles)
-            df.columns = ['user_id', 'location', 'interests']
-            logging.info(f"Fetched {len(df)} user profiles")
+        for swiper_ids, target_ids in stream_right_swipes(self.connection):
+            candidates.add_right_swipes(swiper_ids, target_ids)
+        set_candidate_store(candidates.build())
+        logging.info(f"Embedding store synced, {len(store)} profiles, {encoded} profile and field texts re-encoded")
+        return store
 
-            # Preprocess data
-            df['location'] = df['location'].fillna('unknown')
-            df['interests'] = df['interests'].fillna('{none}')
-            df['interests'] = df['interests'].apply(lambda x: x.strip('{}').split(',') if isinstance(x, str) else ['none'])
-            df['profile_text'] = df.apply(lambda row: f"Location: {row['location']} Interests: {' '.join(row['interests'])}", axis=1)
+    def refresh_candidate_store(self):
+        """Rebuild the candidate columns from user_profile and swipe_logs, leaving the embedding stores as they are"""
+        candidate_store = CandidateStoreBuilder()
+        for chunk in stream_profiles(self.connection):
+            candidate_store.add(chunk)
+        for swiper_ids, target_ids in stream_right_swipes(self.connection):
+            candidate_store.add_right_swipes(swiper_ids, target_ids)
+        candidate_store = candidate_store.build()
+        set_candidate_store(candidate_store)
+        logging.info(f"Candidate columns rebuilt, {len(candidate_store)} profiles")
+        return candidate_store
 
-            # Generate embeddings
+    def user_recommendation_model(self, user_id, filters=None):
+        """
+        Rank a user's feed. Unfiltered feeds are stored as the user's feed and cached; a feed
+        narrowed by preference filters is only returned, the stored feed stays the unfiltered one.
+        """
+        try:
+            # Serve the last feed while nothing the user's feed depends on has changed,
+            # only unfiltered feeds are cached
+            cache = get_recommendation_cache()
+            cached = cache.get(user_id) if not filters else None
+            if cached is not None:
+                logging.info(f"Serving cached recommendations for user {user_id}")
+                return jsonify({
+                    "status": "success",
+                    "recommended_users": cached[0],
+                    "similarity_scores": cached[1],
+                    "debug": {"cached": True, "stages": []}
+                }), 200
+
+            computed_at = time.time()
             try:
-                embeddings = self.embedding_model.encode(df['profile_text'].tolist(), show_progress_bar=False)
-                user_ids = df['user_id']
+                # Rank against the stores as last synced, the profile sync and embedding refresh
+                # threads keep them fresh (see start_profile_sync())
+                store = get_embedding_store()
+                if not len(store):
+                    logging.warning("No user profiles found with location or interests")
+                    return jsonify({"status": "error", "message": "No profiles available"}), 404
 
-                # Compute similarity
-                similarity = cosine_similarity(embeddings)
+                candidate_store = get_candidate_store()
+                if filters and candidate_store is None:
+                    # Ranking without the columns would return the feed unfiltered
+                    logging.warning(f"Candidate columns not built yet, cannot apply filters for user {user_id}")
+                    return jsonify({
+                        "status": "error",
+                        "message": "Preference filters are not available yet, retry shortly"
+                    }), 503
 
-                # Get recommendations and scores for the given user_id
-                if user_id not in user_ids.values:
+                # Get recommendations and scores for the given user_id, skipping users already swiped or matched
+                seen_ids = fetch_seen_user_ids(self.cursor, [user_id]).get(user_id)
+                timings = []
+                ranked = rank_similar_users(
+                    store, user_id, self.DEFAULT_RECOMMENDATION_LIMIT, exclude_ids=seen_ids,
+                    candidate_store=candidate_store, filters=filters, field_stores=get_field_stores(),
+                    feedback_store=get_feedback_store(), timings=timings
+                )
+                if ranked is None:
                     logging.warning(f"User {user_id} not found in profiles")
                     return jsonify({"status": "error", "message": "User not found"}), 404
+                recommended_ids = ranked[0].tolist()
+                similarity_scores = ranked[1].tolist()
 
-                user_idx = user_ids[user_ids == user_id].index[0]
-                similar_users_idx = similarity[user_idx].argsort()[::-1][1:self.DEFAULT_RECOMMENDATION_LIMIT + 1]  # Exclude self
-                recommended_ids = user_ids.iloc[similar_users_idx].tolist()
-                similarity_scores = similarity[user_idx][similar_users_idx].tolist()
-
-                # Store recommendations in the database
-                self.store_user_recommendations(user_id, recommended_ids, similarity_scores)
+                # Store recommendations in the database, a filtered list is not the user's feed
+                if not filters:
+                    self.store_user_recommendations(user_id, recommended_ids, similarity_scores)
+                    cache.set(user_id, recommended_ids, similarity_scores, computed_at)
 
-                logging.info(f"Recommendations for user {user_id}: {recommended_ids}")
+                logging.info(f"Recommendations for user {user_id}: {recommended_ids}, stages: {timings}")
                 return jsonify({
                     "status": "success",
                     "recommended_users": recommended_ids,
-                    "similarity_scores": similarity_scores
+                    "similarity_scores": similarity_scores,
+                    "debug": {"cached": False, "stages": timings}
                 }), 200
             except Exception as e:
                 logging.error(f"Error generating embeddings: {str(e)}")
+                # A failed query aborts the transaction the fallback query runs in
+                self.connection.rollback()
+                if filters:
+                    # Random fallback users would not honour the filters
+                    return jsonify({
+                        "status": "error",
+                        "message": "Could not rank recommendations with these filters",
+                        "details": str(e)
+                    }), 500
                 return self._fallback_recommendations(user_id)
 
         except Exception as e:
@@ -154,17 +844,58 @@ class RecommendationModel:
                 "details": "Failed to provide recommendations"
             }), 500
 
+    def degraded_recommendations(self, user_id, filters=None):
+        """
+        Answer without waiting for the embedding model while it is still loading, marked
+        "degraded": the user's last stored feed, else a feed ranked against the persisted
+        embedding stores (ranking encodes nothing), else random fallback recommendations.
+        A request with preference filters only gets the ranked feed or an error.
+        """
+        if not filters:
+            try:
+                recommended_ids, similarity_scores = read_recommendation_feed(self.cursor, user_id)
+                if recommended_ids:
+                    logging.info(f"Embedding model still loading, serving stored recommendations for user {user_id}")
+                    return jsonify({
+                        "status": "success",
+                        "recommended_users": recommended_ids,
+                        "similarity_scores": similarity_scores,
+                        "degraded": True
+                    }), 200
+            except Exception as e:
+                self.connection.rollback()
+                logging.error(f"Error serving stored recommendations for user {user_id}: {str(e)}")
+
+        response, status_code = self.user_recommendation_model(user_id, filters)
+        if status_code != 200 and not filters:
+            # No embedding for the user yet, its refresh waits for the model. Random users would
+            # not honour filters, a filtered request gets the error instead
+            response, status_code = self._fallback_recommendations(user_id)
+        body = response.get_json()
+        if status_code == 200:
+            body["degraded"] = True
+        return jsonify(body), status_code
+
     def _fallback_recommendations(self, user_id):
         """Provide fallback recommendations based on random selection from database"""
         try:
-            # Get random users excluding the current user
+            # Get random users excluding the current user and users already swiped or matched
             query = '''
-                SELECT user_id FROM user_profile
-                WHERE user_id != %s
+                SELECT user_id FROM user_profile p
+                WHERE user_id != %(user_id)s
+                AND NOT EXISTS (
+                    SELECT 1 FROM swipe_logs s
+                    WHERE s.user_id = %(user_id)s AND s.target_user_id = p.user_id
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM matches m
+                    WHERE (m.user1_id = %(user_id)s AND m.user2_id = p.user_id)
+                    OR (m.user2_id = %(user_id)s AND m.user1_id = p.user_id)
+                )
                 ORDER BY RANDOM()
-                LIMIT %s
+                LIMIT %(limit)s
             '''
-            self.cursor.execute(query, (user_id, self.DEFAULT_RECOMMENDATION_LIMIT))
+            self.cursor.execute(query, {"user_id": user_id, "limit": self.DEFAULT_RECOMMENDATION_LIMIT})
             recommended_ids = [row[0] for row in self.cursor.fetchall()]
             
             # Generate fake similarity scores (0.1 to 0.9)
@@ -188,29 +919,23 @@ class RecommendationModel:
             }), 500
 
     def store_user_recommendations(self, user_id, recommended_ids, similarity_scores):
-        try:
-            # Delete existing recommendations for this user
-            delete_query = '''
-                DELETE FROM user_recommendations_db 
-                WHERE user_id = %s
-            '''
-            self.cursor.execute(delete_query, (user_id,))
-            self.connection.commit()
-            logging.info(f"Deleted old recommendations for user {user_id}")
+        """Replace one user's stored recommendations atomically"""
+        self.store_many_user_recommendations([(user_id, recommended_ids, similarity_scores)])
 
-            # Insert new recommendations
-            insert_query = '''
-                INSERT INTO user_recommendations_db (user_id, recommended_user_id, similarity_score, rank)
-                VALUES (%s, %s, %s, %s)
-            '''
-            for rank, (rec_id, score) in enumerate(zip(recommended_ids, similarity_scores), 1):
-                self.cursor.execute(insert_query, (user_id, rec_id, score, rank))
+    def store_many_user_recommendations(self, feeds):
+        """
+        Replace the stored recommendations of many users in a single transaction
+        Args:
+            feeds (list): (user_id, recommended_ids, similarity_scores) per user
+        """
+        user_ids = [feed[0] for feed in feeds]
+        try:
+            rows = write_recommendation_feeds(self.cursor, feeds)
             self.connection.commit()
-            logging.info(f"Stored {len(recommended_ids)} recommendations for user {user_id}")
-
+            logging.info(f"Stored {rows} recommendations for {len(user_ids)} users")
         except Exception as e:
             self.connection.rollback()
-            logging.error(f"Error storing recommendations for user {user_id}: {str(e)}")
+            logging.error(f"Error storing recommendations for users {user_ids}: {str(e)}")
             raise CustomException(e, sys)
 
     def __del__(self):
@@ -0,0 +1,181 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils.logger import logging
+from model.similarity_search import top_k
+from model.quantization import RERANK_FACTOR
+from config.config import SHARDED_SCAN_WORKERS, SHARDED_SCAN_MIN_PROFILES
+
+# Rows scored per block, bounds the (rows, queries) score matrix held at once
+SCAN_BLOCK_ROWS = 32768
+# Versions a shard worker keeps mapped, the live one and the one it replaced
+MAPPED_VERSIONS = 2
+
+_scanner_lock = threading.Lock()
+_sharded_scanner = None
+# Shard worker state: version directory -> file name -> read-only mapping
+_worker_versions = {}
+
+
+def merge_top_k(rows, scores, k):
+    """
+    Best k of candidate lists, per query
+    Args:
+        rows (np.ndarray): (q, m) candidate rows, -1 for padding
+        scores (np.ndarray): (q, m) their scores, -inf for padding
+        k (int): Results kept per query
+    Returns:
+        tuple: (q, min(k, m)) rows and scores, best first
+    """
+    if scores.shape[1] > k:
+        idx = np.argpartition(scores, scores.shape[1] - k, axis=1)[:, -k:]
+        rows, scores = np.take_along_axis(rows, idx, axis=1), np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(scores, axis=1)[:, ::-1]
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def scan_top_k(vectors, queries, k, excludes=None, start=0, end=None, scales=None):
+    """
+    Exact top-k of a batch of queries over rows start:end of an embedding matrix. Each block of
+    rows is scored against every query in one matrix-matrix product.
+    Args:
+        vectors (np.ndarray): (n, dim) normalized vectors, e.g. a read-only memory map, or their
+            float16/int8 codes
+        queries (np.ndarray): (q, dim) normalized queries
+        k (int): Results per query
+        excludes (list, optional): Rows of the whole matrix that must not be returned, per query
+        start (int): First row scanned
+        end (int, optional): Row after the last one scanned, defaults to the end of the matrix
+        scales (np.ndarray, optional): Per-row scales of int8 codes
+    Returns:
+        tuple: (q, min(k, rows scanned)) rows and scores best first, excluded rows that still had
+            to fill a slot come back as -1 with -inf
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    end = len(vectors) if end is None else end
+    best_rows = np.full((len(queries), 0), -1, dtype=np.int64)
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    for block_start in range(start, end, SCAN_BLOCK_ROWS):
+        block_end = min(block_start + SCAN_BLOCK_ROWS, end)
+        scores = queries @ np.asarray(vectors[block_start:block_end]).T.astype(np.float32, copy=False)
+        if scales is not None:
+            scores *= np.asarray(scales[block_start:block_end])
+        if excludes is not None:
+            for query_no, exclude in enumerate(excludes):
+                exclude = np.asarray(exclude, dtype=np.int64)
+                local = exclude[(exclude >= block_start) & (exclude < block_end)] - block_start
+                scores[query_no, local] = -np.inf
+        rows = np.broadcast_to(np.arange(block_start, block_end, dtype=np.int64), scores.shape)
+        best_rows, best_scores = merge_top_k(
+            np.concatenate([best_rows, rows], axis=1), np.concatenate([best_scores, scores], axis=1), k
+        )
+    best_rows[np.isneginf(best_scores)] = -1
+    return best_rows, best_scores
+
+
+def quantized_scan_top_k(codes, scales, vectors, queries, k, excludes=None, start=0, end=None):
+    """
+    scan_top_k() over reduced precision codes, the best k * RERANK_FACTOR rows of each query
+    reranked against the float32 vectors, so only those rows of the float32 matrix are read.
+    Returns:
+        tuple: As scan_top_k()
+    """
+    candidates, _ = scan_top_k(codes, queries, k * RERANK_FACTOR, excludes, start, end, scales)
+    best_rows = np.full((len(queries), min(k, candidates.shape[1])), -1, dtype=np.int64)
+    best_scores = np.full(best_rows.shape, -np.inf, dtype=np.float32)
+    for query_no, (query, rows) in enumerate(zip(queries, candidates)):
+        rows = np.sort(rows[rows >= 0])
+        idx, scores = top_k(np.asarray(vectors[rows]) @ query, k)
+        best_rows[query_no, :len(idx)], best_scores[query_no, :len(idx)] = rows[idx], scores
+    return best_rows, best_scores
+
+
+def _mapped(version_dir, name):
+    """A worker's read-only mapping of one file of a version"""
+    files = _worker_versions.get(version_dir)
+    if files is None:
+        if len(_worker_versions) >= MAPPED_VERSIONS:
+            _worker_versions.pop(next(iter(_worker_versions)))
+        files = _worker_versions[version_dir] = {}
+    if name not in files:
+        files[name] = np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode="r")
+    return files[name]
+
+
+def _scan_shard(version_dir, start, end, queries, k, excludes, precision):
+    """Partial top-k of one shard, run in a worker process on its own mapping of the version files"""
+    vectors = _mapped(version_dir, "vectors")
+    if precision == "float32":
+        return scan_top_k(vectors, queries, k, excludes, start, end)
+    scales = _mapped(version_dir, "scales") if precision == "int8" else None
+    return quantized_scan_top_k(_mapped(version_dir, "codes"), scales, vectors, queries, k, excludes, start, end)
+
+
+class ShardedScanner:
+    """
+    Exact similarity scan split into row shards over a pool of worker processes.
+    Every worker memory-maps the same immutable version file of the embedding store, so the
+    shards live once in the shared page cache and only queries and partial top-k results
+    travel between processes. Partial results are merged into the global top-k. A store at
+    reduced precision is scanned on its codes file, each shard reranking its best rows in float32.
+    """
+
+    def __init__(self, workers=SHARDED_SCAN_WORKERS, min_profiles=SHARDED_SCAN_MIN_PROFILES):
+        self.workers = workers
+        self.min_profiles = min_profiles
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._pool_pid = None
+
+    def applies(self, store):
+        """True when the store is large enough and persisted, so workers can map its version"""
+        return self.workers > 0 and len(store) >= self.min_profiles and store.version is not None
+
+    def _get_pool(self):
+        # A pool does not survive fork, a forked API worker starts its own
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    # forkserver: workers are not forked from this (threaded) process
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"))
+                    self._pool_pid = os.getpid()
+                    logging.info(f"Sharded scan pool started with {self.workers} processes")
+        return self._pool
+
+    def search(self, store, queries, k, excludes=None):
+        """
+        Exact top-k of a batch of queries over the whole store, one shard per worker
+        Args:
+            store (EmbeddingStore): Persisted store, its codes are scanned when the version holds
+                them at the store's precision, its float32 vectors otherwise
+            queries (np.ndarray): (q, dim) normalized queries
+            k (int): Results per query
+            excludes (list, optional): Store rows that must not be returned, per query
+        Returns:
+            tuple: (q, k) rows and scores best first, -1 and -inf where no row was left
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        version_dir = os.path.join(store.directory, store.version)
+        precision = store.precision if store.persisted_codes else "float32"
+        bounds = np.linspace(0, len(store), self.workers + 1).astype(np.int64)
+        futures = [
+            self._get_pool().submit(_scan_shard, version_dir, int(start), int(end), queries, k, excludes, precision)
+            for start, end in zip(bounds[:-1], bounds[1:]) if end > start
+        ]
+        partial = [future.result() for future in futures]
+        return merge_top_k(np.concatenate([rows for rows, _ in partial], axis=1),
+                           np.concatenate([scores for _, scores in partial], axis=1), k)
+
+
+def get_sharded_scanner():
+    """The process-wide sharded scanner, None when SHARDED_SCAN_WORKERS is 0"""
+    global _sharded_scanner
+    if SHARDED_SCAN_WORKERS <= 0:
+        return None
+    if _sharded_scanner is None:
+        with _scanner_lock:
+            if _sharded_scanner is None:
+                _sharded_scanner = ShardedScanner()
+    return _sharded_scanner
@@ -0,0 +1,57 @@
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """
+    L2-normalize every row of an embedding matrix.
+    Args:
+        matrix (array-like): (n, dim) embeddings
+    Returns:
+        np.ndarray: float32 (n, dim) matrix whose rows have unit length (zero rows stay zero)
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores, k, exclude=None):
+    """
+    Select the k best scores without sorting the whole array.
+    Args:
+        scores (np.ndarray): 1-D similarity scores
+        k (int): Number of results wanted
+        exclude (int or array-like, optional): Positions that must not be returned
+    Returns:
+        tuple: (indices, scores) ordered from most to least similar
+    """
+    if exclude is not None:
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+
+    candidates = len(scores) if exclude is None else len(scores) - np.count_nonzero(np.isneginf(scores))
+    k = min(k, candidates)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    if k < len(scores):
+        idx = np.argpartition(scores, -k)[-k:]
+    else:
+        idx = np.arange(len(scores))
+    idx = idx[np.argsort(scores[idx])[::-1]]
+    return idx, scores[idx]
+
+
+def top_k_similar(normalized, query_idx, k):
+    """
+    Rank the rows most similar to one row of a normalized embedding matrix.
+    Only the query's row of the similarity matrix is ever computed (one matrix-vector product).
+    Args:
+        normalized (np.ndarray): (n, dim) L2-normalized embeddings
+        query_idx (int): Row of the requesting user
+        k (int): Number of neighbours to return, the query row itself excluded
+    Returns:
+        tuple: (indices, cosine scores) ordered from most to least similar
+    """
+    scores = normalized @ normalized[query_idx]
+    return top_k(scores, k, exclude=query_idx)
@@ -44,7 +44,9 @@ socketio = SocketIO(
     engineio_logger=True,
     ping_timeout=60,
     ping_interval=25,
-    http_compression=True
+    http_compression=True,
+    # Lets the API processes emit events (e.g. recommendations_ready) to connected users
+    message_queue=SOCKETIO_MESSAGE_QUEUE
 )
 
 # Use socket port from config
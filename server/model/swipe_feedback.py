@@ -0,0 +1,148 @@
+import os
+import json
+import fcntl
+import threading
+import numpy as np
+from utils.logger import logging
+from config.config import (
+    EMBEDDING_STORE_DIR, SWIPE_FEEDBACK_RATE, SWIPE_FEEDBACK_WEIGHT, SWIPE_FEEDBACK_NEGATIVE_WEIGHT
+)
+from model.embedding_store import get_embedding_store
+
+# Layout of the feedback directory:
+#   vectors.npy    (capacity, dim) float32 indexed by user_id, memory-mapped read-write by every
+#                  process, so a swipe updates one row in place and all workers see it at once
+#   meta.json      encoder whose vector space the rows live in
+#   .lock          serializes writers across processes
+FEEDBACK_STORE_DIR = os.path.join(EMBEDDING_STORE_DIR, "feedback")
+FEEDBACK_LOCK_FILE = ".lock"
+# Rows allocated when the file is created, it doubles past the largest user_id
+INITIAL_CAPACITY = 1024
+
+_feedback_store_lock = threading.Lock()
+_feedback_store = None
+
+
+class FeedbackStore:
+    """
+    Per-user swipe feedback vectors, updated incrementally with each swipe (Rocchio style).
+    A row starts at zero, so the query of a user without swipes is their own embedding.
+    Rows belong to one encoder; a different encoder starts every row over.
+    """
+
+    def __init__(self, directory=FEEDBACK_STORE_DIR, rate=SWIPE_FEEDBACK_RATE, negative_weight=SWIPE_FEEDBACK_NEGATIVE_WEIGHT):
+        self.directory = directory
+        self.rate = rate
+        self.negative_weight = negative_weight
+        self.lock = threading.Lock()
+        self.vectors = None
+        self.encoder_name = None
+        self._inode = None
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, "vectors.npy")
+
+    def _map(self):
+        """(Re-)map the file when another process created or grew it, must hold self.lock"""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            self.vectors, self.encoder_name, self._inode = None, None, None
+            return
+        if inode == self._inode:
+            return
+        with open(os.path.join(self.directory, "meta.json")) as f:
+            self.encoder_name = json.load(f)["encoder_name"]
+        self.vectors = np.load(self.path, mmap_mode="r+")
+        self._inode = inode
+
+    def _replace(self, vectors, encoder_name):
+        """Write a new file next to the live one and swap it in, must hold the write lock"""
+        tmp_path = os.path.join(self.directory, f"vectors.{os.getpid()}.tmp.npy")
+        np.save(tmp_path, vectors)
+        meta_path = os.path.join(self.directory, "meta.json")
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump({"encoder_name": encoder_name}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+        os.replace(tmp_path, self.path)
+        self._map()
+
+    def feedback_of(self, user_id, encoder_name, dim):
+        """Feedback vector of a user, None without swipes recorded in the same vector space"""
+        with self.lock:
+            self._map()
+            vectors = self.vectors
+            if vectors is None or self.encoder_name != encoder_name or vectors.shape[1] != dim or user_id >= len(vectors):
+                return None
+            row = np.array(vectors[user_id])
+        return row if row.any() else None
+
+    def offset_for(self, user_id, encoder_name, dim, weight=SWIPE_FEEDBACK_WEIGHT):
+        """
+        Weighted feedback of a user, their ranking query is their own embedding plus this offset,
+        normalized
+        Returns:
+            np.ndarray: float32 offset, None without feedback
+        """
+        if not weight:
+            return None
+        feedback = self.feedback_of(user_id, encoder_name, dim)
+        return None if feedback is None else weight * feedback
+
+    def record(self, user_id, target_vector, direction, encoder_name):
+        """
+        Move a user's feedback vector toward (right) or away from (left) a swiped profile,
+        an O(dim) in-place update of one row
+        """
+        target_vector = np.asarray(target_vector, dtype=np.float32)
+        sign = 1.0 if direction == 'right' else -self.negative_weight
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock, open(os.path.join(self.directory, FEEDBACK_LOCK_FILE), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._map()
+                vectors = self.vectors
+                if vectors is None or self.encoder_name != encoder_name or vectors.shape[1] != len(target_vector):
+                    # Feedback from another vector space cannot be carried over
+                    self._replace(np.zeros((max(INITIAL_CAPACITY, user_id + 1), len(target_vector)), dtype=np.float32), encoder_name)
+                elif user_id >= len(vectors):
+                    grown = np.zeros((max(2 * len(vectors), user_id + 1), vectors.shape[1]), dtype=np.float32)
+                    grown[:len(vectors)] = vectors
+                    self._replace(grown, encoder_name)
+
+                row = self.vectors[user_id]
+                row *= 1.0 - self.rate
+                row += (self.rate * sign) * target_vector
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_feedback_store():
+    """Get the process-wide swipe feedback store"""
+    global _feedback_store
+    if _feedback_store is None:
+        with _feedback_store_lock:
+            if _feedback_store is None:
+                _feedback_store = FeedbackStore()
+    return _feedback_store
+
+
+def record_swipe_feedback(user_id, target_user_id, direction):
+    """
+    Fold a swipe into the swiper's feedback vector.
+    Never raises: a lost update only leaves the query slightly less adapted.
+    """
+    if not SWIPE_FEEDBACK_WEIGHT:
+        return
+    try:
+        store = get_embedding_store()
+        with store.lock:
+            target_idx = store.index_of(target_user_id)
+            if target_idx is None:
+                return
+            target_vector = np.array(store.vectors[target_idx])
+            encoder_name = store.encoder_name
+        get_feedback_store().record(int(user_id), target_vector, direction, encoder_name)
+    except Exception as e:
+        logging.error(f"Error recording swipe feedback of user {user_id} on {target_user_id}: {str(e)}")
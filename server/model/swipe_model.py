@@ -1,6 +1,8 @@
 from config.config import *
 from utils.exception import CustomException
 from utils.logger import logging
+from model.recommendation_cache import invalidate_recommendations
+from model.swipe_feedback import record_swipe_feedback
 import sys
 import psycopg2
 from psycopg2.extras import DictCursor
@@ -102,6 +104,13 @@ class SwipeModel:
                     match_found = bool(match_result)
             
             self.connection.commit()
+            record_swipe_feedback(user_id, target_user_id, direction)
+
+            # The swiped user leaves the swiper's feed, a match removes each user from the other's
+            if match_found:
+                invalidate_recommendations(user_id, target_user_id)
+            else:
+                invalidate_recommendations(user_id)
             
             return {
                 "status": "success",
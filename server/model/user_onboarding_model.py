@@ -6,6 +6,8 @@ from utils.exception import CustomException
 import sys
 from flask_jwt_extended import get_jwt_identity
 import json
+from model.embedding_refresh import enqueue_embedding_refresh
+from model.recommendation_cache import invalidate_recommendations
 
 
 class UserOnboardingmodel:
@@ -56,6 +58,7 @@ class UserOnboardingmodel:
             ''', (user_id, age))
             self.connection.commit()
             logging.info("Age updated successfully")
+            invalidate_recommendations(user_id)
             return {"status": "success"}
         except Exception as e:
             logging.error(f"Error in update_age: {e}")
@@ -81,6 +84,7 @@ class UserOnboardingmodel:
             ''', (user_id, gender))
             self.connection.commit()
             logging.info("Gender updated successfully")
+            invalidate_recommendations(user_id)
             return {"status": "success"}
         except Exception as e:
             logging.error(f"Error in update_gender: {e}")
@@ -106,6 +110,8 @@ class UserOnboardingmodel:
             ''', (user_id, location))
             self.connection.commit()
             logging.info("Location updated successfully")
+            enqueue_embedding_refresh(user_id)
+            invalidate_recommendations(user_id)
             return {"status": "success"}
         except Exception as e:
             logging.error(f"Error in update_location: {e}")
@@ -131,6 +137,8 @@ class UserOnboardingmodel:
             ''', (user_id, occupation))
             self.connection.commit()
             logging.info("Occupation updated successfully")
+            enqueue_embedding_refresh(user_id)
+            invalidate_recommendations(user_id)
             return {"status": "success"}
         except Exception as e:
             logging.error(f"Error in update_occupation: {e}")
@@ -156,6 +164,8 @@ class UserOnboardingmodel:
             ''', (user_id, interests))
             self.connection.commit()
             logging.info("Interests updated successfully")
+            enqueue_embedding_refresh(user_id)
+            invalidate_recommendations(user_id)
             return {"status": "success"}
         except Exception as e:
             logging.error(f"Error in update_interests: {e}")
@@ -181,6 +191,8 @@ class UserOnboardingmodel:
                 DO UPDATE SET bio = EXCLUDED.bio
             ''', (user_id, bio))
             self.connection.commit()
+            enqueue_embedding_refresh(user_id)
+            invalidate_recommendations(user_id)
             return {"status": "success"}
         except Exception as e:
             logging.error(f"Error in update_bio: {e}")
@@ -209,6 +221,8 @@ class UserOnboardingmodel:
 
             self.connection.commit()
             logging.info("Prompts updated successfully")
+            enqueue_embedding_refresh(user_id)
+            invalidate_recommendations(user_id)
             return {"status": "success"}
         except Exception as e:
             logging.error(f"Error in add_prompt: {e}")
@@ -6,7 +6,6 @@ import os
 import sys
 from app import app
 from utils.logger import logging
-import time
 
 if __name__ == "__main__":
     # Add the server directory to the Python path to enable imports
@@ -15,17 +14,13 @@ if __name__ == "__main__":
     # Log the server startup
     logging.info("=== API Server Starting ===")
     
-    # Pre-warm the recommendation model by importing and creating an instance
-    try:
-        logging.info("Pre-warming recommendation model...")
-        start_time = time.time()
-        from model.recommendation_model import RecommendationModel
-        model = RecommendationModel()
-        elapsed_time = time.time() - start_time
-        logging.info(f"Recommendation model pre-warmed in {elapsed_time:.2f} seconds")
-    except Exception as e:
-        logging.error(f"Failed to pre-warm recommendation model: {str(e)}")
-        logging.info("API will continue to run, but first recommendation request may be slow")
+    # Load the embedding model and build the candidate columns in the background, requests
+    # served before they are ready get the degraded feed. The debug reloader runs this script
+    # twice, only its serving child needs them.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        from model.recommendation_model import start_embedding_model_loader, start_profile_sync
+        start_embedding_model_loader()
+        start_profile_sync()
     
     # Run the Flask app
     print("Starting API server on port 5000...")
@@ -0,0 +1,210 @@
+"""
+Precompute recommendation feeds offline instead of on the request path.
+Recomputes the stored feeds of every user, or only for users whose profile
+changed since a watermark, spreading the ranking over a process pool.
+
+Progress is checkpointed after every chunk: an interrupted run picks up where it
+stopped the next time it is started (pass --restart to discard the checkpoint).
+
+Examples:
+    python run_batch_recommendations.py                      # every user
+    python run_batch_recommendations.py --incremental        # changed since the last completed run
+    python run_batch_recommendations.py --since 2025-06-01T00:00:00 --workers 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import psycopg2
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Add the server directory to the Python path to enable imports
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from utils.logger import logging
+from config.config import DATA_DIR, EMBEDDING_STORE_DIR, POSTGRES_HOST, POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_PORT
+from model.embedding_store import EmbeddingStore
+from model.recommendation_model import RecommendationModel, rank_similar_users_batch, fetch_seen_user_ids, stream_profiles, stream_right_swipes
+from model.recommendation_cache import invalidate_recommendations
+from model.recommendation_jobs import purge_recommendation_jobs
+from model.candidate_store import CandidateStore
+from model.field_embeddings import open_field_stores
+from model.swipe_feedback import FeedbackStore
+
+# The run's settings and user list, written once, and the chunks written since, one number per line
+CHECKPOINT_PATH = os.path.join(DATA_DIR, "batch_recommendations.checkpoint.json")
+COMPLETED_CHUNKS_PATH = os.path.join(DATA_DIR, "batch_recommendations.completed")
+WATERMARK_PATH = os.path.join(DATA_DIR, "batch_recommendations.watermark")
+
+# Embedding stores, candidate columns and database connection opened once per worker process
+_worker_store = None
+_worker_field_stores = None
+_worker_feedback = None
+_worker_candidates = None
+_worker_connection = None
+
+
+def _init_worker(store_dir):
+    global _worker_store, _worker_field_stores, _worker_feedback, _worker_candidates, _worker_connection
+    _worker_store = EmbeddingStore(store_dir).load()
+    _worker_field_stores = open_field_stores(os.path.join(store_dir, "fields"))
+    _worker_feedback = FeedbackStore(os.path.join(store_dir, "feedback"))
+    _worker_connection = psycopg2.connect(
+        host=POSTGRES_HOST,
+        database=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        port=POSTGRES_PORT
+    )
+    _worker_candidates = CandidateStore.from_chunks(stream_profiles(_worker_connection), stream_right_swipes(_worker_connection))
+    _worker_connection.rollback()
+
+
+def _rank_chunk(chunk_no, user_ids, limit):
+    """Rank a chunk of users inside a worker process"""
+    # Swipe and match history of the whole chunk in one query
+    with _worker_connection.cursor() as cursor:
+        seen = fetch_seen_user_ids(cursor, user_ids)
+    _worker_connection.rollback()
+
+    # The chunk's queries are scored together, each worker process already owns a core
+    ranked = rank_similar_users_batch(
+        _worker_store, user_ids, limit, exclude_map=seen,
+        candidate_store=_worker_candidates, field_stores=_worker_field_stores, feedback_store=_worker_feedback
+    )
+    feeds = [(user_id, ranked[user_id][0].tolist(), ranked[user_id][1].tolist()) for user_id in user_ids if user_id in ranked]
+    return chunk_no, feeds
+
+
+def _write_atomic(path, text):
+    """Write a file atomically so a crash never leaves it empty or truncated"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _write_json(path, data):
+    _write_atomic(path, json.dumps(data))
+
+
+def load_checkpoint():
+    if not os.path.exists(CHECKPOINT_PATH):
+        return None
+    with open(CHECKPOINT_PATH) as f:
+        return json.load(f)
+
+
+def load_completed_chunks():
+    """Chunks written by the checkpointed run, a line cut short by a crash is ignored"""
+    if not os.path.exists(COMPLETED_CHUNKS_PATH):
+        return set()
+    with open(COMPLETED_CHUNKS_PATH) as f:
+        return {int(line) for line in f.read().split("\n")[:-1]}
+
+
+def mark_chunk_completed(chunk_no):
+    """Append one chunk number, O(1) per chunk however many users the run covers"""
+    with open(COMPLETED_CHUNKS_PATH, "a") as f:
+        f.write(f"{chunk_no}\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_watermark():
+    if not os.path.exists(WATERMARK_PATH):
+        return None
+    with open(WATERMARK_PATH) as f:
+        return f.read().strip() or None
+
+
+def select_users(model, store, since):
+    """Users whose feed should be recomputed: everyone with an embedding, or profiles changed since a timestamp"""
+    if since is None:
+        return store.live_user_ids().tolist()
+
+    model.cursor.execute('''
+        SELECT user_id FROM user_profile
+        WHERE updated_at > %s
+        ORDER BY user_id
+    ''', (since,))
+    changed = [row['user_id'] for row in model.cursor.fetchall()]
+    return [user_id for user_id in changed if store.index_of(user_id) is not None]
+
+
+def run(args):
+    model = RecommendationModel()
+
+    # Bring the embedding store up to date before the workers map it
+    store = model.sync_embedding_store()
+    if not len(store):
+        logging.warning("Batch recommendations: no user profiles with location or interests")
+        print("No profiles available, nothing to do")
+        return
+
+    checkpoint = None if args.restart else load_checkpoint()
+    if checkpoint:
+        # Checkpoints written before the completed chunks moved to their own file list them inline
+        completed = load_completed_chunks() | set(checkpoint.get("completed_chunks", []))
+        print(f"Resuming run started at {checkpoint['started_at']}, {len(completed)} chunks already written")
+    else:
+        model.cursor.execute("SELECT LOCALTIMESTAMP AS now")
+        started_at = model.cursor.fetchone()['now'].isoformat()
+        since = args.since or (load_watermark() if args.incremental else None)
+        checkpoint = {
+            "started_at": started_at,
+            "since": since,
+            "chunk_size": args.chunk_size,
+            "users": select_users(model, store, since)
+        }
+        completed = set()
+        _write_json(CHECKPOINT_PATH, checkpoint)
+        _write_atomic(COMPLETED_CHUNKS_PATH, "")
+
+    users = checkpoint["users"]
+    chunk_size = checkpoint["chunk_size"]
+    chunks = {chunk_no: users[start:start + chunk_size] for chunk_no, start in enumerate(range(0, len(users), chunk_size))}
+    pending = [chunk_no for chunk_no in chunks if chunk_no not in completed]
+    print(f"{len(users)} users in {len(chunks)} chunks, {len(pending)} chunks to compute with {args.workers} workers")
+    logging.info(f"Batch recommendations: {len(users)} users, {len(pending)} pending chunks, since={checkpoint['since']}")
+
+    start_time = time.time()
+    written = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(EMBEDDING_STORE_DIR,)) as pool:
+        futures = [pool.submit(_rank_chunk, chunk_no, chunks[chunk_no], model.DEFAULT_RECOMMENDATION_LIMIT) for chunk_no in pending]
+        for future in as_completed(futures):
+            chunk_no, feeds = future.result()
+            if feeds:
+                model.store_many_user_recommendations(feeds)
+                # The API would otherwise serve its cached pre-batch feeds until they expire
+                invalidate_recommendations(*[feed[0] for feed in feeds])
+            written += len(feeds)
+
+            mark_chunk_completed(chunk_no)
+            completed.add(chunk_no)
+            print(f"Chunk {chunk_no} done ({len(completed)}/{len(chunks)})")
+
+    # The run is complete: the next incremental run starts from this run's start time
+    _write_atomic(WATERMARK_PATH, checkpoint["started_at"])
+    os.remove(CHECKPOINT_PATH)
+    os.remove(COMPLETED_CHUNKS_PATH)
+    purge_recommendation_jobs(model.connection)
+
+    elapsed_time = time.time() - start_time
+    logging.info(f"Batch recommendations: wrote {written} feeds in {elapsed_time:.2f} seconds")
+    print(f"Wrote {written} feeds in {elapsed_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Users per chunk and per checkpoint")
+    parser.add_argument("--since", help="Only users whose profile changed after this timestamp (ISO format)")
+    parser.add_argument("--incremental", action="store_true", help="Only users changed since the last completed run")
+    parser.add_argument("--restart", action="store_true", help="Discard an existing checkpoint and start over")
+    args = parser.parse_args()
+
+    logging.info("=== Batch Recommendation Job Starting ===")
+    run(args)
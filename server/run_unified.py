@@ -21,17 +21,11 @@ def run_api_server():
     # Log the server startup
     logging.info("=== API Server Starting ===")
     
-    # Pre-warm the recommendation model by importing and creating an instance
-    try:
-        logging.info("Pre-warming recommendation model...")
-        start_time = time.time()
-        from model.recommendation_model import RecommendationModel
-        model = RecommendationModel()
-        elapsed_time = time.time() - start_time
-        logging.info(f"Recommendation model pre-warmed in {elapsed_time:.2f} seconds")
-    except Exception as e:
-        logging.error(f"Failed to pre-warm recommendation model: {str(e)}")
-        logging.info("API will continue to run, but first recommendation request may be slow")
+    # Load the embedding model and build the candidate columns in the background, requests
+    # served before they are ready get the degraded feed
+    from model.recommendation_model import start_embedding_model_loader, start_profile_sync
+    start_embedding_model_loader()
+    start_profile_sync()
     
     # Run the Flask app
     print(f"API server running on port 5000...")
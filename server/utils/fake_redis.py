@@ -0,0 +1,135 @@
+import time
+import threading
+
+try:
+    from redis.exceptions import ConnectionError, TimeoutError, WatchError
+except ImportError:
+    # Same names without the redis package, so callers catch one set of exceptions for both clients
+    from builtins import ConnectionError, TimeoutError
+
+    class WatchError(Exception):
+        """A watched key changed before the transaction ran"""
+
+
+def _encode(value):
+    """Values come back as bytes, the way redis.Redis returns them"""
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the part of redis.Redis the recommendation cache uses: get, set,
+    setex, delete and pipelines of them with WATCH/MULTI, and key expiry. Lives in one process,
+    so it is for tests and for running the Redis code path without a server, not for sharing
+    between workers.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        # key -> (value, expires_at or None)
+        self._values = {}
+        # key -> number of writes, what WATCH compares
+        self._writes = {}
+        self._lock = threading.RLock()
+
+    def _touch(self, key):
+        self._writes[key] = self._writes.get(key, 0) + 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._values[key]
+                self._touch(key)
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = (_encode(value), None)
+            self._touch(key)
+        return True
+
+    def setex(self, key, seconds, value):
+        with self._lock:
+            self._values[key] = (_encode(value), self._clock() + seconds)
+            self._touch(key)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            deleted = 0
+            for key in keys:
+                if self._values.pop(key, None) is not None:
+                    deleted += 1
+                    self._touch(key)
+            return deleted
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """
+    Queues commands and runs them in order on execute(), like a redis.Redis pipeline. After
+    watch() commands run at once until multi(), and execute() raises WatchError when a watched
+    key was written since it was watched.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._commands = []
+        # key -> write count when watched
+        self._watched = {}
+        self._immediate = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.reset()
+
+    def reset(self):
+        self._commands = []
+        self._watched = {}
+        self._immediate = False
+
+    def watch(self, *keys):
+        with self.client._lock:
+            for key in keys:
+                self._watched[key] = self.client._writes.get(key, 0)
+        self._immediate = True
+
+    def multi(self):
+        self._immediate = False
+
+    def _queue(self, name, *args):
+        if self._immediate:
+            return getattr(self.client, name)(*args)
+        self._commands.append((name, args))
+        return self
+
+    def get(self, key):
+        return self._queue("get", key)
+
+    def set(self, key, value):
+        return self._queue("set", key, value)
+
+    def setex(self, key, seconds, value):
+        return self._queue("setex", key, seconds, value)
+
+    def delete(self, *keys):
+        return self._queue("delete", *keys)
+
+    def execute(self):
+        commands, watched = self._commands, self._watched
+        self.reset()
+        with self.client._lock:
+            if any(self.client._writes.get(key, 0) != writes for key, writes in watched.items()):
+                raise WatchError("Watched variable changed.")
+            return [getattr(self.client, name)(*args) for name, args in commands]